@@ -10,6 +10,7 @@ Licensed under the MIT license.
 
 import torch
 import torch.nn as nn
+from torch.nn.utils.rnn import pack_padded_sequence, pad_packed_sequence
 
 
 class BRNN_MtM(nn.Module):
@@ -73,13 +74,17 @@ class BRNN_MtM(nn.Module):
         self.fc = nn.Linear(in_features=hidden_size*2,  # *2 for bidirection
                             out_features=num_classes)
 
-    def forward(self, x):
+    def forward(self, x, lengths=None):
         """Propogate input sequences through the network to produce outputs
         Parameters
         ----------
         x : 3-dimensional PyTorch IntTensor
             Input sequence to the network. Should be in the format:
             [batch_dim X sequence_length X input_size]
+        lengths : 1-dimensional PyTorch IntTensor or None
+            True length of each sequence in a zero-padded batch. If provided,
+            the batch is packed so that padding never reaches the LSTM states
+            of either direction. Outputs at padded positions should be discarded.
         Returns
         -------
         3-dimensional PyTorch FloatTensor
@@ -97,7 +102,12 @@ class BRNN_MtM(nn.Module):
 
         # Forward propagate LSTM
         # out: tensor of shape: [batch_size, seq_length, hidden_size*2]
-        out, (h_n, c_n) = self.lstm(x, (h0, c0))
+        if lengths is None:
+            out, (h_n, c_n) = self.lstm(x, (h0, c0))
+        else:
+            packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            out, (h_n, c_n) = self.lstm(packed, (h0, c0))
+            out, _ = pad_packed_sequence(out, batch_first=True, total_length=x.size(1))
 
         # Decode the hidden state for each time step
         fc_out = self.fc(out)
@@ -164,13 +174,17 @@ class BRNN_MtO(nn.Module):
         self.fc = nn.Linear(in_features=hidden_size*2,  # *2 for bidirection
                             out_features=num_classes)
 
-    def forward(self, x):
+    def forward(self, x, lengths=None):
         """Propogate input sequences through the network to produce outputs
         Parameters
         ----------
         x : 3-dimensional PyTorch IntTensor
             Input sequence to the network. Should be in the format:
             [batch_dim X sequence_length X input_size]
+        lengths : 1-dimensional PyTorch IntTensor or None
+            True length of each sequence in a zero-padded batch. If provided,
+            the batch is packed so the final states are taken at the true end
+            of each sequence rather than after the padding.
         Returns
         -------
         3-dimensional PyTorch FloatTensor
@@ -188,7 +202,11 @@ class BRNN_MtO(nn.Module):
 
         # Forward propagate LSTM
         # out: tensor of shape: [batch_size, seq_length, hidden_size*2]
-        out, (h_n, c_n) = self.lstm(x, (h0, c0))
+        if lengths is None:
+            out, (h_n, c_n) = self.lstm(x, (h0, c0))
+        else:
+            packed = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            out, (h_n, c_n) = self.lstm(packed, (h0, c0))
 
         # Retain the outputs of the last time step in the sequence for both directions
         # (i.e. output of seq[n] in forward direction, seq[0] in reverse direction)
@@ -0,0 +1,157 @@
+"""
+TorchScript compilation of the many-to-many bidirectional LSTM network used
+in PARROT, for lower per-call latency on short sequences.
+.............................................................................
+BRNN_MtM.forward is traced twice, once for a single unpadded sequence and
+once for a zero-padded batch with lengths, and the two graphs are frozen
+into one TorchScript module. The frozen module no longer dispatches through
+the Python forward() on every call.
+
+The compiled module is saved next to the .pt file (see compiled_file), with
+the checksum of the network and the torch version it was compiled with, so
+later processes load it instead of compiling again. If the directory is not
+writable the compiled module is only kept in memory. Outputs are identical
+to the eager network.
+"""
+
+import os
+import warnings
+from typing import Optional
+
+import numpy as np
+import torch
+
+from PredictDSSP import dssp_tools
+from PredictDSSP import encode_sequence
+
+# sequence lengths run through a freshly loaded module, so that the TorchScript
+# profiling executor has specialised its graphs before the first real call
+WARMUP_LENGTHS = (16, 64, 256, 1024)
+
+
+class _Compiled(torch.nn.Module):
+    """Dispatches to the graph traced for a single sequence or for a padded batch"""
+
+    def __init__(self, single, packed):
+        super().__init__()
+        self.single = single
+        self.packed = packed
+
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        if lengths is None:
+            return self.single(x)
+        return self.packed(x, lengths)
+
+
+def compiled_file(saved_weights):
+    """Location of the compiled module for a saved network
+    Parameters
+    ----------
+    saved_weights : str
+            Location of the saved PyTorch network weights
+    Returns
+    -------
+    str
+            Path of the TorchScript file, named after the network and the
+            torch version
+    """
+
+    version = torch.__version__.split('+')[0]
+    return '%s.torch-%s.ts' % (os.path.splitext(str(saved_weights))[0], version)
+
+
+def compile_network(network):
+    """Trace and freeze an eager BRNN_MtM network
+    Parameters
+    ----------
+    network : brnn_architecture.BRNN_MtM
+            The network, in evaluation mode
+    Returns
+    -------
+    torch.jit.ScriptModule
+            Frozen module with the same forward(x, lengths=None) signature
+    """
+
+    x, lengths = encode_sequence.one_hot_batch(['ACDEFGHIKLMNPQRSTVWY', 'MKVLAAGIV'])
+    x = torch.from_numpy(x)
+    lengths = torch.from_numpy(np.asarray(lengths, dtype=np.int64))
+
+    # tracing warns that shapes become constants, which is not the case for
+    # the ops in this network (checked by the test suite), and torch warns
+    # that TorchScript is deprecated
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        single = torch.jit.trace(network, (x[:1],), check_trace=False)
+        packed = torch.jit.trace(network, (x, lengths), check_trace=False)
+        module = torch.jit.freeze(torch.jit.script(_Compiled(single, packed)).eval())
+
+    return module
+
+
+def warmup(module):
+    """Run sequences of common lengths through a compiled module"""
+
+    with torch.inference_mode():
+        for length in WARMUP_LENGTHS:
+            seq = ('ACDEFGHIKLMNPQRSTVWY' * (length // 20 + 1))[:length]
+            x, lengths = encode_sequence.one_hot_batch([seq, seq[:length // 2]])
+            x = torch.from_numpy(x)
+            lengths = torch.from_numpy(np.asarray(lengths, dtype=np.int64))
+
+            # the profiling executor optimises a graph after its second run
+            for _ in range(2):
+                module(x[:1])
+                module(x, lengths)
+
+
+def load_compiled(saved_weights, network):
+    """Load the compiled module for a saved network, compiling it if needed
+    The module is read from compiled_file(saved_weights) if that file was
+    compiled from the same version of the .pt file. Otherwise the network is
+    compiled and the file is (re-)written. If the directory is not writable
+    the compiled module is only kept in memory.
+    Parameters
+    ----------
+    saved_weights : str
+            Location of the saved PyTorch network weights
+    network : brnn_architecture.BRNN_MtM
+            The eager network loaded from saved_weights
+    Returns
+    -------
+    torch.jit.ScriptModule or None
+            The warmed up compiled module, or None if the network could not
+            be compiled
+    """
+
+    filename = compiled_file(saved_weights)
+    checksum = dssp_tools.file_checksum(saved_weights)
+    module = None
+
+    if os.path.isfile(filename):
+        extra = {'source_checksum': ''}
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                loaded = torch.jit.load(filename, map_location='cpu', _extra_files=extra)
+            if extra['source_checksum'] in (checksum, checksum.encode('ascii')):
+                module = loaded
+        except (RuntimeError, OSError):
+            pass
+
+    if module is None:
+        try:
+            module = compile_network(network)
+        except Exception:
+            # TorchScript is not available for every build or network; the
+            # caller falls back to the eager network
+            return None
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                torch.jit.save(module, filename, _extra_files={'source_checksum': checksum})
+        except (RuntimeError, OSError):
+            pass
+
+    warmup(module)
+    return module
@@ -7,31 +7,68 @@
 
 
 # NOTE - any new functions must be added to this list!
-__all__ = ['predict_dssp', 'graph_dssp', 'predict_dssp_fasta', 'graph_dssp_fasta', 'predict_dssp_uniprot', 'graph_dssp_uniprot']
+__all__ = ['predict_dssp', 'graph_dssp', 'predict_dssp_fasta', 'graph_dssp_fasta', 'predict_dssp_uniprot', 'graph_dssp_uniprot',
+           'predict_dssp_batch', 'warmup', 'release', 'PredictorPool', 'BatchingPredictor', 'iter_predict_fasta',
+           'DsspStore', 'enable_prediction_cache', 'disable_prediction_cache', 'prediction_cache_stats',
+           'cache_info', 'cache_clear', 'predict_dssp_long',
+           'scan_mutations', 'sharing_report', 'precision_report', 'profile', 'autotune']
 
 
 import os
 import sys
 
-#import protfasta to read .fasta files
-import protfasta as _protfasta
+# NOTE - heavy dependencies (protfasta, getSequence, and matplotlib / metapredict /
+# alphaPredict via dssp_graph) are imported inside the functions that use them so
+# that `import PredictDSSP` and predict_dssp() do not pay for the plotting and
+# disorder stack. Run `python -m PredictDSSP.startup` to see the import costs.
 
 # stuff for predictions
 from PredictDSSP.dssp_predict import predict_dssp as _predict_dssp
+from PredictDSSP.dssp_predict import predict_dssp_batch as _predict_dssp_batch
+from PredictDSSP import dssp_predict as _dssp_predict
 from PredictDSSP import dssp_tools as _dssp_tools
+from PredictDSSP.dssp_predict import cache_info, cache_clear
 
-# stuff for graphing
-from PredictDSSP.dssp_graph import graph as _graph
-from PredictDSSP.dssp_graph import graph_values as _graph_values
+# stuff for very long sequences
+from PredictDSSP import dssp_long as _dssp_long
 
-# stuff for uniprot
-from PredictDSSP.uniprot_predictions import fetch_sequence as _fetch_sequence
-from PredictDSSP.dssp_exceptions import DsspError
+# stuff for mutational scanning
+from PredictDSSP import dssp_scan as _dssp_scan
+
+# stuff for sharing work between related sequences
+from PredictDSSP import dssp_shared as _dssp_shared
+
+# stuff for reduced precision inference
+from PredictDSSP import dssp_precision as _dssp_precision
+
+# stuff for profiling the prediction pipeline
+from PredictDSSP.dssp_profile import profile
+
+# stuff for tuning the prediction settings to this machine
+from PredictDSSP.dssp_tune import autotune
+from PredictDSSP import dssp_tune as _dssp_tune
+
+# stuff for multi-process predictions
+from PredictDSSP.dssp_pool import PredictorPool
 
-from getSequence import getseq
+# stuff for batching predictions from many threads
+from PredictDSSP.dssp_batching import BatchingPredictor
+
+# stuff for streaming FASTA files
+from PredictDSSP import dssp_stream as _dssp_stream
+
+# stuff for binary output
+from PredictDSSP import dssp_store as _dssp_store
+from PredictDSSP.dssp_store import DsspStore
+
+# stuff for the opt-in on-disk prediction cache
+from PredictDSSP.dssp_cache import enable_prediction_cache, disable_prediction_cache, prediction_cache_stats
+
+from PredictDSSP.dssp_exceptions import DsspError
 
 
-def predict_dssp(sequence, raw_vals=False):
+def predict_dssp(sequence, raw_vals=False, as_array=False, probability_dtype='float32', engine='torch',
+                 precision='fp32', compiled=False):
     '''
     Function to predict dssp scores
 
@@ -49,6 +86,36 @@ def predict_dssp(sequence, raw_vals=False):
         element [1] is the propensity to form a beta strand
         / beta sheet, and the final element [2] is the
         propensity to form a coil.
+
+    as_array : bool
+        If set to True, the categorization is returned as a
+        NumPy int8 array rather than a list. Useful for very
+        long sequences or many predictions. Default = False.
+
+    probability_dtype : str
+        Precision of the probabilities returned when raw_vals
+        is True. One of 'float16', 'float32' or 'float64'.
+        Default = 'float32'.
+
+    engine : str
+        The inference engine to run the network on. Either
+        'torch' (default) or 'numpy'. The numpy engine gives
+        the same predictions (probabilities agree to within
+        1e-5) without needing to import torch.
+
+    precision : str
+        Numerical precision of the network. 'fp32' (default),
+        'bf16' (bfloat16) or 'int8' (quantized weights). Reduced
+        precisions need the torch engine and change some
+        predictions; see precision_report().
+
+    compiled : bool
+        If set to True, the torch network runs as a compiled
+        TorchScript module, which lowers the time per call for
+        short sequences. The module is compiled once and saved
+        next to the network, so later runs load it directly.
+        Predictions are identical. If the network cannot be
+        compiled, it runs as usual. Default = False.
     '''
 
 
@@ -56,7 +123,267 @@ def predict_dssp(sequence, raw_vals=False):
     sequence = sequence.upper()
     
     # return values
-    return _predict_dssp(sequence, raw_vals=raw_vals)
+    return _predict_dssp(sequence, raw_vals=raw_vals, as_array=as_array, dtype=probability_dtype, engine=engine,
+                         precision=precision, compiled=compiled)
+
+
+def predict_dssp_batch(sequences, raw_vals=False, max_tokens=65536, as_array=False, probability_dtype='float32',
+                       engine=None, share_states=False, precision='fp32', compiled=False, report=False):
+    """
+    Function to predict dssp scores for many sequences at once. Sequences
+    are run through the network together in padded batches, which is much
+    faster than calling predict_dssp() on each sequence in turn. The
+    predicted classes are identical to those from predict_dssp().
+
+    Parameters
+    ----------
+    sequences : list of str
+        The amino acid sequences to predict.
+
+    raw_vals : bool
+        If set to True, returns the per-residue probabilities for each
+        sequence instead of the categorization. See predict_dssp().
+
+    max_tokens : int
+        Upper bound on the number of (padded) residues passed through the
+        network in one go. Larger batches are split so memory use stays
+        bounded for proteome-scale inputs. Default = 65536.
+
+    as_array : bool
+        If set to True, each categorization is returned as a NumPy int8
+        array rather than a list. Default = False.
+
+    probability_dtype : str
+        Precision of the probabilities returned when raw_vals is True.
+        One of 'float16', 'float32' or 'float64'. Default = 'float32'.
+
+    engine : str or None
+        The inference engine to run the network on. Either 'torch' or
+        'numpy'. See predict_dssp(). Default = None, which uses the engine
+        found by dssp-autotune, or 'torch' if it has not been run.
+
+    share_states : bool
+        If set to True, sequences that share a prefix or suffix (isoforms,
+        tagged constructs, truncations) compute the first network layer
+        over the shared part only once. Runs on the 'numpy' engine, and
+        the results match it to within rounding. sharing_report() shows
+        how much work this saves for a set of sequences. Default = False.
+
+    precision : str
+        Numerical precision of the network, 'fp32' (default), 'bf16' or
+        'int8'. See predict_dssp().
+
+    compiled : bool
+        Run the torch network as a compiled TorchScript module. See
+        predict_dssp(). Default = False.
+
+    report : bool
+        If set to True, also return how much first-layer work share_states
+        saved on this call. Default = False.
+
+    Returns
+    --------
+    list or tuple
+        One entry per input sequence, in input order, with the same form
+        as the output of predict_dssp(). If report is True, a tuple of
+        that list and a dictionary of the first-layer residue steps of the
+        sequences run through the network ('first_layer_steps'), how many
+        of them were shared ('shared_steps') and the fraction saved
+        ('first_layer_saved'). All are 0 without share_states.
+    """
+
+    # make all uppercase
+    sequences = [sequence.upper() for sequence in sequences]
+
+    # settings found by dssp-autotune fill in whatever was not given
+    if engine is None:
+        engine = _dssp_tune.load_profile()['engine']
+
+    # return values
+    return _predict_dssp_batch(sequences, raw_vals=raw_vals, max_tokens=max_tokens,
+                               as_array=as_array, dtype=probability_dtype, engine=engine,
+                               share_states=share_states, precision=precision, compiled=compiled,
+                               report=report)
+
+
+def predict_dssp_long(sequence, mode='exact', raw_vals=False, as_array=False, probability_dtype='float32',
+                      chunk_size=4096, window=2048, margin=256, max_memory=None, report=False, engine='torch'):
+    """
+    Function to predict dssp scores for very long sequences (titin-scale
+    proteins, concatenated constructs) with bounded memory.
+
+    Parameters
+    ----------
+    sequence : str
+        The amino acid sequence as a sting
+
+    mode : str
+        'exact' (default) runs the network a chunk of residues at a time,
+        carrying its state from one chunk to the next, which gives the same
+        result as predict_dssp(). 'window' predicts overlapping windows and
+        stitches their centres together, which is much faster but only
+        approximate.
+
+    raw_vals : bool
+        If set to True, returns the per-residue probabilities instead of the
+        categorization. See predict_dssp().
+
+    as_array : bool
+        If set to True, the categorization is returned as a NumPy int8
+        array rather than a list. Default = False.
+
+    probability_dtype : str
+        Precision of the probabilities returned when raw_vals is True.
+        One of 'float16', 'float32' or 'float64'. Default = 'float32'.
+
+    chunk_size : int
+        Residues per chunk in 'exact' mode. Default = 4096.
+
+    window : int
+        Residues kept from each window in 'window' mode. Default = 2048.
+
+    margin : int
+        Residues of context on each side of a window in 'window' mode.
+        Larger margins are slower but closer to the full prediction.
+        Default = 256.
+
+    max_memory : int
+        Upper bound on the working memory of 'exact' mode, in bytes. If
+        needed, intermediate values are kept in temporary files on disk.
+        Default = None (no bound).
+
+    report : bool
+        If set to True, also predicts the whole sequence in one go and
+        reports how far the result deviates from it. Default = False.
+
+    engine : str
+        The inference engine used in 'window' mode and for the report.
+        Either 'torch' (default) or 'numpy'.
+
+    Returns
+    --------
+    list, np.ndarray or tuple
+        The prediction, in the same form as from predict_dssp(). If report
+        is True, a tuple of the prediction and a dictionary describing the
+        run: the planned peak memory in bytes, and the largest and mean
+        absolute deviation of the probabilities and the number of residues
+        whose class differs from predicting the whole sequence at once.
+    """
+
+    # check the dtype before doing any work
+    dtype = _dssp_predict.check_probability_dtype(probability_dtype)
+
+    values, info = _dssp_long.predict_long(sequence.upper(), mode=mode, chunk_size=chunk_size, window=window,
+                                           margin=margin, max_memory=max_memory, report=report, engine=engine)
+
+    result = _dssp_predict._format(values, raw_vals, as_array, dtype)
+    if report:
+        return result, info
+    return result
+
+
+def scan_mutations(sequence, positions=None, alphabet='ACDEFGHIKLMNPQRSTVWY', max_tokens=1048576):
+    """
+    Function to predict the effect of every single amino acid substitution
+    at each position of a sequence (a deep mutational scan). This is much
+    faster than calling predict_dssp() on every variant, because the parts
+    of the network that a substitution cannot change are computed once and
+    the variants are predicted together.
+
+    Parameters
+    ----------
+    sequence : str
+        The amino acid sequence as a sting
+
+    positions : list of int
+        The positions to mutate, counting from 0. Default = None, which
+        mutates every position.
+
+    alphabet : str
+        The amino acids substituted in at each position. Default = all 20
+        standard amino acids, 'ACDEFGHIKLMNPQRSTVWY'.
+
+    max_tokens : int
+        Upper bound on the number of variants times the sequence length
+        predicted together, which bounds memory use. The default uses
+        around 200 MB.
+
+    Returns
+    --------
+    ScanResult
+        A named tuple. Its probabilities field is an array of shape
+        [positions, alphabet, 3] holding the helix / strand / coil
+        probabilities of the mutated residue in each variant, so
+        probabilities[10, alphabet.index('P')] is the prediction for
+        residue 10 when it is mutated to proline. For each variant,
+        classes_changed counts the residues anywhere in the sequence whose
+        class changes, first_changed and last_changed give the first and
+        last of them (-1 if none), and mean_abs_change is the mean absolute
+        change in probability. wild_type holds the probabilities of the
+        unmutated sequence.
+    """
+
+    return _dssp_scan.scan_mutations(sequence.upper(), positions=positions, alphabet=alphabet.upper(),
+                                     max_tokens=max_tokens)
+
+
+def sharing_report(sequences):
+    """
+    Function to report how much of the network's work predict_dssp_batch(...,
+    share_states=True) saves for a set of sequences, without predicting them.
+    Savings come from sequences sharing a prefix or a suffix, such as
+    isoforms, tagged constructs and truncations.
+
+    Parameters
+    ----------
+    sequences : list of str
+        The amino acid sequences.
+
+    Returns
+    --------
+    dict
+        'sequences' and 'residues' are the number of distinct sequences and
+        their total length. 'first_layer_steps' is the work of the first
+        network layer without sharing and 'shared_steps' the part of it that
+        is shared. 'first_layer_saved' is the fraction of first layer work
+        saved, and 'total_saved' the fraction of all the network's work
+        saved, which also counts repeated sequences.
+    """
+
+    return _dssp_shared.sharing_report([sequence.upper() for sequence in sequences])
+
+
+def precision_report(precision, sequences=None):
+    """
+    Function to measure how much running the network in reduced precision
+    changes its predictions, and how long it takes compared with full
+    precision.
+
+    Parameters
+    ----------
+    precision : str
+        The precision to measure, either 'bf16' or 'int8'.
+
+    sequences : list of str
+        The sequences to measure on. Default = None, which uses a built-in
+        set of real proteins and 200 synthetic sequences of uniform,
+        helix-rich, strand-rich and disorder-rich composition.
+
+    Returns
+    --------
+    dict
+        For each set of sequences ('real' and 'synthetic', or 'sequences'
+        if sequences were passed), a dict with the fraction of residues
+        whose class is unchanged ('label_agreement'), the same for each
+        class ('class_agreement'), the largest and mean change in any
+        probability ('max_abs_error', 'mean_abs_error') and the time taken
+        in full and in reduced precision ('fp32_seconds', 'seconds').
+    """
+
+    if sequences is not None:
+        sequences = [sequence.upper() for sequence in sequences]
+
+    return _dssp_precision.precision_report(precision, sequences=sequences)
 
 
 def graph_dssp(sequence,
@@ -66,7 +393,10 @@ def graph_dssp(sequence,
           raw_vals=False,         
           dis_threshhold = 0.3,
           DPI=150,
-          output_file=None):
+          output_file=None,
+          predictions=None,
+          disordered=None,
+          rasterize=False):
     """
     Function for graphing predicted dssp scores.
 
@@ -103,6 +433,20 @@ def graph_dssp(sequence,
         to the ``matplotlib.pyplot.savefig()`` function as the ``fname`` parameter. 
         Default = None.
 
+    predictions : list or np.ndarray
+        Precomputed predictions for the sequence, so that the network is not run again:
+        the classes from predict_dssp(), or the probabilities from predict_dssp(..., raw_vals=True)
+        if raw_vals is True. Default = None.
+
+    disordered : list or np.ndarray
+        Precomputed boolean mask of the residues to show as disordered with exclude_disorder,
+        so that metapredict and alphaPredict are not run. See 
+        PredictDSSP.dssp_graph.disorder_mask(). Default = None.
+
+    rasterize : Bool
+        Draw the bars (or lines with raw_vals) as an image inside vector output files such
+        as .pdf, which keeps files of very long proteins small. Default = False.
+
 
     Returns
     -----------
@@ -112,6 +456,10 @@ def graph_dssp(sequence,
 
     """
 
+    # stuff for graphing
+    from PredictDSSP.dssp_graph import graph as _graph
+    from PredictDSSP.dssp_graph import graph_values as _graph_values
+
     # make sure disorder threshhold okay
     _dssp_tools.valid_range(dis_threshhold, 0.0, 1.0)
 
@@ -121,13 +469,29 @@ def graph_dssp(sequence,
     if raw_vals == False:
         _graph(sequence, title=title, no_disorder_bars = no_disorder_bars,
             exclude_disorder=exclude_disorder, dis_threshhold=dis_threshhold, 
-            DPI=DPI, output_file=output_file)
+            DPI=DPI, output_file=output_file, dssp_scores=predictions, disordered=disordered,
+            rasterize=rasterize)
     else:
-        _graph_values(sequence, title=title, DPI=DPI, output_file=output_file)
+        _graph_values(sequence, title=title, DPI=DPI, output_file=output_file, probabilities=predictions,
+            rasterize=rasterize)
+
+
 
+def _tuned_fasta_settings(engine, workers, batch_size, share_states):
+    # settings found by dssp-autotune fill in whatever was not given. Shared
+    # states are computed in this process, so tuned workers are not used then
+    if engine is not None and batch_size is not None and (workers is not None or share_states):
+        return engine, workers, batch_size
 
+    tuned = _dssp_tune.load_profile()
+    if workers is None and not share_states:
+        workers = tuned['workers']
+    return (engine if engine is not None else tuned['engine'], workers,
+            batch_size if batch_size is not None else tuned['batch_size'])
 
-def predict_dssp_fasta(filepath, output_file=None, invalid_sequence_action='convert'):
+
+def predict_dssp_fasta(filepath, output_file=None, invalid_sequence_action='convert', engine=None, workers=None,
+                       output_format='csv', share_states=False, batch_size=None, report=False):
     """
     Function to read in a .fasta file from a specified filepath.
     Returns a dictionary of dssp values where the key is the 
@@ -139,10 +503,12 @@ def predict_dssp_fasta(filepath, output_file=None, invalid_sequence_action='conv
     filepath : str 
         The path to where the .fasta file is located. The filepath should end in the file name. 
         For example (on MacOS):filepath="/Users/thisUser/Desktop/folder_of_seqs/interesting_proteins.fasta"
+        gzip, bz2 and xz compressed files are read directly, and '-' reads from stdin.
 
     output_file : str
         By default, a dictionary of predicted values is returned immediately. However, you can specify 
         an output filename and path and a .csv file will be saved. This should include any file extensions.
+        Rows are written as sequences are predicted, so the whole file is never held in memory.
         Default = None.
 
     invalid_sequence_action : str
@@ -150,52 +516,142 @@ def predict_dssp_fasta(filepath, output_file=None, invalid_sequence_action='conv
         convert, which as the name implies converts via standard rules. See 
         https://protfasta.readthedocs.io/en/latest/read_fasta.html for more information.
 
+    engine : str or None
+        The inference engine to run the network on. Either 'torch' or 'numpy'. See
+        predict_dssp(). Default = None, which uses the engine found by dssp-autotune, or
+        'torch' if it has not been run.
+
+    workers : int or None
+        Number of worker processes to predict with. If set to more than 1, sequences are
+        split between a PredictorPool of that many processes. Default = None, which uses
+        the number found by dssp-autotune, or predicts in the current process if it has
+        not been run (or with share_states).
+
+    output_format : str
+        Format of output_file. Either 'csv' (default), which writes the predicted classes as
+        text, or 'store', which writes a directory holding both the classes and the per-residue
+        probabilities in binary form. Stores are much smaller and faster to load than .csv
+        files, and are read back with DsspStore(output_file).
+
+    share_states : bool
+        If set to True, sequences read together that share a prefix or suffix compute that
+        part of the network once. See predict_dssp_batch(). Cannot be combined with workers.
+        Default = False.
+
+    batch_size : int or None
+        Number of sequences read and predicted together. Default = None, which uses the
+        number found by dssp-autotune, or 256 if it has not been run.
+
+    report : bool
+        If set to True, also return how much first-layer work share_states saved over the whole
+        file. See predict_dssp_batch(). Default = False.
 
     Returns
     --------
 
-    dict or None
+    dict, None or tuple
         If output_file is set to None (as default) then this fiction returns a dictionary of sequence ID to
-        dssp score. If output_file is set to a filename then a .csv file will instead be written and 
-        no return data will be provided.
+        dssp score. If output_file is set to a filename then a .csv file (or store) will instead be written
+        and no return data will be provided. If report is True, a tuple of that return value and the
+        share_states step counts, as from predict_dssp_batch().
 
     """    
-    # Test to see if the data_file exists
-    test_data_file = os.path.abspath(filepath)
 
-    if not os.path.isfile(test_data_file):
+    if output_format not in ('csv', 'store'):
+        raise DsspError("output_format must be either 'csv' or 'store'")
+
+    # Test to see if the data_file exists
+    if filepath != '-' and not os.path.isfile(os.path.abspath(filepath)):
         raise FileNotFoundError('Datafile does not exist.')
 
-    protfasta_seqs = _protfasta.read_fasta(filepath, invalid_sequence_action = invalid_sequence_action, return_list = True)
+    engine, workers, batch_size = _tuned_fasta_settings(engine, workers, batch_size, share_states)
 
-    # dict for dssp seqs
-    dssp_dict={}
+    # stores keep the probabilities, so predict those and derive the classes when writing
+    raw_vals = output_file is not None and output_format == 'store'
 
-    # for the sequences in the protffasta_seqs list:
-    for seqs in protfasta_seqs:
+    steps = _dssp_shared.add_steps({}, {'first_layer_steps': 0, 'shared_steps': 0})
 
-        # set cur_header equal to the fasta header
-        cur_header = seqs[0]
+    predictions = _dssp_stream.iter_predict_fasta(filepath, raw_vals=raw_vals,
+                                                  invalid_sequence_action=invalid_sequence_action,
+                                                  batch_size=batch_size, engine=engine, workers=workers,
+                                                  share_states=share_states, steps=steps)
 
-        # set cur_seq equal to the sequence associated with the fasta header
-        cur_seq = seqs[1]
+    # if we did not request an output file 
+    if output_file is None:
+        result = dict(predictions)
+        if report:
+            return result, steps
+        return result
+
+    # else write to disk as we go
+    if output_format == 'store':
+        writer = _dssp_store.DsspStoreWriter(output_file)
+    else:
+        writer = _dssp_tools.CsvWriter(output_file)
 
-        # make all values for curSeq uppercase so they work with predictor
-        cur_seq = cur_seq.upper()
+    with writer:
+        for header, dssp in predictions:
+            writer.write(header, dssp)
 
-        # set cur_dssp equal to the predicted dssp values for cur_seq
-        cur_dssp = _predict_dssp(cur_seq)
+    if report:
+        return None, steps
 
-        # add to dict
-        dssp_dict[cur_header] = cur_dssp
 
-    # if we did not request an output file 
-    if output_file is None:
-        return dssp_dict
+def iter_predict_fasta(filepath, raw_vals=False, as_array=False, invalid_sequence_action='convert',
+                       batch_size=None, engine=None, workers=None, share_states=False):
+    """
+    Generator that predicts dssp scores for every sequence in a .fasta file,
+    yielding (header, dssp) pairs in file order. Sequences are read and predicted
+    in small batches, so memory use stays flat for files of any size.
 
-    # else write to disk 
-    else:
-        _dssp_tools.write_csv(dssp_dict, output_file)    
+    Parameters
+    -------------
+
+    filepath : str 
+        The path to the .fasta file. gzip, bz2 and xz compressed files are read
+        directly, and '-' reads from stdin.
+
+    raw_vals : bool
+        Yield per-residue probabilities instead of the categorization.
+        See predict_dssp().
+
+    as_array : bool
+        Yield the categorization as NumPy int8 arrays rather than lists.
+        Default = False.
+
+    invalid_sequence_action : str
+        Tells the function how to deal with sequences that lack standard amino acids. One of
+        'convert' (default), 'convert-ignore', 'remove', 'fail' or 'ignore', as in protfasta.
+
+    batch_size : int or None
+        Maximum number of sequences predicted together. Default = None, which uses the
+        number found by dssp-autotune, or 256 if it has not been run.
+
+    engine : str or None
+        The inference engine to run the network on. Either 'torch' or 'numpy'. Default =
+        None, which uses the engine found by dssp-autotune, or 'torch' if it has not been run.
+
+    workers : int or None
+        Number of worker processes to predict with. Default = None, which uses the number
+        found by dssp-autotune, or predicts in the current process if it has not been run
+        (or with share_states).
+
+    share_states : bool
+        Share the network's work between sequences in the same batch that have a common
+        prefix or suffix. See predict_dssp_batch(). Default = False.
+
+    Yields
+    --------
+    tuple
+        (header, dssp) for each sequence in the file.
+
+    """
+    engine, workers, batch_size = _tuned_fasta_settings(engine, workers, batch_size, share_states)
+
+    return _dssp_stream.iter_predict_fasta(filepath, raw_vals=raw_vals, as_array=as_array,
+                                           invalid_sequence_action=invalid_sequence_action,
+                                           batch_size=batch_size, engine=engine, workers=workers,
+                                           share_states=share_states)
 
 
 def graph_dssp_fasta(filepath,
@@ -271,6 +727,9 @@ def graph_dssp_fasta(filepath,
 
     """    
 
+    #import protfasta to read .fasta files
+    import protfasta as _protfasta
+
     # Test to see if the data_file exists
     if not os.path.isfile(filepath):
         raise FileNotFoundError('Datafile [%s] does not exist'%(filepath))
@@ -286,6 +745,10 @@ def graph_dssp_fasta(filepath,
     # use protfasta to read in fasta file
     sequences =  _protfasta.read_fasta(filepath, invalid_sequence_action = invalid_sequence_action)
 
+    # predict every sequence in one batch, so graphing never runs the network
+    predictions = dict(zip(sequences, _predict_dssp_batch([seq.upper() for seq in sequences.values()],
+                                                          as_array=True)))
+
     # now for each sequence...
     idx_counter = 0
     for idx in sequences:
@@ -313,14 +776,16 @@ def graph_dssp_fasta(filepath,
 
             # plot!        
             graph_dssp(local_sequence, title=title, exclude_disorder=exclude_disorder,
-            no_disorder_bars=no_disorder_bars, dis_threshhold=dis_threshhold, DPI=DPI, output_file=filename)
+            no_disorder_bars=no_disorder_bars, dis_threshhold=dis_threshhold, DPI=DPI, output_file=filename,
+            predictions=predictions[idx])
 
         # if no output_dir specified just graph the seq        
         else:
             # define title (including bad chars)
             title = idx[0:14]            
             graph_dssp(local_sequence, title=title, exclude_disorder=exclude_disorder,
-            no_disorder_bars=no_disorder_bars, dis_threshhold=dis_threshhold, DPI=DPI)
+            no_disorder_bars=no_disorder_bars, dis_threshhold=dis_threshhold, DPI=DPI,
+            predictions=predictions[idx])
 
 
 def predict_dssp_uniprot(uniprot_id, raw_vals=False):
@@ -344,6 +809,9 @@ def predict_dssp_uniprot(uniprot_id, raw_vals=False):
         the dssp scores for the corresponding seqeunce
     
     """
+    # stuff for uniprot
+    from getSequence import getseq
+
     # get sequence
     sequence_and_name = getseq(uniprot_id)
     sequence = sequence_and_name[1]
@@ -409,6 +877,11 @@ def graph_dssp_uniprot(uniprot_id,
 
     """
 
+    # stuff for uniprot and graphing
+    from getSequence import getseq
+    from PredictDSSP.dssp_graph import graph as _graph
+    from PredictDSSP.dssp_graph import graph_values as _graph_values
+
     # make sure disorder threshhold okay
     _dssp_tools.valid_range(dis_threshhold, 0.0, 1.0)
 
@@ -425,3 +898,52 @@ def graph_dssp_uniprot(uniprot_id,
     else:
         _graph_values(sequence, title=title, DPI=DPI, output_file=output_file)
 
+
+def warmup(network=None, engine='torch', compiled=False):
+    """
+    Function that loads the network into memory and runs a short
+    prediction through it. The loaded network is kept for the lifetime of
+    the process (or until release() is called) and is shared by every
+    prediction and graphing function, so long-running services can use
+    this to pay the load cost at startup rather than on the first request.
+
+    Parameters
+    ------------
+    network : str
+        Optional. Filename of a network in the networks directory or a path
+        to a network file. Default = None, which uses the default network.
+
+    engine : str
+        Optional. The inference engine to load, either 'torch' (default)
+        or 'numpy'.
+
+    compiled : bool
+        Optional. Load the compiled torch network used by predict_dssp(...,
+        compiled=True), compiling it if it is not saved yet. Default = False.
+
+    Returns
+    ----------
+    None
+
+    """
+    _dssp_predict.warmup(network, engine=engine, compiled=compiled)
+
+
+def release(network=None):
+    """
+    Function that releases loaded networks so their memory can be
+    reclaimed. The next prediction will load the network again.
+
+    Parameters
+    ------------
+    network : str
+        Optional. Network to release. Default = None, which releases all
+        loaded networks.
+
+    Returns
+    ----------
+    int
+        The number of networks that were released.
+
+    """
+    return _dssp_predict.release(network)
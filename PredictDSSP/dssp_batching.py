@@ -0,0 +1,323 @@
+"""
+In-process request batching for multi-threaded callers.
+
+When many threads call predict_dssp() at once, each runs its own forward
+pass of one sequence and they all compete for torch's intra-op threads.
+BatchingPredictor instead takes sequences from any number of threads with
+submit(), which returns a concurrent.futures.Future straight away. A single
+background thread collects whatever has been submitted into a batch (up to
+max_batch_size sequences, waiting at most max_wait_ms for more to arrive),
+predicts it with autograd disabled, and resolves the futures in the order
+they were submitted.
+
+Each batch is sorted by length and cut into buckets of similar lengths (the
+longest at most MAX_PADDING longer than the shortest, and within
+max_tokens padded residues). A bucket is run as one packed forward pass
+once it holds MIN_PACKED_BUCKET sequences, both set per engine. Smaller
+buckets are run one sequence at a time, apart from sequences of equal
+length, which always run together without padding.
+"""
+
+import time
+import queue
+import threading
+import concurrent.futures
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import encode_sequence
+from PredictDSSP import py_predictor_v2
+from PredictDSSP.dssp_exceptions import DsspError
+
+# a batch is run once it holds this many sequences...
+DEFAULT_MAX_BATCH_SIZE = 64
+
+# ...or this long after its first sequence was submitted. Sequences that
+# arrive while a batch is running always join the next one, so waiting only
+# pays off when callers submit in bursts
+DEFAULT_MAX_WAIT_MS = 0.0
+
+# submitted sequences waiting for a batch before submit() blocks
+DEFAULT_MAX_QUEUE = 4096
+
+# for each engine, how much longer than its shortest sequence the longest
+# sequence of a bucket may be, as a fraction...
+MAX_PADDING = {'torch': 0.25, 'numpy': 1.0}
+
+# ...and the fewest sequences of different lengths worth running as one
+# packed pass rather than one at a time. Packing is cheap on the numpy
+# engine, but on torch a bucket only beats single passes from about 24
+MIN_PACKED_BUCKET = {'torch': 24, 'numpy': 2}
+
+# put on the queue by close() to stop the background thread
+_STOP = object()
+
+
+def length_buckets(lengths, max_padding=0.25, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS):
+    """
+    Function that groups sequences into buckets of similar length.
+
+    Parameters
+    ----------
+    lengths : list of int
+        Length of each sequence.
+
+    max_padding : float
+        Largest fraction by which the longest sequence of a bucket may
+        exceed its shortest. Default = 0.25.
+
+    max_tokens : int
+        Largest number of padded residues (sequences X longest) in a bucket.
+
+    Returns
+    -------
+    list of list of int
+        Indices into lengths, shortest bucket first. Every index appears
+        once.
+    """
+    buckets = []
+    current = []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        if current and (lengths[i] > lengths[current[0]] * (1 + max_padding)
+                        or (len(current) + 1) * lengths[i] > max_tokens):
+            buckets.append(current)
+            current = []
+        current.append(i)
+
+    if current:
+        buckets.append(current)
+    return buckets
+
+
+class BatchingPredictor():
+    """
+    A thread-safe predictor that coalesces sequences submitted from many
+    threads into batches run by one background thread.
+
+    Usage:
+
+    >>> with BatchingPredictor() as predictor:
+    ...     future = predictor.submit('MKVLAAGIVG')
+    ...     classes = future.result()
+
+    Attributes
+    ----------
+    max_batch_size : int
+        Maximum number of sequences predicted together.
+    max_wait_ms : float
+        Longest time the background thread waits for more sequences after
+        the first one of a batch.
+    batches : int
+        Number of batches run so far.
+    sequences : int
+        Number of sequences predicted so far.
+    """
+
+    def __init__(self, network=None, engine='torch', max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE,
+                 max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS, precision='fp32', compiled=False):
+        """
+        Parameters
+        ----------
+        network : str or None
+            Network to use. See dssp_predict.network_path().
+
+        engine : str
+            Inference engine, either 'torch' (default) or 'numpy'.
+
+        max_batch_size : int
+            Maximum number of sequences per batch. Default = 64.
+
+        max_wait_ms : float
+            Longest time to wait for more sequences once a batch has been
+            started. Default = 0, which batches whatever was submitted
+            while the previous batch ran.
+
+        max_queue : int
+            Maximum number of sequences waiting for a batch. When reached,
+            submit() blocks until there is room. Default = 4096.
+
+        max_tokens : int
+            Maximum number of padded residues per forward pass.
+
+        precision : str
+            Numerical precision, 'fp32' (default), 'bf16' or 'int8'.
+
+        compiled : bool
+            Run the torch network as a compiled TorchScript module.
+        """
+        if max_batch_size < 1 or max_queue < 1 or max_wait_ms < 0:
+            raise DsspError('max_batch_size and max_queue must be at least 1 and max_wait_ms at least 0')
+
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = float(max_wait_ms)
+        self.max_tokens = max_tokens
+        self.batches = 0
+        self.sequences = 0
+
+        self._network = network
+
+        # loaded here so the first batch does not pay for it, and so a bad
+        # network or option fails in the caller's thread
+        self._predictor = dssp_predict.get_predictor(network, engine=engine, precision=precision,
+                                                     compiled=compiled)
+        self._max_padding = MAX_PADDING[self._predictor.engine]
+        self._min_packed = MIN_PACKED_BUCKET[self._predictor.engine]
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='dssp-batching', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def submit(self, sequence, raw_vals=False, as_array=False, dtype=np.float32):
+        """
+        Queue a sequence for prediction. Safe to call from any thread.
+
+        Parameters
+        ----------
+        sequence : str
+            Amino acid sequence.
+
+        raw_vals, as_array, dtype
+            Form of the result, as for predict_dssp().
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future that resolves to the prediction, as from predict_dssp().
+        """
+        dtype = dssp_predict.check_probability_dtype(dtype)
+        sequence = sequence.upper()
+
+        # an invalid or empty sequence would fail the whole batch it ends up in
+        if len(sequence) == 0:
+            raise DsspError('Cannot predict an empty sequence')
+        try:
+            encode_sequence.sequence_to_index(sequence)
+        except ValueError as e:
+            raise DsspError(str(e))
+
+        future = concurrent.futures.Future()
+
+        # holding the lock means close() cannot slip in between the check and the put
+        with self._lock:
+            if self._closed:
+                raise DsspError('BatchingPredictor has been closed')
+            self._queue.put((sequence, (raw_vals, as_array, dtype), future))
+
+        return future
+
+    def predict(self, sequences, raw_vals=False, as_array=False, dtype=np.float32):
+        """
+        Predict several sequences, batched together with any other
+        submitted sequences.
+
+        Parameters
+        ----------
+        sequences : iterable of str
+            Amino acid sequences.
+
+        raw_vals, as_array, dtype
+            Form of the results, as for predict_dssp().
+
+        Returns
+        -------
+        list
+            One prediction per sequence, in input order.
+        """
+        futures = [self.submit(seq, raw_vals=raw_vals, as_array=as_array, dtype=dtype) for seq in sequences]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Predict everything already submitted, then stop the background thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        # the first item waits as long as it takes; the rest of the batch is
+        # whatever arrives within max_wait_ms of it
+        batch = [self._queue.get()]
+        if batch[0] is _STOP:
+            return batch
+
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            batch.append(item)
+            if item is _STOP:
+                break
+
+        return batch
+
+    def _predict(self, sequences):
+        # buckets of similar length run as one packed pass once they are big
+        # enough; otherwise only sequences of equal length, which batch
+        # without padding, run together
+        groups = []
+        lengths = [len(seq) for seq in sequences]
+        for bucket in length_buckets(lengths, max_padding=self._max_padding, max_tokens=self.max_tokens):
+            if len(bucket) >= self._min_packed:
+                groups.append(bucket)
+                continue
+
+            by_length = {}
+            for i in bucket:
+                by_length.setdefault(len(sequences[i]), []).append(i)
+            groups.extend(by_length.values())
+
+        values = [None] * len(sequences)
+        for group in groups:
+            predicted = dssp_predict._predict_values(self._predictor, [sequences[i] for i in group],
+                                                     max_tokens=self.max_tokens, network=self._network)
+            for i, value in zip(group, predicted):
+                values[i] = value
+        return values
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+
+            # drop sequences whose caller has already given up on them
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+
+            if batch:
+                try:
+                    values = self._predict([item[0] for item in batch])
+                except Exception as e:
+                    for _, _, future in batch:
+                        future.set_exception(e)
+                else:
+                    self.batches += 1
+                    self.sequences += len(batch)
+
+                    # resolved in submission order
+                    for (_, (raw_vals, as_array, dtype), future), value in zip(batch, values):
+                        future.set_result(dssp_predict._format(value, raw_vals, as_array, dtype))
+
+            if stop:
+                return
@@ -0,0 +1,410 @@
+"""
+Reproducible throughput and latency benchmarks.
+
+Every benchmark runs offline on synthetic proteomes: sequences drawn with
+a fixed seed from a log-normal length distribution and the UniProtKB/Swiss-Prot
+amino acid composition, so two runs with the same seed predict exactly the same
+sequences. The in-memory memo and the on-disk cache are turned off while
+benchmarking, so every prediction runs the network.
+
+run_benchmarks() measures
+
+    load            loading the network
+    one_hot         one-hot encoding, by sequence length
+    latency         predict_dssp() on one sequence (p50 and p99), by length
+    throughput      predict_dssp_batch() residues per second, by batch size
+    fasta           predict_dssp_fasta() from a FASTA file to a CSV file
+    graph           graph_dssp() rendered to a PNG file
+
+and returns the results as a dict that can be saved as JSON. compare()
+checks a run against a saved baseline and flags every metric that is worse
+by more than a threshold.
+"""
+
+import os
+import json
+import time
+import random
+import platform
+import tempfile
+import contextlib
+
+import numpy as np
+
+from PredictDSSP import dssp_cache
+from PredictDSSP import dssp_predict
+from PredictDSSP import encode_sequence
+from PredictDSSP.dssp_pool import available_cpus
+from PredictDSSP.dssp_exceptions import DsspError
+
+# identifies the layout of the results, bumped on incompatible changes
+RESULTS_VERSION = 1
+
+# amino acid frequencies of UniProtKB/Swiss-Prot, in percent
+UNIPROT_COMPOSITION = {'A': 8.25, 'R': 5.53, 'N': 4.06, 'D': 5.45, 'C': 1.37, 'Q': 3.93, 'E': 6.75, 'G': 7.07,
+                       'H': 2.27, 'I': 5.96, 'L': 9.66, 'K': 5.84, 'M': 2.42, 'F': 3.86, 'P': 4.70, 'S': 6.56,
+                       'T': 5.34, 'W': 1.08, 'Y': 2.92, 'V': 6.87}
+
+# parameters of the log-normal protein length distribution, which gives a
+# median of about 300 residues and a long tail of large proteins
+LENGTH_MU = 5.7
+LENGTH_SIGMA = 0.7
+MIN_LENGTH = 30
+MAX_LENGTH = 5000
+
+# sequence lengths for the per-length benchmarks, and batch sizes for the
+# throughput benchmark
+LENGTHS = (50, 300, 1000)
+BATCH_SIZES = (1, 16, 64, 256)
+
+# a metric is a regression when it is this much worse than the baseline
+DEFAULT_THRESHOLD = 0.25
+
+# sizes of a full run and of a quick (--quick) run
+FULL = {'repeats': 3, 'latency_calls': 200, 'encode_calls': 200, 'throughput_sequences': 512,
+        'fasta_sequences': 1000}
+QUICK = {'repeats': 1, 'latency_calls': 30, 'encode_calls': 50, 'throughput_sequences': 128,
+         'fasta_sequences': 100}
+
+
+def synthetic_proteome(count, seed=0, length=None):
+    """
+    Function that generates a reproducible synthetic proteome.
+
+    Parameters
+    ----------
+    count : int
+        Number of sequences.
+
+    seed : int
+        Random seed. Default = 0.
+
+    length : int or None
+        Length of every sequence. Default = None, which draws the lengths
+        from a log-normal distribution resembling real proteomes.
+
+    Returns
+    -------
+    list of str
+        The sequences, each starting with a methionine.
+    """
+    rng = random.Random(seed)
+    residues = list(UNIPROT_COMPOSITION)
+    weights = list(UNIPROT_COMPOSITION.values())
+
+    sequences = []
+    for _ in range(count):
+        if length is None:
+            n = int(round(rng.lognormvariate(LENGTH_MU, LENGTH_SIGMA)))
+            n = min(max(n, MIN_LENGTH), MAX_LENGTH)
+        else:
+            n = length
+        sequences.append('M' + ''.join(rng.choices(residues, weights, k=n - 1)))
+    return sequences
+
+
+@contextlib.contextmanager
+def uncached():
+    """
+    Context manager that turns off the in-memory memo and the on-disk cache,
+    so every prediction runs the network, and restores them afterwards.
+    """
+    memo_size = dssp_predict.cache_info().max_residues
+    cache = dssp_cache.active_cache()
+    dssp_predict.set_cache_size(0)
+    if cache is not None:
+        dssp_cache.disable_prediction_cache()
+
+    try:
+        yield
+    finally:
+        dssp_predict.set_cache_size(memo_size)
+        if cache is not None:
+            dssp_cache.enable_prediction_cache(cache.path, max_bytes=cache.max_bytes)
+
+
+def _metric(value, unit, better):
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def _median_seconds(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def bench_load(sizes):
+    """Seconds to load the network, once torch has been imported"""
+    dssp_predict.get_predictor()
+
+    def load():
+        dssp_predict.release()
+        dssp_predict.get_predictor()
+
+    return {'load.seconds': _metric(_median_seconds(load, sizes['repeats']), 's', 'lower')}
+
+
+def bench_one_hot(sizes, seed=0):
+    """One-hot encoding speed for each sequence length"""
+    metrics = {}
+    for length in LENGTHS:
+        sequences = synthetic_proteome(sizes['encode_calls'], seed=seed, length=length)
+
+        def encode():
+            for seq in sequences:
+                encode_sequence.one_hot(seq)
+
+        seconds = _median_seconds(encode, sizes['repeats'])
+        metrics['one_hot.%i.residues_per_second' % length] = _metric(length * len(sequences) / seconds,
+                                                                     'residues/s', 'higher')
+    return metrics
+
+
+def bench_latency(sizes, seed=0):
+    """p50 and p99 latency of predict_dssp() for each sequence length"""
+    from PredictDSSP import dssp
+
+    metrics = {}
+    for length in LENGTHS:
+        sequences = synthetic_proteome(sizes['latency_calls'], seed=seed, length=length)
+        for seq in sequences[:10]:
+            dssp.predict_dssp(seq)
+
+        times = []
+        for seq in sequences:
+            start = time.perf_counter()
+            dssp.predict_dssp(seq)
+            times.append(time.perf_counter() - start)
+
+        metrics['latency.%i.p50_ms' % length] = _metric(1000 * np.percentile(times, 50), 'ms', 'lower')
+        metrics['latency.%i.p99_ms' % length] = _metric(1000 * np.percentile(times, 99), 'ms', 'lower')
+    return metrics
+
+
+def bench_throughput(sizes, seed=0):
+    """Residues per second of predict_dssp_batch() for each batch size"""
+    from PredictDSSP import dssp
+
+    sequences = synthetic_proteome(sizes['throughput_sequences'], seed=seed)
+    residues = sum(len(seq) for seq in sequences)
+
+    metrics = {}
+    for batch_size in BATCH_SIZES:
+        def predict():
+            for start in range(0, len(sequences), batch_size):
+                dssp.predict_dssp_batch(sequences[start:start + batch_size])
+
+        seconds = _median_seconds(predict, sizes['repeats'])
+        metrics['throughput.batch_%i.residues_per_second' % batch_size] = _metric(residues / seconds,
+                                                                                  'residues/s', 'higher')
+    return metrics
+
+
+def bench_fasta(sizes, seed=0):
+    """End-to-end predict_dssp_fasta() from a FASTA file to a CSV file"""
+    from PredictDSSP import dssp
+
+    sequences = synthetic_proteome(sizes['fasta_sequences'], seed=seed)
+    residues = sum(len(seq) for seq in sequences)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fasta = os.path.join(tmpdir, 'proteome.fasta')
+        with open(fasta, 'w') as fh:
+            for i, seq in enumerate(sequences):
+                fh.write('>synthetic_%i\n%s\n' % (i, seq))
+
+        seconds = _median_seconds(lambda: dssp.predict_dssp_fasta(fasta, output_file=os.path.join(tmpdir, 'out.csv')),
+                                  sizes['repeats'])
+
+    return {'fasta.seconds': _metric(seconds, 's', 'lower'),
+            'fasta.residues_per_second': _metric(residues / seconds, 'residues/s', 'higher')}
+
+
+def bench_graph(sizes, seed=0):
+    """Seconds to render graph_dssp() for a 300 residue sequence to a PNG file"""
+    import matplotlib
+    matplotlib.use('Agg')
+    from PredictDSSP import dssp
+
+    sequence = synthetic_proteome(1, seed=seed, length=300)[0]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_file = os.path.join(tmpdir, 'graph.png')
+
+        # the first call loads matplotlib and the disorder predictor
+        dssp.graph_dssp(sequence, output_file=output_file)
+        seconds = _median_seconds(lambda: dssp.graph_dssp(sequence, output_file=output_file), sizes['repeats'])
+
+    return {'graph.seconds': _metric(seconds, 's', 'lower')}
+
+
+# every benchmark, in the order they run
+BENCHMARKS = ('load', 'one_hot', 'latency', 'throughput', 'fasta', 'graph')
+
+
+def environment():
+    """
+    Returns
+    -------
+    dict
+        Versions and hardware the benchmarks ran on, stored with the results
+        so that runs on different machines are not mistaken for regressions.
+    """
+    import torch
+    from PredictDSSP import __version__
+
+    return {'PredictDSSP': __version__,
+            'torch': torch.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': available_cpus(),
+            'torch_threads': torch.get_num_threads()}
+
+
+def run_benchmarks(benchmarks=BENCHMARKS, quick=False, seed=0, log=None):
+    """
+    Function that runs the benchmarks.
+
+    Parameters
+    ----------
+    benchmarks : iterable of str
+        Benchmarks to run, from BENCHMARKS. Default = all of them.
+
+    quick : bool
+        Run fewer and smaller repeats, for a quick check. Default = False.
+
+    seed : int
+        Random seed of the synthetic proteomes. Default = 0.
+
+    log : file or None
+        Where to report progress. Default = None, no progress.
+
+    Returns
+    -------
+    dict
+        'version', 'seed', 'quick', 'environment' and 'metrics', where each
+        metric has a 'value', a 'unit', and whether 'lower' or 'higher' is
+        'better'.
+    """
+    sizes = QUICK if quick else FULL
+    runners = {'load': lambda: bench_load(sizes),
+               'one_hot': lambda: bench_one_hot(sizes, seed=seed),
+               'latency': lambda: bench_latency(sizes, seed=seed),
+               'throughput': lambda: bench_throughput(sizes, seed=seed),
+               'fasta': lambda: bench_fasta(sizes, seed=seed),
+               'graph': lambda: bench_graph(sizes, seed=seed)}
+
+    for name in benchmarks:
+        if name not in runners:
+            raise DsspError('Unknown benchmark %s, expected one of %s' % (name, ', '.join(BENCHMARKS)))
+
+    metrics = {}
+    with uncached():
+        for name in benchmarks:
+            if log is not None:
+                print('running %s benchmark' % (name), file=log, flush=True)
+            metrics.update(runners[name]())
+
+    return {'version': RESULTS_VERSION, 'seed': seed, 'quick': quick, 'environment': environment(),
+            'metrics': metrics}
+
+
+def save_results(results, path):
+    """Write benchmark results to a JSON file"""
+    with open(path, 'w') as fh:
+        json.dump(results, fh, indent=2)
+        fh.write('\n')
+
+
+def load_results(path):
+    """Read benchmark results written by save_results()"""
+    try:
+        with open(path) as fh:
+            results = json.load(fh)
+    except (OSError, ValueError) as e:
+        raise DsspError('Unable to read benchmark results from %s: %s' % (path, e))
+
+    if results.get('version') != RESULTS_VERSION:
+        raise DsspError('%s holds benchmark results of an unsupported version' % (path))
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Function that compares benchmark results with a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results from run_benchmarks().
+
+    baseline : dict
+        Earlier results to compare with.
+
+    threshold : float
+        Fraction by which a metric may be worse than the baseline before it
+        counts as a regression. Default = 0.25.
+
+    Returns
+    -------
+    list of dict
+        For each metric in both, its 'metric' name, 'baseline' and 'value',
+        the relative 'change' (positive is better) and whether it is a
+        'regression'.
+    """
+    rows = []
+    for name, metric in results['metrics'].items():
+        if name not in baseline['metrics']:
+            continue
+
+        before = baseline['metrics'][name]['value']
+        value = metric['value']
+        if before == 0:
+            change = 0.0
+        elif metric['better'] == 'lower':
+            change = (before - value) / before
+        else:
+            change = (value - before) / before
+
+        rows.append({'metric': name, 'baseline': before, 'value': value, 'change': change,
+                     'regression': change < -threshold})
+    return rows
+
+
+def format_results(results, comparison=None):
+    """
+    Returns
+    -------
+    str
+        A table of the metrics, with the baseline and change for each when
+        a comparison from compare() is given.
+    """
+    rows = {row['metric']: row for row in comparison or []}
+
+    lines = []
+    for name, metric in results['metrics'].items():
+        line = '%-42s %14.4g %-10s' % (name, metric['value'], metric['unit'])
+        if name in rows:
+            row = rows[name]
+            line += ' baseline %12.4g %+7.1f%%%s' % (row['baseline'], 100 * row['change'],
+                                                     '  REGRESSION' if row['regression'] else '')
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def environment_differences(results, baseline):
+    """
+    Returns
+    -------
+    list of str
+        The environment entries that differ between two runs.
+    """
+    before = baseline.get('environment', {})
+    return ['%s: %s -> %s' % (key, before.get(key), value)
+            for key, value in results['environment'].items() if before.get(key) != value]
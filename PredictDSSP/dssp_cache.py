@@ -0,0 +1,415 @@
+"""
+Opt-in, on-disk cache of DSSP predictions.
+
+Predicted class probabilities are stored in a SQLite database, keyed by the
+sha256 of the sequence together with the checksum of the network that made
+the prediction, so a retrained or replaced network never returns stale
+results. Values are zlib-compressed float32 arrays. When the cache grows
+beyond its size limit the least recently used entries are evicted.
+
+The database runs in WAL mode, so any number of processes (and threads)
+can read and write the same cache at once. Connections are never shared
+across a fork; a forked child opens its own.
+
+The cache is off by default. Turn it on with enable_prediction_cache(), or
+by pointing the PREDICTDSSP_CACHE environment variable at a cache file.
+"""
+
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+from PredictDSSP.dssp_exceptions import DsspError
+
+# environment variable that enables the cache without code changes
+CACHE_ENV_VAR = 'PREDICTDSSP_CACHE'
+
+# default size limit of the cache, in bytes of compressed data
+DEFAULT_MAX_BYTES = 1 << 30
+
+# evict down to this fraction of max_bytes, so eviction does not run on every write
+EVICT_TO = 0.9
+
+# number of DSSP classes stored per residue
+NUM_CLASSES = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    length INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used);
+
+-- running total of the stored bytes, kept up to date by the triggers so a
+-- write never has to sum the whole table. Filled in once for older caches
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO usage (id, bytes)
+    SELECT 0, COALESCE(SUM(size), 0) FROM predictions WHERE NOT EXISTS (SELECT 1 FROM usage);
+
+-- INSERT OR REPLACE does not fire delete triggers, so the size of a
+-- replaced entry is taken off before the insert
+CREATE TRIGGER IF NOT EXISTS usage_replace BEFORE INSERT ON predictions BEGIN
+    UPDATE usage SET bytes = bytes - COALESCE((SELECT size FROM predictions WHERE key = NEW.key), 0);
+END;
+CREATE TRIGGER IF NOT EXISTS usage_insert AFTER INSERT ON predictions BEGIN
+    UPDATE usage SET bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS usage_delete AFTER DELETE ON predictions BEGIN
+    UPDATE usage SET bytes = bytes - OLD.size;
+END;
+"""
+
+# the active cache (or None), and whether it was turned off explicitly
+_LOCK = threading.Lock()
+_CACHE = None
+_DISABLED = False
+
+
+def default_cache_path():
+    """
+    Function that returns the default location of the cache file, inside
+    $XDG_CACHE_HOME (or ~/.cache).
+
+    Returns
+    -------
+    str
+        Path to the cache database.
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'PredictDSSP', 'predictions.sqlite')
+
+
+def sequence_key(sequence, network_checksum):
+    """
+    Function that returns the cache key of a sequence predicted by a network.
+
+    Parameters
+    ----------
+    sequence : str
+        Amino acid sequence.
+
+    network_checksum : str
+        Checksum of the network file.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the prediction.
+    """
+    sha = hashlib.sha256(sequence.encode('ascii', errors='replace'))
+    sha.update(b'|')
+    sha.update(network_checksum.encode('ascii'))
+    return sha.hexdigest()
+
+
+class PredictionCache():
+    """
+    An on-disk cache of predicted class probabilities with a size limit and
+    least-recently-used eviction.
+
+    Attributes
+    ----------
+    path : str
+        Location of the SQLite database.
+    max_bytes : int
+        Size limit of the cached (compressed) data in bytes.
+    hits : int
+        Number of lookups answered from the cache by this process.
+    misses : int
+        Number of lookups that had to be predicted by this process.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Parameters
+        ----------
+        path : str or None
+            Location of the cache database. Created if it does not exist.
+            Default = None, which uses default_cache_path().
+
+        max_bytes : int
+            Size limit of the cache in bytes. Default = 1 GiB.
+        """
+        if path is None:
+            path = default_cache_path()
+        if max_bytes <= 0:
+            raise DsspError('max_bytes must be positive')
+
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            raise DsspError('Unable to create cache directory %s' % (directory))
+
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+        # fail early if the database cannot be opened
+        self._connect()
+
+    def _connect(self):
+        # one connection per process, reopened after a fork
+        if self._connection is None or self._pid != os.getpid():
+            try:
+                connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False,
+                                             isolation_level=None)
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                connection.executescript(_SCHEMA)
+            except sqlite3.Error as e:
+                raise DsspError('Unable to open prediction cache %s: %s' % (self.path, str(e)))
+
+            self._connection = connection
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def close(self):
+        """Close this process's connection to the database"""
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def get_many(self, sequences, network_checksum):
+        """
+        Look up the predictions for several sequences.
+
+        Parameters
+        ----------
+        sequences : list of str
+            Amino acid sequences.
+
+        network_checksum : str
+            Checksum of the network the predictions must come from.
+
+        Returns
+        -------
+        list
+            For each sequence, the float32 [length X 3] probabilities, or
+            None if the sequence is not in the cache.
+        """
+        keys = [sequence_key(seq, network_checksum) for seq in sequences]
+        found = {}
+
+        with self._lock:
+            connection = self._connect()
+
+            # stay well below SQLite's limit on query parameters
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                query = 'SELECT key, length, data FROM predictions WHERE key IN (%s)' % (','.join('?' * len(chunk)))
+                for key, length, data in connection.execute(query, chunk):
+                    found[key] = (length, data)
+
+            # touch the entries that were found so eviction sees them as recently used
+            if found:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    now = time.time()
+                    connection.executemany('UPDATE predictions SET last_used = ? WHERE key = ?',
+                                           [(now, key) for key in found])
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+
+            results = []
+            for key in keys:
+                entry = found.get(key)
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    length, data = entry
+                    values = np.frombuffer(zlib.decompress(data), dtype='<f4').reshape(length, NUM_CLASSES)
+                    results.append(values.copy())
+
+        return results
+
+    def put_many(self, sequences, values, network_checksum):
+        """
+        Store the predictions for several sequences, evicting the least
+        recently used entries if the cache grows beyond max_bytes.
+
+        Parameters
+        ----------
+        sequences : list of str
+            Amino acid sequences.
+
+        values : list of np.ndarray
+            [length X 3] class probabilities for each sequence.
+
+        network_checksum : str
+            Checksum of the network that made the predictions.
+        """
+        now = time.time()
+        rows = []
+        for seq, value in zip(sequences, values):
+            data = zlib.compress(np.ascontiguousarray(value, dtype='<f4').tobytes())
+            rows.append((sequence_key(seq, network_checksum), len(value), data, len(data), now))
+
+        if not rows:
+            return
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany('INSERT OR REPLACE INTO predictions (key, length, data, size, last_used) '
+                                       'VALUES (?, ?, ?, ?, ?)', rows)
+                self._evict(connection)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def _evict(self, connection):
+        # called inside a write transaction. The running total is shared by
+        # every process using the cache, so it is exact
+        total = connection.execute('SELECT bytes FROM usage').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - int(self.max_bytes * EVICT_TO)
+        cursor = connection.execute('SELECT key, size FROM predictions ORDER BY last_used')
+        doomed = []
+        for key, size in cursor:
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+
+        connection.executemany('DELETE FROM predictions WHERE key = ?', doomed)
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        with self._lock:
+            self._connect().execute('DELETE FROM predictions')
+
+    def stats(self):
+        """
+        Returns
+        -------
+        dict
+            Dictionary with the cache 'path', 'max_bytes', number of
+            'entries', 'bytes' used, and this process's 'hits', 'misses'
+            and 'hit_rate'.
+        """
+        with self._lock:
+            connection = self._connect()
+            entries = connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            used = connection.execute('SELECT bytes FROM usage').fetchone()[0]
+
+            lookups = self.hits + self.misses
+            return {'path': self.path,
+                    'max_bytes': self.max_bytes,
+                    'entries': entries,
+                    'bytes': used,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def enable_prediction_cache(path=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Function that turns on the prediction cache for this process.
+
+    Parameters
+    ----------
+    path : str or None
+        Location of the cache database. Default = None, which uses
+        default_cache_path().
+
+    max_bytes : int
+        Size limit of the cache in bytes. Default = 1 GiB.
+
+    Returns
+    -------
+    PredictionCache
+        The active cache.
+    """
+    global _CACHE, _DISABLED
+
+    cache = PredictionCache(path, max_bytes=max_bytes)
+    with _LOCK:
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = cache
+        _DISABLED = False
+    return cache
+
+
+def disable_prediction_cache():
+    """
+    Function that turns off the prediction cache for this process,
+    including a cache enabled through the PREDICTDSSP_CACHE environment
+    variable. Cached entries are kept on disk.
+    """
+    global _CACHE, _DISABLED
+
+    with _LOCK:
+        if _CACHE is not None:
+            _CACHE.close()
+        _CACHE = None
+        _DISABLED = True
+
+
+def active_cache():
+    """
+    Function that returns the active cache, opening the one named by the
+    PREDICTDSSP_CACHE environment variable on first use.
+
+    Returns
+    -------
+    PredictionCache or None
+        The active cache, or None if caching is off.
+    """
+    global _CACHE
+
+    if _CACHE is not None or _DISABLED:
+        return _CACHE
+
+    path = os.environ.get(CACHE_ENV_VAR)
+    if not path:
+        return None
+
+    with _LOCK:
+        if _CACHE is None and not _DISABLED:
+            _CACHE = PredictionCache(path)
+    return _CACHE
+
+
+def prediction_cache_stats():
+    """
+    Function that reports the usage of the active cache.
+
+    Returns
+    -------
+    dict or None
+        See PredictionCache.stats(), or None if caching is off.
+    """
+    cache = active_cache()
+    if cache is None:
+        return None
+    return cache.stats()
@@ -0,0 +1,311 @@
+"""
+Numerical equivalence of the fast inference paths.
+
+A frozen set of sequences is shipped with the package together with their
+class probabilities from the reference path, Predictor.predict() on the
+eager torch network in full precision. The set covers the edge lengths 1
+and 2, every residue on its own and all 20 together, low-complexity
+regions, well studied proteins, a synthetic proteome and sequences longer
+than the chunks of the long-sequence mode.
+
+Every other inference path (batched, NumPy, compiled, shared states,
+chunked long sequences, bfloat16 and int8) is run on the same sequences
+and checked against the reference with its own tolerances: the largest
+absolute error of any probability, and the fraction of residues whose
+class is the same. For the paths that should be exact, only residues
+whose two most likely classes are further apart than the error tolerance
+count, since a near tie can flip on rounding alone.
+
+Usage:
+
+    $ dssp-golden
+    $ dssp-golden --paths numpy compiled --json
+
+The command exits with status 1 when a path is out of tolerance. The test
+suite runs the same checks.
+"""
+
+import os
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP.dssp_exceptions import DsspError
+
+# shipped reference sequences and probabilities
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'golden_reference.npz')
+
+# the largest absolute probability error, and the smallest fraction of
+# residues with the reference class, allowed for each path
+TOLERANCES = {'predict': {'max_abs_error': 1e-5, 'min_label_agreement': 1.0},
+              'batch': {'max_abs_error': 1e-5, 'min_label_agreement': 1.0},
+              'numpy': {'max_abs_error': 1e-4, 'min_label_agreement': 1.0},
+              'compiled': {'max_abs_error': 1e-5, 'min_label_agreement': 1.0},
+              'share_states': {'max_abs_error': 1e-4, 'min_label_agreement': 1.0},
+              'long_exact': {'max_abs_error': 1e-4, 'min_label_agreement': 1.0},
+              'bf16': {'max_abs_error': 0.1, 'min_label_agreement': 0.99},
+              'int8': {'max_abs_error': 0.5, 'min_label_agreement': 0.95}}
+
+# every path, in the order they are checked
+PATHS = tuple(TOLERANCES)
+
+# chunk size of the long_exact path, small enough that the long sequences
+# cross several chunk boundaries
+LONG_CHUNK_SIZE = 512
+
+
+def golden_sequences():
+    """
+    Function that builds the reference sequence set. Only used to write the
+    reference file; checks read the sequences back from that file.
+
+    Returns
+    -------
+    list of tuple
+        (name, sequence) pairs.
+    """
+    from PredictDSSP import dssp_bench
+    from PredictDSSP import dssp_precision
+
+    sequences = [('single_%s' % (residue), residue) for residue in 'ACDEFGHIKLMNPQRSTVWY']
+    sequences += [('pair_MK', 'MK'), ('pair_GP', 'GP'), ('pair_WW', 'WW'),
+                  ('all_20', 'ACDEFGHIKLMNPQRSTVWY'), ('all_20_reversed', 'YWVTSRQPNMLKIHGFEDCA')]
+
+    # low-complexity regions, on their own and inside a folded context
+    low_complexity = {'polyQ': 'Q' * 60, 'polyA': 'A' * 40, 'polyP': 'P' * 30, 'polyE': 'E' * 50,
+                      'PG_repeat': 'PG' * 20, 'KE_repeat': 'KE' * 25, 'GS_linker': 'GGGGS' * 8,
+                      'EAAAK_linker': 'EAAAK' * 6}
+    sequences += sorted(low_complexity.items())
+    ubiquitin = dssp_precision.REAL_SEQUENCES['ubiquitin']
+    sequences.append(('ubiquitin_polyQ_insert', ubiquitin[:38] + 'Q' * 40 + ubiquitin[38:]))
+
+    sequences += sorted(dssp_precision.REAL_SEQUENCES.items())
+    sequences += [('synthetic_%i' % (i), seq) for i, seq in enumerate(dssp_bench.synthetic_proteome(40, seed=23))]
+    sequences += [('long_%i' % (length), dssp_bench.synthetic_proteome(1, seed=length, length=length)[0])
+                  for length in (1500, 6000)]
+    return sequences
+
+
+def write_reference(path=REFERENCE_FILE):
+    """
+    Function that predicts the reference probabilities with the reference
+    path and writes them with the sequences to a file. Only needed when the
+    network changes.
+
+    Parameters
+    ----------
+    path : str
+        File to write. Default = REFERENCE_FILE.
+    """
+    names, sequences = zip(*golden_sequences())
+    predictor = dssp_predict.get_predictor(engine='torch')
+    probabilities = [predictor.predict(seq) for seq in sequences]
+
+    np.savez_compressed(path, names=np.array(names), sequences=np.array(sequences),
+                        probabilities=np.concatenate(probabilities).astype(np.float32),
+                        network_checksum=np.array(dssp_predict.network_checksum(dssp_predict.network_path())))
+
+
+def load_reference(path=REFERENCE_FILE):
+    """
+    Function that reads the reference sequences and probabilities.
+
+    Parameters
+    ----------
+    path : str
+        File written by write_reference(). Default = REFERENCE_FILE.
+
+    Returns
+    -------
+    dict
+        'names', 'sequences', 'probabilities' (one [length X 3] array per
+        sequence) and the 'network_checksum' they were predicted with.
+    """
+    try:
+        data = np.load(path)
+    except OSError as e:
+        raise DsspError('Unable to read the golden reference %s: %s' % (path, e))
+
+    sequences = [str(seq) for seq in data['sequences']]
+    offsets = np.cumsum([0] + [len(seq) for seq in sequences])
+    probabilities = data['probabilities']
+
+    return {'names': [str(name) for name in data['names']],
+            'sequences': sequences,
+            'probabilities': [probabilities[offsets[i]:offsets[i + 1]] for i in range(len(sequences))],
+            'network_checksum': str(data['network_checksum'])}
+
+
+def run_path(path, sequences):
+    """
+    Function that predicts class probabilities along one inference path.
+
+    Parameters
+    ----------
+    path : str
+        One of PATHS.
+
+    sequences : list of str
+        Valid amino acid sequences.
+
+    Returns
+    -------
+    list of np.ndarray
+        [length X 3] probabilities for each sequence.
+    """
+    from PredictDSSP import dssp_long
+    from PredictDSSP import dssp_shared
+
+    if path == 'predict':
+        predictor = dssp_predict.get_predictor(engine='torch')
+        return [predictor.predict(seq) for seq in sequences]
+    if path == 'batch':
+        return dssp_predict.get_predictor(engine='torch').predict_batch(sequences)
+    if path == 'numpy':
+        return dssp_predict.get_predictor(engine='numpy').predict_batch(sequences)
+    if path == 'compiled':
+        predictor = dssp_predict.get_predictor(engine='torch', compiled=True)
+        if not predictor.compiled:
+            raise DsspError('The network could not be compiled on this installation')
+        return predictor.predict_batch(sequences)
+    if path == 'share_states':
+        return dssp_shared.predict_shared(dssp_predict.get_predictor(engine='numpy').network, sequences)[0]
+    if path == 'long_exact':
+        network = dssp_predict.get_predictor(engine='numpy').network
+        return [dssp_long.predict_exact(seq, network, chunk_size=LONG_CHUNK_SIZE)[0] for seq in sequences]
+    if path in ('bf16', 'int8'):
+        return dssp_predict.get_predictor(engine='torch', precision=path).predict_batch(sequences)
+
+    raise DsspError('Unknown inference path %s, expected one of %s' % (path, ', '.join(PATHS)))
+
+
+def compare(reference, values, tolerance):
+    """
+    Function that checks probabilities against the reference.
+
+    Parameters
+    ----------
+    reference : list of np.ndarray
+        Reference [length X 3] probabilities for each sequence.
+
+    values : list of np.ndarray
+        Probabilities to check, for the same sequences.
+
+    tolerance : dict
+        'max_abs_error' and 'min_label_agreement', as in TOLERANCES.
+
+    Returns
+    -------
+    dict
+        'residues', 'max_abs_error', 'label_agreement' (over the residues
+        that count, see the module documentation), 'label_mismatches' and
+        'worst_sequence' (the index of the sequence with the largest error),
+        the 'tolerance' and whether the path 'passed'.
+    """
+    if len(values) != len(reference):
+        raise DsspError('Expected %i predictions, got %i' % (len(reference), len(values)))
+
+    errors = []
+    for expected, value in zip(reference, values):
+        value = np.asarray(value, dtype=np.float64)
+        if value.shape != expected.shape:
+            raise DsspError('Expected probabilities of shape %s, got %s' % (str(expected.shape), str(value.shape)))
+        errors.append(float(np.abs(value - expected).max()) if expected.size else 0.0)
+
+    expected = np.concatenate(reference)
+    value = np.concatenate([np.asarray(v) for v in values])
+    same = expected.argmax(axis=1) == value.argmax(axis=1)
+
+    # residues whose top two classes are within the error tolerance of each
+    # other may flip on rounding alone, so only count for exact paths
+    counted = np.ones(len(expected), dtype=bool)
+    if tolerance['min_label_agreement'] == 1.0:
+        top2 = np.sort(expected, axis=1)[:, -2:]
+        counted = top2[:, 1] - top2[:, 0] > 2 * tolerance['max_abs_error']
+
+    max_error = max(errors)
+    agreement = float(same[counted].mean()) if counted.any() else 1.0
+
+    return {'residues': len(expected),
+            'max_abs_error': max_error,
+            'label_agreement': agreement,
+            'label_mismatches': int((~same[counted]).sum()),
+            'worst_sequence': int(np.argmax(errors)),
+            'tolerance': dict(tolerance),
+            'passed': max_error <= tolerance['max_abs_error'] and agreement >= tolerance['min_label_agreement']}
+
+
+def check_path(path, reference=None):
+    """
+    Function that checks one inference path against the reference.
+
+    Parameters
+    ----------
+    path : str
+        One of PATHS.
+
+    reference : dict or None
+        Output of load_reference(). Default = None, which loads the
+        shipped reference.
+
+    Returns
+    -------
+    dict
+        See compare(), plus the 'path' and the 'worst_name' of the sequence
+        with the largest error.
+    """
+    if reference is None:
+        reference = load_reference()
+
+    checksum = dssp_predict.network_checksum(dssp_predict.network_path())
+    if checksum != reference['network_checksum']:
+        raise DsspError('The golden reference was written for a different network; '
+                        'regenerate it with dssp-golden --write-reference')
+
+    result = compare(reference['probabilities'], run_path(path, reference['sequences']), TOLERANCES[path])
+    return dict(result, path=path, worst_name=reference['names'][result['worst_sequence']])
+
+
+def check_all(paths=PATHS):
+    """
+    Function that checks several inference paths against the reference.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        Paths to check. Default = all of them.
+
+    Returns
+    -------
+    list of dict
+        The result of check_path() for each path.
+    """
+    reference = load_reference()
+    return [check_path(path, reference) for path in paths]
+
+
+def format_results(results):
+    """
+    Function that formats the output of check_all() as a text table.
+
+    Parameters
+    -----------
+    results : list of dict
+        Output of check_all().
+
+    Returns
+    --------
+    str
+        The formatted table.
+
+    """
+    lines = ['%-14s %12s %12s %12s %12s %10s  %s' % ('path', 'max error', 'tolerance', 'agreement', 'required',
+                                                     'mismatches', 'result')]
+    for result in results:
+        tolerance = result['tolerance']
+        lines.append('%-14s %12.3g %12.3g %12.5f %12.5f %10i  %s' % (
+            result['path'], result['max_abs_error'], tolerance['max_abs_error'], result['label_agreement'],
+            tolerance['min_label_agreement'], result['label_mismatches'],
+            'ok' if result['passed'] else 'FAILED (worst: %s)' % (result['worst_name'])))
+    return '\n'.join(lines)
+
@@ -8,9 +8,101 @@ Backend for graphing predicted disorder values in dssp.py.
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
-import metapredict as meta
 from PredictDSSP.dssp_predict import predict_dssp
-import alphaPredict as alpha
+
+# metapredict and alphaPredict are only needed when excluding disordered
+# regions, so they are imported in disorder_mask()
+
+
+def class_segments(mask):
+    """
+    Function that run-length encodes a per-residue mask into the contiguous
+    stretches where it is set.
+
+    Parameters
+    -----------
+    mask : np.ndarray
+        Boolean array with one entry per residue.
+
+    Returns
+    -----------
+    np.ndarray
+        int array of shape [number of stretches X 2] holding the 0-based
+        start and the length of each stretch.
+
+    """
+    padded = np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[0::2], edges[1::2]
+    return np.column_stack((starts, ends - starts))
+
+
+def minmax_indices(values, bins):
+    """
+    Function that picks the points of a line that keep its shape when it is
+    drawn across a given number of pixel columns: the residues are split into
+    bins consecutive groups and the lowest and highest point of each group
+    are kept, in sequence order, so every visible peak and dip survives.
+
+    Parameters
+    -----------
+    values : np.ndarray
+        One value per residue.
+
+    bins : int
+        Number of groups, normally the width of the plot in pixels.
+
+    Returns
+    -----------
+    np.ndarray
+        Sorted indices of the points to draw. All of them if there are no
+        more than 2 * bins values.
+
+    """
+    values = np.asarray(values)
+    n_values = len(values)
+    if n_values <= 2 * bins:
+        return np.arange(n_values)
+
+    # equal groups, with the last one padded by repeating its final value
+    size = -(-n_values // bins)
+    groups = -(-n_values // size)
+    padded = np.pad(values, (0, groups * size - n_values), mode='edge').reshape(groups, size)
+
+    offsets = np.arange(groups) * size
+    lowest = np.minimum(offsets + padded.argmin(axis=1), n_values - 1)
+    highest = np.minimum(offsets + padded.argmax(axis=1), n_values - 1)
+
+    # keep the ends so the line spans the whole sequence
+    return np.unique(np.concatenate(([0, n_values - 1], lowest, highest)))
+
+
+def disorder_mask(sequence, dis_threshhold=0.3):
+    """
+    Function that marks the residues treated as disordered when disordered
+    regions are excluded from a graph: a metapredict disorder score of at
+    least dis_threshhold and an alphaPredict pLDDT of at most 65.
+
+    Parameters
+    -----------
+    sequence : str
+        Input amino acid sequence (as string).
+
+    dis_threshhold : float
+        The theshhold disorder score for metapredict scores to consider something disordered
+
+    Returns
+    -----------
+    np.ndarray
+        Boolean array with one entry per residue.
+
+    """
+    import metapredict as meta
+    import alphaPredict as alpha
+
+    pLDDT_scores = np.asarray(alpha.predict(sequence))
+    disorder_scores = np.asarray(meta.predict_disorder(sequence))
+    return (disorder_scores >= dis_threshhold) & (pLDDT_scores <= 65)
 
 
 def graph(sequence,
@@ -23,11 +115,18 @@ def graph(sequence,
           no_disorder_bars = False,          
           dis_threshhold = 0.3,
           DPI=150,
-          output_file=None):
+          output_file=None,
+          dssp_scores=None,
+          disordered=None,
+          rasterize=False):
 
     """
     Function for graphing predicted dssp scores.
 
+    Each class is drawn as one rectangle per stretch of consecutive residues
+    in that class rather than one bar per residue, so long proteins render
+    quickly and give small vector (.pdf, .svg) files.
+
     Parameters
     -----------
 
@@ -70,6 +169,19 @@ def graph(sequence,
         to the ``matplotlib.pyplot.savefig()`` function as the ``fname`` parameter. 
         Default = None.
 
+    dssp_scores : list or np.ndarray
+        Precomputed class of each residue, as returned by predict_dssp(). If provided
+        the network is not run. Default = None.
+
+    disordered : list or np.ndarray
+        Precomputed boolean mask of the disordered residues, as returned by
+        disorder_mask(). If provided with exclude_disorder, metapredict and
+        alphaPredict are not run. Default = None.
+
+    rasterize : Bool
+        Draw the class rectangles as an image inside vector output files, which keeps
+        .pdf and .svg files of very fragmented predictions small. Default = False.
+
 
     Returns
     -----------
@@ -99,80 +211,45 @@ def graph(sequence,
     # modify y_label if needed
     axes.set_ylabel("DSSP scores")
 
-    # make x values for each residue with predicted score
-    xValues = np.arange(1, n_res+1)
-
     # get the dssp scores
-    dssp_scores = predict_dssp(sequence)
+    if dssp_scores is None:
+        dssp_scores = predict_dssp(sequence, as_array=True)
+    dssp_scores = np.asarray(dssp_scores)
 
-    # break up the scores into lists for each position number
-    zero_list = []
-    one_list = []
-    two_list = []
-    disorder_list = []
+    if len(dssp_scores) != n_res:
+        raise ValueError('Expected %i dssp scores, got %i' % (n_res, len(dssp_scores)))
 
+    # residues shown as disordered are taken out of the class tracks
     if exclude_disorder == True:
-        pLDDT_scores = alpha.predict(sequence)
-        disorder_scores = meta.predict_disorder(sequence)
-
-    for sco in range(0, len(dssp_scores)):
-        cur_score = dssp_scores[sco]
-        if exclude_disorder == False:
-            if cur_score == 0:
-                zero_list.append(1)
-                one_list.append(0)
-                two_list.append(0)
-            elif cur_score == 1:
-                zero_list.append(0)
-                one_list.append(1)
-                two_list.append(0)
-            else:
-                zero_list.append(0)
-                one_list.append(0)
-                two_list.append(1)
-        else:
-            cur_disorder_score = disorder_scores[sco]
-            cur_alpha_score = pLDDT_scores[sco]
-            if cur_disorder_score >= dis_threshhold and cur_alpha_score <=65:
-                    zero_list.append(0)
-                    one_list.append(0)
-                    two_list.append(0)
-                    disorder_list.append(1)
-
-            else:
-                disorder_list.append(0)
-                if cur_score == 0:
-                    zero_list.append(1)
-                    one_list.append(0)
-                    two_list.append(0)
-                elif cur_score == 1:
-                    zero_list.append(0)
-                    one_list.append(1)
-                    two_list.append(0)
-                else:
-                    zero_list.append(0)
-                    one_list.append(0)
-                    two_list.append(1)
-
-    axes.bar(xValues + 0.00, zero_list, color=color_0)
-    axes.bar(xValues + 0.00, one_list, color=color_1)
-    axes.bar(xValues + 0.00, two_list, color=color_2)
+        if disordered is None:
+            disordered = disorder_mask(sequence, dis_threshhold=dis_threshhold)
+        disordered = np.asarray(disordered, dtype=bool)
+        if len(disordered) != n_res:
+            raise ValueError('Expected %i disorder values, got %i' % (n_res, len(disordered)))
+    else:
+        disordered = np.zeros(n_res, dtype=bool)
 
-    if exclude_disorder == True:
-        if no_disorder_bars == False:
-            axes.bar(xValues + 0.00, disorder_list, color=disorder_color)
+    layers = [(dssp_scores == 0) & ~disordered, (dssp_scores == 1) & ~disordered,
+              (dssp_scores != 0) & (dssp_scores != 1) & ~disordered]
+    colors = [color_0, color_1, color_2]
+    labels = ['helix', 'beta strand / sheet', 'coil']
+
+    if exclude_disorder == True and no_disorder_bars == False:
+        layers.append(disordered)
+        colors.append(disorder_color)
+        labels.append('disordered')
+
+    # residue i (from 1) covers i - 0.4 to i + 0.4, as a bar of the default width would
+    for mask, color, label in zip(layers, colors, labels):
+        segments = class_segments(mask)
+        ranges = [(start + 0.6, length - 0.2) for start, length in segments]
+        axes.broken_barh(ranges, (0, 1), facecolors=color, label=label, rasterized=rasterize)
 
     plt.ylim(0, 2)
 
     axes.set_yticks([0, 1])
 
-    if exclude_disorder == True:
-        if no_disorder_bars == False:
-            axes.legend(labels=['helix', 'beta strand / sheet', 'coil', 'disordered'], loc='upper right')
-        else:
-            axes.legend(labels=['helix', 'beta strand / sheet', 'coil',], loc='upper right')
-    else:
-        axes.legend(labels=['helix', 'beta strand / sheet', 'coil'], loc='upper right')
+    axes.legend(loc='upper right')
 
     if output_file is None:
         plt.show()
@@ -185,10 +262,17 @@ def graph(sequence,
 def graph_values(sequence,
           title='DSSP Values',
           DPI=150,
-          output_file=None):
+          output_file=None,
+          probabilities=None,
+          rasterize=False,
+          decimate=True):
     """
     Function for graphing the DSSP probability scores for 
     each value.
+
+    For sequences longer than the plot is wide in pixels, only the lowest and
+    highest score of each pixel column are drawn (see minmax_indices()), which
+    looks the same but takes about the same time however long the sequence is.
     
     Parameters
     -----------
@@ -214,6 +298,20 @@ def graph_values(sequence,
         provided, this value is passed directly to the 
         ``matplotlib.pyplot.savefig()`` function as the ``fname`` parameter. 
         Default = None.
+
+    probabilities : np.ndarray
+        Precomputed [length X 3] class probabilities, as returned by
+        predict_dssp(..., raw_vals=True). If provided the network is not run.
+        Default = None.
+
+    rasterize : Bool
+        Draw the probability lines as an image inside vector output files.
+        Default = False.
+
+    decimate : Bool
+        Draw only the lowest and highest score of each pixel column for long
+        sequences. Set to False to draw every residue, e.g. for vector files
+        that will be zoomed into. Default = True.
         
 
     Returns
@@ -249,22 +347,26 @@ def graph_values(sequence,
     # make x values for each residue with predicted disorder
     xValues = np.arange(1, n_res+1)
 
-    all_dssp_vals = predict_dssp(sequence, raw_vals=True)
-    
-    helicity_vals = []
-    strand_vals = []
-    coil_vals = []
+    if probabilities is None:
+        probabilities = predict_dssp(sequence, raw_vals=True)
+    all_dssp_vals = np.asarray(probabilities)
 
-    for ind_val in all_dssp_vals:
-        helicity_vals.append(ind_val[0])
-        strand_vals.append(ind_val[1])
-        coil_vals.append(ind_val[2])
+    if all_dssp_vals.shape != (n_res, 3):
+        raise ValueError('Expected probabilities of shape (%i, 3), got %s' % (n_res, str(all_dssp_vals.shape)))
 
-    # graph the dssp values of each residue at each point along the x-axis
+    # graph the dssp values of each residue at each point along the x-axis,
+    # or of the residues that are visible once drawn when decimating
+    columns = int(fig.get_figwidth() * axes.get_position().width * DPI)
+    colors = ['red', 'blue', 'orange']
+    labels = ['Helicity Scores', 'Beta Strand Scores', 'Coil Scores']
 
-    ds1, = axes.plot(xValues, helicity_vals, color='red', linewidth='1.6', label = 'Helicity Scores')
-    ds2, = axes.plot(xValues, strand_vals, color='blue', linewidth='1.6', label = 'Beta Strand Scores')
-    ds3, = axes.plot(xValues, coil_vals, color='orange', linewidth='1.6', label = 'Coil Scores')
+    handles = []
+    for channel in range(3):
+        vals = all_dssp_vals[:, channel]
+        keep = minmax_indices(vals, columns) if decimate else slice(None)
+        line, = axes.plot(xValues[keep], vals[keep], color=colors[channel], linewidth='1.6',
+                          label=labels[channel], rasterized=rasterize)
+        handles.append(line)
 
 
     # set x limit as the number of residues
@@ -278,7 +380,7 @@ def graph_values(sequence,
         axes.plot([0, n_res+2], [i, i], color="black", linestyle="dashed", linewidth="0.5")
     
     # make legend
-    axes.legend(handles=[ds1, ds2, ds3], bbox_to_anchor=(1.14, 1), loc='best', prop={'size': 12})
+    axes.legend(handles=handles, bbox_to_anchor=(1.14, 1), loc='best', prop={'size': 12})
 
 
     if output_file is None:
@@ -0,0 +1,352 @@
+"""
+Memory-bounded prediction for very long sequences.
+
+Two strategies are provided:
+
+exact
+    The LSTM is run one layer at a time in chunks of residues, carrying the
+    hidden and cell states across chunk boundaries in both directions. The
+    result is the same computation as a full-sequence forward pass, but the
+    working memory is a few hundred bytes per residue plus a fixed chunk
+    scratch space. If even that would exceed max_memory, the per-residue
+    layer buffers are spilled to temporary memory-mapped files.
+
+window
+    The sequence is split into windows, each extended by a context margin on
+    both sides. Windows are predicted together in token-bounded batches and
+    only their interiors are kept. This is an approximation whose quality
+    depends on the margin; the deviation report measures it.
+
+Both run on the NumPy copy of the network weights, so neither needs torch
+once the weights have been exported.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import encode_sequence
+from PredictDSSP import numpy_brnn
+from PredictDSSP import py_predictor_v2
+from PredictDSSP.dssp_exceptions import DsspError
+
+LONG_MODES = ('exact', 'window')
+
+# residues run through the LSTM at a time in exact mode
+DEFAULT_CHUNK_SIZE = 4096
+
+# interior size and context margin of each window in window mode
+DEFAULT_WINDOW = 2048
+DEFAULT_MARGIN = 256
+
+
+def exact_memory(length, network, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Function that estimates the peak working memory of exact mode.
+
+    Parameters
+    ----------
+    length : int
+        Sequence length.
+
+    network : numpy_brnn.NumpyBRNN_MtM
+        The network.
+
+    chunk_size : int
+        Residues per chunk.
+
+    Returns
+    -------
+    tuple
+        (bytes held in memory per residue, bytes that are spilled to disk
+        when over the cap, chunk scratch bytes). Held in memory are the
+        residue indices and the class probabilities; the spillable part is
+        the input and output buffers of the current layer.
+    """
+    H = network.hidden_size
+    held = length * (1 + network.num_classes * 4)
+    spillable = length * 2 * (2 * H) * 4
+
+    # gates and hidden states of both directions, plus the output layer
+    # and its softmax temporaries, for one chunk
+    scratch = chunk_size * (2 * 4 * H + 2 * H + 4 * network.num_classes) * 4
+    return held, spillable, scratch
+
+
+def _buffer(shape, spill_dir):
+    # float32 working buffer, memory-mapped from a temporary file when spilling
+    if spill_dir is None:
+        return np.empty(shape, dtype=np.float32)
+    handle, filename = tempfile.mkstemp(suffix='.f32', dir=spill_dir)
+    os.close(handle)
+    return np.memmap(filename, dtype=np.float32, mode='w+', shape=shape)
+
+
+def _lstm_layer(gates_in, length, w_hh, out, chunk_size):
+    # Run one bidirectional layer in chunks. gates_in(start, end, direction, out)
+    # writes the input contribution to the gates for residues start:end into
+    # out, in sequence order. The forward direction walks chunks from the
+    # start and the reverse direction from the end, together, carrying (h, c)
+    # between chunks, and each writes its hidden states into its half of out.
+    H = w_hh.shape[1]
+    h = np.zeros((2, 1, H), dtype=np.float32)
+    c = np.zeros((2, 1, H), dtype=np.float32)
+
+    gates_x = np.empty((2, min(chunk_size, length), 4 * H), dtype=np.float32)
+    hidden = np.empty((2, min(chunk_size, length), H), dtype=np.float32)
+    directions = np.array([0, 1])
+
+    for start in range(0, length, chunk_size):
+        end = min(start + chunk_size, length)
+        n = end - start
+
+        # the reverse direction covers the mirror-image chunk, read back to front
+        rstart, rend = length - end, length - start
+        gates_in(start, end, 0, gates_x[0, :n])
+        gates_in(rstart, rend, 1, gates_x[1, :n])
+
+        for t in range(n):
+            steps = np.array([t, n - 1 - t])
+            gates = gates_x[directions, steps][:, None] + np.matmul(h, w_hh)
+
+            # PyTorch gate order is input, forget, cell, output
+            i = numpy_brnn.sigmoid(gates[..., :H])
+            f = numpy_brnn.sigmoid(gates[..., H:2*H])
+            g = np.tanh(gates[..., 2*H:3*H])
+            o = numpy_brnn.sigmoid(gates[..., 3*H:])
+
+            c = f * c + i * g
+            h = o * np.tanh(c)
+            hidden[directions, steps] = h[:, 0]
+
+        out[start:end, :H] = hidden[0, :n]
+        out[rstart:rend, H:] = hidden[1, :n]
+
+
+def predict_exact(sequence, network, chunk_size=DEFAULT_CHUNK_SIZE, max_memory=None):
+    """
+    Function that predicts class probabilities for a sequence by running
+    the LSTM in chunks with hidden and cell states carried across chunk
+    boundaries. Equivalent to a full-sequence forward pass.
+
+    Parameters
+    ----------
+    sequence : str
+        Valid amino acid sequence (upper case).
+
+    network : numpy_brnn.NumpyBRNN_MtM
+        The network.
+
+    chunk_size : int
+        Residues per chunk. Default = 4096.
+
+    max_memory : int or None
+        Cap on the working memory in bytes. If the layer buffers would not
+        fit, they are spilled to temporary files, and the chunk size is
+        reduced until the rest fits the cap. Default = None, no cap.
+
+    Returns
+    -------
+    tuple
+        (float32 [length X classes] probabilities, dict with the planned
+        'peak_bytes', the 'chunk_size' used and whether buffers were
+        'spilled' to disk).
+    """
+    if chunk_size < 1:
+        raise DsspError('chunk_size must be at least 1')
+
+    length = len(sequence)
+    spill = False
+
+    held, spillable, scratch = exact_memory(length, network, chunk_size)
+    if max_memory is not None and held + spillable + scratch > max_memory:
+        spill = True
+
+        # whatever is left after the in-memory arrays goes to chunk scratch
+        scratch_per_residue = exact_memory(0, network, 1)[2]
+        chunk_size = min(chunk_size, int((max_memory - held) // scratch_per_residue))
+        if chunk_size < 1:
+            raise DsspError('max_memory of %i bytes is too small for a sequence of %i residues' % (max_memory, length))
+        spillable, scratch = 0, chunk_size * scratch_per_residue
+
+    report = {'peak_bytes': int(held + spillable + scratch), 'chunk_size': chunk_size, 'spilled': spill}
+
+    index = encode_sequence.sequence_to_index(sequence)
+    spill_dir = tempfile.mkdtemp(prefix='predictdssp-') if spill else None
+
+    try:
+        layer_in = None
+        for layer, (w_ih, w_hh, bias) in enumerate(network.layers):
+            layer_out = _buffer((length, 2 * network.hidden_size), spill_dir)
+
+            if layer == 0:
+                # a one-hot input times the weights is just a row of the weights
+                def gates_in(start, end, direction, out, w_ih=w_ih, bias=bias):
+                    np.take(w_ih[direction], index[start:end], axis=0, out=out, mode='clip')
+                    out += bias[direction]
+            else:
+                def gates_in(start, end, direction, out, w_ih=w_ih, bias=bias, layer_in=layer_in):
+                    np.matmul(layer_in[start:end], w_ih[direction], out=out)
+                    out += bias[direction]
+
+            _lstm_layer(gates_in, length, w_hh, layer_out, chunk_size)
+
+            # the input buffer of this layer is no longer needed
+            del gates_in, layer_in
+            layer_in = layer_out
+
+        probabilities = np.empty((length, network.num_classes), dtype=np.float32)
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            logits = np.matmul(layer_in[start:end], network.fc_weight) + network.fc_bias
+            probabilities[start:end] = numpy_brnn.softmax(logits)
+
+        del layer_in
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return probabilities, report
+
+
+def predict_window(sequence, predictor, window=DEFAULT_WINDOW, margin=DEFAULT_MARGIN,
+                   max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS):
+    """
+    Function that predicts class probabilities for a sequence from
+    overlapping windows, keeping the interior of each window.
+
+    Parameters
+    ----------
+    sequence : str
+        Valid amino acid sequence (upper case).
+
+    predictor : py_predictor_v2.Predictor
+        The predictor to run the windows through.
+
+    window : int
+        Number of residues kept from each window. Default = 2048.
+
+    margin : int
+        Residues of context added on each side of a window and then
+        discarded. Default = 256.
+
+    max_tokens : int
+        Maximum number of padded residues per forward pass.
+
+    Returns
+    -------
+    tuple
+        (float32 [length X classes] probabilities, dict with the planned
+        'peak_bytes' and the number of 'windows').
+    """
+    if window < 1 or margin < 0:
+        raise DsspError('window must be at least 1 and margin at least 0')
+
+    length = len(sequence)
+    starts = list(range(0, length, window))
+    spans = [(max(0, s - margin), min(length, s + window + margin)) for s in starts]
+
+    values = predictor.predict_batch([sequence[a:b] for a, b in spans], max_tokens=max_tokens)
+
+    probabilities = np.empty((length, values[0].shape[1] if values else 3), dtype=np.float32)
+    for s, (a, _), value in zip(starts, spans, values):
+        end = min(s + window, length)
+        probabilities[s:end] = value[s - a:end - a]
+
+    # windows are batched into forward passes of at most max_tokens residues
+    H = predictor.hidden_vector_size
+    tokens = min(max_tokens, len(spans) * (window + 2 * margin)) if spans else 0
+    peak = tokens * (20 + 2 * 2 * 4 * H + 2 * 2 * H + 2 * H) * 4 + length * 3 * 4
+
+    return probabilities, {'peak_bytes': int(peak), 'windows': len(spans)}
+
+
+def deviation_report(values, reference):
+    """
+    Function that measures how far long-sequence predictions are from
+    full-sequence inference.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        [length X classes] probabilities from a long-sequence mode.
+
+    reference : np.ndarray
+        [length X classes] probabilities from a full-sequence forward pass.
+
+    Returns
+    -------
+    dict
+        'max_abs_deviation' and 'mean_abs_deviation' of the probabilities,
+        the number of 'label_mismatches' and the 'label_agreement' fraction.
+    """
+    diff = np.abs(np.asarray(values, dtype=np.float64) - reference)
+    mismatches = int(np.count_nonzero(values.argmax(axis=1) != reference.argmax(axis=1)))
+
+    return {'max_abs_deviation': float(diff.max()) if diff.size else 0.0,
+            'mean_abs_deviation': float(diff.mean()) if diff.size else 0.0,
+            'label_mismatches': mismatches,
+            'label_agreement': 1 - mismatches / len(values) if len(values) else 1.0}
+
+
+def predict_long(sequence, mode='exact', chunk_size=DEFAULT_CHUNK_SIZE, window=DEFAULT_WINDOW,
+                 margin=DEFAULT_MARGIN, max_memory=None, report=False, engine='torch'):
+    """
+    Function that predicts class probabilities for a long sequence with
+    bounded memory.
+
+    Parameters
+    ----------
+    sequence : str
+        Valid amino acid sequence (upper case).
+
+    mode : str
+        'exact' (default) or 'window'. See the module documentation.
+
+    chunk_size : int
+        Residues per chunk in exact mode. Default = 4096.
+
+    window : int
+        Residues kept per window in window mode. Default = 2048.
+
+    margin : int
+        Context residues on each side of a window in window mode. Default = 256.
+
+    max_memory : int or None
+        Cap on the working memory of exact mode, in bytes. Default = None.
+
+    report : bool
+        Also run full-sequence inference and report the deviation from it.
+        This needs the memory that the long modes avoid. Default = False.
+
+    engine : str
+        Engine for window mode and for the reference prediction. Exact mode
+        always runs on the NumPy weights.
+
+    Returns
+    -------
+    tuple
+        (float32 [length X classes] probabilities, dict describing the run,
+        including the deviation from full-sequence inference if report is
+        True).
+    """
+    if mode not in LONG_MODES:
+        raise DsspError('mode must be one of %s' % (', '.join(LONG_MODES)))
+
+    if mode == 'exact':
+        network = dssp_predict.get_predictor(engine='numpy').network
+        values, info = predict_exact(sequence, network, chunk_size=chunk_size, max_memory=max_memory)
+    else:
+        predictor = dssp_predict.get_predictor(engine=engine)
+        values, info = predict_window(sequence, predictor, window=window, margin=margin)
+
+    info = dict(info, mode=mode, length=len(sequence))
+
+    if report:
+        reference = dssp_predict.get_predictor(engine=engine).predict(sequence)
+        info.update(deviation_report(values, reference))
+
+    return values, info
@@ -0,0 +1,281 @@
+"""
+Memory footprint report for PredictDSSP.
+
+Runs each scenario (importing the package, loading the network, importing
+the graphing stack, predicting single sequences across a sweep of lengths,
+and predicting a whole FASTA file) in a fresh Python process and records its
+peak resident set size, so the footprint of a worker can be budgeted before
+packing workers onto a node. Each prediction scenario also records the peak
+tracemalloc allocation of the prediction itself, which covers numpy arrays
+and Python objects but not memory allocated inside torch.
+
+Usage:
+
+    $ dssp-memory
+    $ dssp-memory --lengths 100 1000 10000 --plot memory.png
+    $ dssp-memory --max-bytes-per-residue 2000 --max-worker-mb 900 --json
+
+The command exits with status 1 when a budget is exceeded.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+import numpy as np
+
+# sequence lengths predicted in fresh processes for the memory-vs-length curve
+DEFAULT_LENGTHS = (100, 1000, 5000, 10000, 25000)
+
+# number of sequences in the synthetic FASTA file
+DEFAULT_FASTA_SEQUENCES = 2000
+
+# scenarios that need no argument, in the order they run. Each includes the
+# work of the ones before it apart from 'graph_stack'
+SCENARIOS = ('import', 'load', 'graph_stack')
+
+# run in the fresh process; prints the measurements of one scenario as JSON
+_CHILD = "import json; from PredictDSSP import dssp_memory; print(json.dumps(dssp_memory._measure(%r, %r)))"
+
+
+def _measure(scenario, argument=None):
+    # runs in a fresh process. The peak RSS of the operation is the growth of
+    # the process's peak over what setting it up already reached
+    import tracemalloc
+
+    import PredictDSSP
+    from PredictDSSP import dssp_cache
+    from PredictDSSP import dssp_predict
+    from PredictDSSP.dssp_profile import peak_rss
+
+    if peak_rss() is None:
+        raise RuntimeError('The peak RSS of a process can not be measured on this platform')
+
+    if scenario == 'import':
+        return {'peak_rss_bytes': peak_rss()}
+
+    # every prediction runs the network
+    dssp_predict.set_cache_size(0)
+    dssp_cache.disable_prediction_cache()
+    PredictDSSP.predict_dssp('ACDEFGHIKLMNPQRSTVWY')
+
+    if scenario == 'load':
+        return {'peak_rss_bytes': peak_rss()}
+
+    if scenario == 'graph_stack':
+        import matplotlib
+        matplotlib.use('Agg')
+        import metapredict
+        import alphaPredict
+        from PredictDSSP import dssp_graph
+        return {'peak_rss_bytes': peak_rss()}
+
+    if scenario == 'predict':
+        from PredictDSSP import dssp_bench
+
+        sequence = dssp_bench.synthetic_proteome(1, length=argument)[0]
+        operation = lambda: PredictDSSP.predict_dssp(sequence)
+    elif scenario == 'fasta':
+        operation = lambda: PredictDSSP.predict_dssp_fasta(argument, output_file=os.devnull)
+    elif scenario == 'fasta_dict':
+        operation = lambda: PredictDSSP.predict_dssp_fasta(argument)
+    else:
+        raise ValueError('Unknown scenario %s' % (scenario))
+
+    before = peak_rss()
+    tracemalloc.start()
+    operation()
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    peak = peak_rss()
+
+    return {'peak_rss_bytes': peak, 'rss_growth_bytes': peak - before, 'tracemalloc_peak_bytes': traced}
+
+
+def measure(scenario, argument=None, python=None):
+    """
+    Function that measures one scenario in a fresh interpreter.
+
+    Parameters
+    -----------
+    scenario : str
+        One of SCENARIOS, 'predict' (with the sequence length as argument),
+        or 'fasta' / 'fasta_dict' (with the FASTA file as argument, writing
+        the predictions to a file or keeping them in a dict).
+
+    argument : int or str
+        Argument of the scenario.
+
+    python : str
+        Python executable to use. Default = the current interpreter.
+
+    Returns
+    --------
+    dict
+        'peak_rss_bytes' of the process and, for the prediction scenarios,
+        'rss_growth_bytes' (how much the prediction raised the peak) and
+        'tracemalloc_peak_bytes'.
+
+    """
+    if python is None:
+        python = sys.executable
+
+    result = subprocess.run([python, '-c', _CHILD % (scenario, argument)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('Scenario %s failed:\n%s' % (scenario, result.stderr[-2000:]))
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def memory_report(lengths=DEFAULT_LENGTHS, fasta_sequences=DEFAULT_FASTA_SEQUENCES, max_bytes_per_residue=None,
+                  max_worker_bytes=None, python=None):
+    """
+    Function that measures every scenario and checks the budgets.
+
+    Parameters
+    -----------
+    lengths : iterable of int
+        Sequence lengths of the memory-vs-length curve.
+
+    fasta_sequences : int
+        Number of sequences in the synthetic FASTA file. 0 skips the FASTA
+        scenarios.
+
+    max_bytes_per_residue : float or None
+        Budget for the growth of peak RSS per predicted residue, taken from
+        a straight-line fit of the memory-vs-length curve.
+
+    max_worker_bytes : float or None
+        Budget for the peak RSS of a worker, the largest over all scenarios.
+
+    python : str
+        Python executable to use. Default = the current interpreter.
+
+    Returns
+    --------
+    dict
+        'scenarios', 'curve' (one entry per length), 'bytes_per_residue'
+        (fitted from RSS growth and from tracemalloc peaks),
+        'worker_peak_bytes', 'budgets' and 'exceeded', the list of budgets
+        that were exceeded.
+
+    """
+    from PredictDSSP import dssp_bench
+
+    scenarios = {name: measure(name, python=python) for name in SCENARIOS}
+
+    curve = []
+    for length in lengths:
+        curve.append(dict(measure('predict', int(length), python=python), length=int(length)))
+
+    if fasta_sequences > 0:
+        sequences = dssp_bench.synthetic_proteome(fasta_sequences)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta = os.path.join(tmpdir, 'proteome.fasta')
+            with open(fasta, 'w') as fh:
+                for i, seq in enumerate(sequences):
+                    fh.write('>synthetic_%i\n%s\n' % (i, seq))
+
+            for name in ('fasta', 'fasta_dict'):
+                scenarios[name] = dict(measure(name, fasta, python=python), sequences=len(sequences),
+                                       residues=sum(len(seq) for seq in sequences))
+
+    # the slope of the curve is the memory cost of each extra residue
+    bytes_per_residue = {'rss': None, 'tracemalloc': None}
+    if len(curve) >= 2:
+        x = [point['length'] for point in curve]
+        rss = [point['rss_growth_bytes'] for point in curve]
+        traced = [point['tracemalloc_peak_bytes'] for point in curve]
+        bytes_per_residue['rss'] = float(np.polyfit(x, rss, 1)[0])
+        bytes_per_residue['tracemalloc'] = float(np.polyfit(x, traced, 1)[0])
+
+    worker_peak = max(entry['peak_rss_bytes'] for entry in list(scenarios.values()) + curve)
+
+    exceeded = []
+    if max_bytes_per_residue is not None and bytes_per_residue['rss'] is not None \
+            and bytes_per_residue['rss'] > max_bytes_per_residue:
+        exceeded.append('bytes_per_residue')
+    if max_worker_bytes is not None and worker_peak > max_worker_bytes:
+        exceeded.append('worker_peak_bytes')
+
+    return {'environment': dssp_bench.environment(),
+            'scenarios': scenarios,
+            'curve': curve,
+            'bytes_per_residue': bytes_per_residue,
+            'worker_peak_bytes': worker_peak,
+            'budgets': {'bytes_per_residue': max_bytes_per_residue, 'worker_peak_bytes': max_worker_bytes},
+            'exceeded': exceeded}
+
+
+def format_report(report):
+    """
+    Function that formats the output of memory_report() as text.
+
+    Parameters
+    -----------
+    report : dict
+        Output of memory_report().
+
+    Returns
+    --------
+    str
+        The formatted report.
+
+    """
+    mb = lambda value: '%.1f' % (value / 1e6) if value is not None else '-'
+
+    lines = ['%-14s %14s %16s %16s' % ('scenario', 'peak RSS MB', 'RSS growth MB', 'tracemalloc MB')]
+    for name, entry in report['scenarios'].items():
+        lines.append('%-14s %14s %16s %16s' % (name, mb(entry['peak_rss_bytes']), mb(entry.get('rss_growth_bytes')),
+                                               mb(entry.get('tracemalloc_peak_bytes'))))
+
+    lines += ['', '%-14s %14s %16s %16s' % ('length', 'peak RSS MB', 'RSS growth MB', 'tracemalloc MB')]
+    for point in report['curve']:
+        lines.append('%-14i %14s %16s %16s' % (point['length'], mb(point['peak_rss_bytes']),
+                                               mb(point['rss_growth_bytes']), mb(point['tracemalloc_peak_bytes'])))
+
+    per_residue = report['bytes_per_residue']
+    if per_residue['rss'] is not None:
+        lines += ['', 'Per residue: %.0f bytes of RSS, %.0f bytes traced' % (per_residue['rss'],
+                                                                             per_residue['tracemalloc'])]
+    lines.append('Worker peak RSS: %s MB' % (mb(report['worker_peak_bytes'])))
+
+    for name in report['exceeded']:
+        lines.append('BUDGET EXCEEDED: %s (budget %g)' % (name, report['budgets'][name]))
+
+    return '\n'.join(lines)
+
+
+def plot_curve(report, output_file):
+    """
+    Function that plots the memory-vs-length curve of memory_report() to a file.
+
+    Parameters
+    -----------
+    report : dict
+        Output of memory_report().
+
+    output_file : str
+        File to save the figure to, in any format matplotlib supports.
+
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    curve = report['curve']
+    lengths = [point['length'] for point in curve]
+
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.plot(lengths, [point['peak_rss_bytes'] / 1e6 for point in curve], 'o-', label='peak RSS')
+    ax.plot(lengths, [point['rss_growth_bytes'] / 1e6 for point in curve], 'o-', label='RSS growth')
+    ax.plot(lengths, [point['tracemalloc_peak_bytes'] / 1e6 for point in curve], 'o-', label='tracemalloc peak')
+    ax.set_xlabel('Sequence length')
+    ax.set_ylabel('MB')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(output_file)
+    plt.close(fig)
+
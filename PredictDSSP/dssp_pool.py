@@ -0,0 +1,217 @@
+"""
+Multi-process prediction for large sets of sequences.
+
+PredictorPool runs predict_dssp_batch in a pool of worker processes. The
+network is loaded once per worker (and, where processes are started by
+fork, loaded once in the parent and shared copy-on-write), sequences are
+sent to the workers in chunks, and results come back in input order.
+"""
+
+import os
+import multiprocessing
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import py_predictor_v2
+from PredictDSSP.dssp_exceptions import DsspError
+
+# number of sequences sent to a worker at a time
+DEFAULT_CHUNK_SIZE = 64
+
+
+def available_cpus():
+    """
+    Function that returns the number of CPUs this process may run on.
+
+    Returns
+    -------
+    int
+        Number of usable CPUs.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(engine, threads):
+    # cap the intra-op threads of each worker so workers X threads never
+    # oversubscribes the machine
+    if engine == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+
+    # no-op if the network was inherited from the parent by fork
+    dssp_predict.get_predictor(engine=engine)
+
+
+def _predict_chunk(sequences, raw_vals, as_array, max_tokens, engine):
+    return dssp_predict.predict_dssp_batch(sequences, raw_vals=raw_vals, as_array=as_array,
+                                           max_tokens=max_tokens, engine=engine)
+
+
+class PredictorPool():
+    """
+    A pool of worker processes for predicting DSSP scores in parallel.
+
+    Usage:
+
+    >>> with PredictorPool(workers=8, threads_per_worker=2) as pool:
+    ...     scores = pool.predict(sequences)
+
+    Attributes
+    ----------
+    workers : int
+        Number of worker processes.
+    threads_per_worker : int
+        Number of torch intra-op threads used by each worker.
+    chunk_size : int
+        Number of sequences sent to a worker at a time.
+    engine : str
+        Inference engine used by the workers ('torch' or 'numpy').
+    """
+
+    def __init__(self, workers=None, threads_per_worker=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 engine='torch', max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS):
+        """
+        Parameters
+        ----------
+        workers : int
+            Number of worker processes. Default = None, which uses one worker
+            per available CPU.
+        threads_per_worker : int
+            Number of torch intra-op threads per worker. Default = None,
+            which splits the available CPUs evenly between workers. Values
+            that would oversubscribe the machine are reduced.
+        chunk_size : int
+            Number of sequences sent to a worker at a time. Default = 64.
+        engine : str
+            Inference engine, either 'torch' (default) or 'numpy'.
+        max_tokens : int
+            Passed to predict_dssp_batch() in each worker.
+        """
+
+        cpus = available_cpus()
+
+        if workers is None:
+            workers = cpus
+        if workers < 1:
+            raise DsspError('workers must be at least 1')
+        if chunk_size < 1:
+            raise DsspError('chunk_size must be at least 1')
+
+        if threads_per_worker is None or workers * threads_per_worker > cpus:
+            threads_per_worker = max(1, cpus // workers)
+
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.max_tokens = max_tokens
+
+        # load the network before starting workers so forked workers share it
+        methods = multiprocessing.get_all_start_methods()
+        if 'fork' in methods:
+            context = multiprocessing.get_context('fork')
+            dssp_predict.get_predictor(engine=engine)
+        else:
+            context = multiprocessing.get_context('spawn')
+
+        self._pool = context.Pool(workers, initializer=_init_worker, initargs=(engine, threads_per_worker))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def close(self):
+        """Wait for outstanding work to finish and shut down the workers"""
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Shut down the workers immediately"""
+        self._pool.terminate()
+        self._pool.join()
+
+    def imap(self, sequences, raw_vals=False, as_array=False):
+        """
+        Predict DSSP scores for an iterable of sequences, yielding results
+        in input order as soon as they are available.
+
+        At most two chunks per worker are in flight at once, so sequences
+        are read from the iterable only as fast as they are predicted.
+
+        Parameters
+        ----------
+        sequences : iterable of str
+            Amino acid sequences.
+
+        raw_vals : bool
+            Return per-residue probabilities instead of classes.
+
+        as_array : bool
+            Return classes as NumPy int8 arrays instead of lists.
+
+        Yields
+        ------
+        list or np.ndarray
+            The prediction for each sequence, as from predict_dssp().
+        """
+
+        max_in_flight = 2 * self.workers
+
+        # reorder buffer: chunk index -> pending result. Chunks finish in any
+        # order but are always handed back oldest first
+        pending = {}
+        next_chunk = 0
+        submitted = 0
+
+        def submit(index, chunk):
+            args = ([seq.upper() for seq in chunk], raw_vals, as_array, self.max_tokens, self.engine)
+            pending[index] = self._pool.apply_async(_predict_chunk, args)
+
+        chunk = []
+        for seq in sequences:
+            chunk.append(seq)
+            if len(chunk) == self.chunk_size:
+                submit(submitted, chunk)
+                submitted += 1
+                chunk = []
+
+                while len(pending) >= max_in_flight:
+                    yield from pending.pop(next_chunk).get()
+                    next_chunk += 1
+
+        if chunk:
+            submit(submitted, chunk)
+            submitted += 1
+
+        while next_chunk < submitted:
+            yield from pending.pop(next_chunk).get()
+            next_chunk += 1
+
+    def predict(self, sequences, raw_vals=False, as_array=False):
+        """
+        Predict DSSP scores for a list of sequences.
+
+        Parameters
+        ----------
+        sequences : iterable of str
+            Amino acid sequences.
+
+        raw_vals : bool
+            Return per-residue probabilities instead of classes.
+
+        as_array : bool
+            Return classes as NumPy int8 arrays instead of lists.
+
+        Returns
+        -------
+        list
+            One prediction per sequence, in input order.
+        """
+        return list(self.imap(sequences, raw_vals=raw_vals, as_array=as_array))
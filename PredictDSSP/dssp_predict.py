@@ -1,37 +1,462 @@
-import os 
+import os
+import threading
+import collections
+
+import numpy as np
+
 from PredictDSSP import py_predictor_v2
+from PredictDSSP import dssp_tools
+from PredictDSSP import dssp_cache
+from PredictDSSP import dssp_shared
+from PredictDSSP import dssp_profile
+from PredictDSSP.dssp_exceptions import DsspError
+
+# get path to network
+PATH = os.path.dirname(os.path.realpath(__file__))
+
+# selcet the chosen network, kept as separate line of code in
+DEFAULT_NETWORK = 'dssp_2022_01_07_CB_thresh_0p8_hs20_nl2.pt'
+
+# process-wide registry of loaded networks. Keys are (network path, checksum)
+# and values are ready-to-use py_predictor_v2.Predictor objects. All access
+# goes through _SESSION_LOCK so threads never load the same network twice.
+_SESSION_LOCK = threading.RLock()
+_SESSIONS = {}
+
+# cache of network checksums keyed by path, invalidated if the file changes
+_CHECKSUMS = {}
+
+# default bound of the in-memory prediction memo, in residues. Each residue
+# costs 12 bytes of probabilities, so this is roughly 24 MB
+DEFAULT_MEMO_RESIDUES = 2000000
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'max_residues', 'residues', 'entries'])
+
+
+class PredictionMemo():
+    """
+    In-memory least-recently-used store of predicted class probabilities,
+    bounded by the total number of residues held rather than by the number
+    of sequences. Classes, raw values and graphs are all derived from the one
+    stored copy, so predicting and then graphing a sequence runs the network
+    once.
+
+    Stored arrays are read-only; callers are handed copies.
+    """
+
+    def __init__(self, max_residues=DEFAULT_MEMO_RESIDUES):
+        self.max_residues = max_residues
+        self.hits = 0
+        self.misses = 0
+        self.residues = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            values = []
+            for key in keys:
+                value = self._entries.get(key)
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                values.append(value)
+            return values
+
+    def put_many(self, keys, values):
+        with self._lock:
+            for key, value in zip(keys, values):
+                if len(value) > self.max_residues:
+                    continue
+
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.residues -= len(old)
+
+                value = np.array(value, dtype=np.float32)
+                value.setflags(write=False)
+                self._entries[key] = value
+                self.residues += len(value)
+
+            # drop the least recently used entries until back under the bound
+            while self.residues > self.max_residues:
+                _, old = self._entries.popitem(last=False)
+                self.residues -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.residues = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.max_residues, self.residues, len(self._entries))
+
+
+_MEMO = PredictionMemo()
+
+
+def network_path(network=None):
+    """
+    Function that resolves a network name to a full path.
+
+    Parameters
+    ----------
+    network : str or None
+        Either None (use the default network), the filename of a network
+        shipped in the networks directory, or a path to a network file.
+
+    Returns
+    -------
+    str
+        Absolute path to the network file.
+    """
+    if network is None:
+        network = DEFAULT_NETWORK
+
+    # networks shipped with PredictDSSP can be referred to by filename
+    shipped = f'{PATH}/networks/{network}'
+    if os.path.isfile(shipped):
+        return shipped
+
+    return os.path.abspath(network)
+
+
+def network_checksum(path):
+    """
+    Function that returns the sha256 checksum of a network file. The
+    checksum is only recomputed if the file size or modification time
+    changes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the network file.
+
+    Returns
+    -------
+    str
+        Hex digest of the file contents.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _SESSION_LOCK:
+        cached = _CHECKSUMS.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        checksum = dssp_tools.file_checksum(path)
+        _CHECKSUMS[path] = (signature, checksum)
+        return checksum
+
+
+def get_predictor(network=None, engine='torch', precision='fp32', compiled=False):
+    """
+    Function that returns the cached predictor for a network, loading it
+    the first time it is requested. The network is put into evaluation mode
+    with gradients disabled, and is shared by every caller in the process.
+
+    Parameters
+    ----------
+    network : str or None
+        Network to use. See network_path() for accepted values.
+
+    engine : str
+        Inference engine, either 'torch' (default) or 'numpy'. See
+        py_predictor_v2.Predictor.
+
+    precision : str
+        Numerical precision, one of 'fp32' (default), 'bf16' or 'int8'.
+        Reduced precisions need the torch engine. Each precision is loaded
+        (and quantized) once and cached separately.
+
+    compiled : bool
+        Run the torch network as a compiled TorchScript module, which is
+        cached on disk next to the network. Falls back to the eager network
+        if compilation is not possible; check the predictor's compiled
+        attribute. Default = False.
+
+    Returns
+    -------
+    py_predictor_v2.Predictor
+        The loaded predictor.
+    """
+    if engine not in py_predictor_v2.ENGINES:
+        raise DsspError('Engine must be one of %s, not %s' % (', '.join(py_predictor_v2.ENGINES), engine))
+
+    if precision not in py_predictor_v2.PRECISIONS:
+        raise DsspError('Precision must be one of %s, not %s' % (', '.join(py_predictor_v2.PRECISIONS), precision))
+
+    if engine == 'numpy' and precision != 'fp32':
+        raise DsspError('The numpy engine only runs in fp32 precision')
+
+    path = network_path(network)
+    checksum = network_checksum(path)
+    compiled = bool(compiled) and engine == 'torch'
+    key = (path, checksum, engine, precision, compiled)
+
+    with _SESSION_LOCK:
+        predictor = _SESSIONS.get(key)
+        if predictor is None:
+
+            # a changed file at the same path replaces the stale entries
+            for old_key in [k for k in _SESSIONS if k[0] == path and k[1] != checksum]:
+                del _SESSIONS[old_key]
+
+            predictor = py_predictor_v2.Predictor(path, dtype="residues", engine=engine, precision=precision,
+                                                  compiled=compiled)
+            _SESSIONS[key] = predictor
+
+    return predictor
+
+
+def warmup(network=None, engine='torch', compiled=False):
+    """
+    Function that loads a network and runs a short prediction through it so
+    that the one-off setup cost is paid up front rather than on the first
+    real prediction.
+
+    Parameters
+    ----------
+    network : str or None
+        Network to warm up. See network_path() for accepted values.
+
+    engine : str
+        Inference engine to warm up, either 'torch' (default) or 'numpy'.
+
+    compiled : bool
+        Warm up the compiled torch network, compiling it if it is not
+        cached on disk yet. Default = False.
+
+    Returns
+    -------
+    py_predictor_v2.Predictor
+        The loaded predictor.
+    """
+    predictor = get_predictor(network, engine=engine, compiled=compiled)
+    predictor.predict('ACDEFGHIKLMNPQRSTVWY')
+    return predictor
+
+
+def release(network=None):
+    """
+    Function that drops loaded networks from the registry so their memory
+    can be reclaimed. The next prediction will load the network again.
+
+    Parameters
+    ----------
+    network : str or None
+        Network to release. If None, every loaded network is released.
+
+    Returns
+    -------
+    int
+        Number of networks released.
+    """
+    with _SESSION_LOCK:
+        if network is None:
+            released = len(_SESSIONS)
+            _SESSIONS.clear()
+            return released
+
+        path = network_path(network)
+        keys = [k for k in _SESSIONS if k[0] == path]
+        for key in keys:
+            del _SESSIONS[key]
+        return len(keys)
+
+
+def check_probability_dtype(dtype):
+    """
+    Function that validates the dtype requested for returned probabilities.
+
+    Parameters
+    ----------
+    dtype : str or np.dtype
+        One of 'float16', 'float32' or 'float64'.
+
+    Returns
+    -------
+    np.dtype
+        The validated dtype.
+    """
+    try:
+        dtype = np.dtype(dtype)
+    except TypeError:
+        raise DsspError('Invalid probability dtype %s' % (str(dtype)))
+
+    if dtype not in (np.float16, np.float32, np.float64):
+        raise DsspError('Probability dtype must be float16, float32 or float64, not %s' % (dtype.name))
+    return dtype
+
+
+def probabilities_to_classes(value):
+    """
+    Function that converts per-residue class probabilities to DSSP classes
+    (0 = helix, 1 = strand, 2 = coil). Ties go to the lower class.
+
+    Parameters
+    ----------
+    value : np.ndarray
+        Array of shape [sequence length X 3].
+
+    Returns
+    -------
+    np.ndarray
+        int8 array holding the class of each residue.
+    """
+    return np.argmax(value, axis=-1).astype(np.int8)
+
+
+def cache_info():
+    """
+    Function that reports the usage of the in-memory prediction memo.
+
+    Returns
+    -------
+    CacheInfo
+        Named tuple of hits, misses, max_residues, residues (currently held)
+        and entries (sequences currently held).
+    """
+    return _MEMO.info()
+
+
+def cache_clear():
+    """
+    Function that empties the in-memory prediction memo and resets its
+    statistics.
+    """
+    _MEMO.clear()
+
+
+def set_cache_size(max_residues):
+    """
+    Function that sets the bound of the in-memory prediction memo.
+
+    Parameters
+    ----------
+    max_residues : int
+        Maximum total number of residues held. 0 switches the memo off.
+    """
+    if max_residues < 0:
+        raise DsspError('max_residues must be 0 or more')
+    _MEMO.max_residues = int(max_residues)
+    _MEMO.put_many([], [])
+
+
+def _run(predictor, sequences, max_tokens, share_states, steps=None):
+    if share_states:
+        # layers are run by dssp_shared rather than the predictor, so the
+        # whole prediction is recorded as the forward pass
+        with dssp_profile.stage('forward', sum(len(seq) for seq in sequences)):
+            values, run_steps = dssp_shared.predict_shared(predictor.network, sequences, max_tokens=max_tokens)
+        if steps is not None:
+            dssp_shared.add_steps(steps, run_steps)
+        return values
+    if len(sequences) == 1:
+        return [predictor.predict(sequences[0])]
+    return predictor.predict_batch(sequences, max_tokens=max_tokens)
+
+
+def _predict_values(predictor, sequences, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS, network=None,
+                    share_states=False, steps=None):
+    # class probabilities for each sequence, taken from the in-memory memo and
+    # then the on-disk cache (when enabled) before running the network.
+    # share_states needs a predictor on the numpy engine; its step counts for
+    # the sequences actually run are added to steps when given
+    if _MEMO.max_residues == 0 and dssp_cache.active_cache() is None:
+        return _run(predictor, sequences, max_tokens, share_states, steps)
+
+    checksum = network_checksum(network_path(network))
+
+    # reduced precision predictions are kept apart from full precision ones
+    if predictor.precision != 'fp32':
+        checksum = '%s/%s' % (checksum, predictor.precision)
+
+    keys = [(checksum, predictor.engine, seq) for seq in sequences]
+    values = _MEMO.get_many(keys)
+
+    missing = [i for i, value in enumerate(values) if value is None]
+    if not missing:
+        return values
+
+    # a sequence repeated within the call is only looked up and predicted once
+    todo = list(dict.fromkeys(sequences[i] for i in missing))
+    found = {}
+
+    cache = dssp_cache.active_cache()
+    if cache is not None:
+        for seq, value in zip(todo, cache.get_many(todo, checksum)):
+            if value is not None:
+                found[seq] = value
+
+    predict = [seq for seq in todo if seq not in found]
+    if predict:
+        predicted = _run(predictor, predict, max_tokens, share_states, steps)
+        if cache is not None:
+            cache.put_many(predict, predicted, checksum)
+        found.update(zip(predict, predicted))
+
+    _MEMO.put_many([(checksum, predictor.engine, seq) for seq in todo], [found[seq] for seq in todo])
+
+    for i in missing:
+        values[i] = found[sequences[i]]
+
+    return values
+
+
+def _format(value, raw_vals, as_array, dtype):
+    # probabilities are returned as an array in the requested precision. A
+    # copy is always made so callers never share the memo's stored arrays
+    if raw_vals:
+        return value.astype(dtype)
+
+    with dssp_profile.stage('classes', len(value)):
+        classes = probabilities_to_classes(value)
+    if as_array:
+        return classes
+    return classes.tolist()
+
+
+def predict_dssp(sequence, raw_vals=False, as_array=False, dtype=np.float32, engine='torch', precision='fp32',
+                 compiled=False):
+
+    # check the dtype before doing any work
+    dtype = check_probability_dtype(dtype)
+
+    # get the shared predictor, loading the network on first use only
+    my_predictor = get_predictor(engine=engine, precision=precision, compiled=compiled)
 
-def predict_dssp(sequence, raw_vals=False):
-
-    # get path to network
-    PATH = os.path.dirname(os.path.realpath(__file__))
-    
-    # selcet the chosen network, kept as separate line of code in 
-    used_predictor = 'dssp_2022_01_07_CB_thresh_0p8_hs20_nl2.pt'
-    
-    # set location of chosen network
-    predictor_path = f'{PATH}/networks/{used_predictor}'
-    
-    # set predictor value using py_predictor_V2
-    my_predictor = py_predictor_v2.Predictor(predictor_path, 
-                                            dtype="residues")    
     # get values of prediction
-    value = my_predictor.predict(sequence)
-    # make empty list to hold values
-    final_vals = []
-    if raw_vals == False:
-        # append values to the list depending on the probabilities for each value
-        for i in value:
-            highest_val = max(i)
-            if highest_val == i[0]:
-                final_vals.append(0)
-            elif highest_val == i[1]:
-                final_vals.append(1)
-            else:
-                final_vals.append(2)
-        # return the final values based on the probabilities returned from the network
-        return final_vals
-    else:
-        return value
-        
+    value = _predict_values(my_predictor, [sequence])[0]
+    return _format(value, raw_vals, as_array, dtype)
+
+
+def predict_dssp_batch(sequences, raw_vals=False, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS,
+                       as_array=False, dtype=np.float32, engine='torch', share_states=False, precision='fp32',
+                       compiled=False, report=False):
+
+    # check the dtype before doing any work
+    dtype = check_probability_dtype(dtype)
+
+    if share_states and precision != 'fp32':
+        raise DsspError('share_states only runs in fp32 precision')
+
+    # get the shared predictor, loading the network on first use only. State
+    # sharing works on the NumPy copy of the weights
+    my_predictor = get_predictor(engine='numpy' if share_states else engine, precision=precision,
+                                 compiled=compiled)
 
+    # get values of prediction for every sequence in as few forward passes as possible
+    steps = dssp_shared.add_steps({}, {'first_layer_steps': 0, 'shared_steps': 0})
+    values = _predict_values(my_predictor, list(sequences), max_tokens=max_tokens, share_states=share_states,
+                             steps=steps)
+    result = [_format(value, raw_vals, as_array, dtype) for value in values]
+    if report:
+        return result, steps
+    return result
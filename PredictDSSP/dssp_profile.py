@@ -0,0 +1,386 @@
+"""
+Per-stage instrumentation of the prediction pipeline.
+
+The pipeline marks its stages (reading FASTA records, encoding sequences,
+the network forward pass, softmax, class assignment and writing results)
+with stage(). While a profile() is active, each stage records its wall
+time, the number of residues it handled and, optionally, its peak memory
+allocation, aggregated over the run. Outside a profile, stage() returns a
+shared no-op context manager, so instrumentation costs one global lookup.
+
+    with profile() as run:
+        predict_dssp_fasta('proteome.fasta', output_file='scores.csv')
+
+    print(run.text())
+    run.to_json('profile.json')
+
+Stages run in any thread of the process are recorded. Stages run in the
+worker processes of a PredictorPool are not.
+"""
+
+import sys
+import json
+import time
+import threading
+import tracemalloc
+
+# the active Profile, or None. Only one profile is active at a time
+_ACTIVE = None
+_ACTIVE_LOCK = threading.Lock()
+
+
+def peak_rss():
+    """
+    Function that returns the peak resident set size of this process.
+
+    Returns
+    -------
+    int or None
+        Peak RSS in bytes, or None where the resource module does not
+        exist (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class _NullStage():
+    # returned by stage() when no profile is active
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    @property
+    def residues(self):
+        return 0
+
+    @residues.setter
+    def residues(self, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage():
+    # one timed stage of an active profile
+    __slots__ = ('profile', 'name', 'residues', 'start', 'mem_start', 'mem_peak')
+
+    def __init__(self, profile, name, residues):
+        self.profile = profile
+        self.name = name
+        self.residues = residues
+
+    def __enter__(self):
+        self.profile._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        self.profile._exit(self, seconds)
+        return False
+
+
+class StageStats():
+    """
+    Aggregated measurements of one stage.
+
+    Attributes
+    ----------
+    name : str
+        Name of the stage.
+    calls : int
+        Number of times the stage ran.
+    seconds : float
+        Total wall time spent in the stage, including any stages nested in it.
+    residues : int
+        Total residues handled by the stage.
+    peak_bytes : int or None
+        Largest allocation made during a single run of the stage, above
+        what was allocated when it started, as seen by tracemalloc (memory
+        allocated inside torch is not seen). None unless the profile
+        tracks memory.
+    """
+
+    __slots__ = ('name', 'calls', 'seconds', 'residues', 'peak_bytes')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.residues = 0
+        self.peak_bytes = None
+
+    def as_dict(self):
+        """The stage's measurements as a dict"""
+        return {'calls': self.calls,
+                'seconds': self.seconds,
+                'residues': self.residues,
+                'residues_per_second': self.residues / self.seconds if self.seconds > 0 else 0.0,
+                'peak_bytes': self.peak_bytes}
+
+
+class Profile():
+    """
+    Per-stage measurements of one profiled run. Created by profile().
+
+    Attributes
+    ----------
+    stages : dict
+        StageStats for each stage, in the order the stages first ran.
+    seconds : float
+        Wall time of the whole run, so far if it is still running.
+    memory : bool
+        Whether peak allocations are tracked.
+    max_rss_bytes : int or None
+        Peak resident set size of the process at the end of the run, None
+        where it is not available (Windows).
+    """
+
+    def __init__(self, memory=False):
+        self.stages = {}
+        self.memory = memory
+        self.max_rss_bytes = 0
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._start = None
+        self._end = None
+        self._started_tracemalloc = False
+
+    @property
+    def seconds(self):
+        if self._start is None:
+            return 0.0
+        return (self._end if self._end is not None else time.perf_counter()) - self._start
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, stage):
+        if self.memory:
+            # fold the peak so far into the enclosing stage before resetting
+            # it, so the enclosing stage still sees allocations made in this one
+            current, peak = tracemalloc.get_traced_memory()
+            stack = self._stack()
+            if stack:
+                stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+            tracemalloc.reset_peak()
+            stage.mem_start = current
+            stage.mem_peak = current
+            stack.append(stage)
+
+    def _exit(self, stage, seconds):
+        peak_bytes = None
+        if self.memory:
+            peak = max(stage.mem_peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = peak - stage.mem_start
+
+            stack = self._stack()
+            if stack and stack[-1] is stage:
+                stack.pop()
+            if stack:
+                stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+
+        with self._lock:
+            stats = self.stages.get(stage.name)
+            if stats is None:
+                stats = self.stages[stage.name] = StageStats(stage.name)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.residues += stage.residues
+            if peak_bytes is not None:
+                stats.peak_bytes = max(stats.peak_bytes or 0, peak_bytes)
+
+    def _begin(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+
+    def _finish(self):
+        self._end = time.perf_counter()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+        self.max_rss_bytes = peak_rss()
+
+    def as_dict(self):
+        """
+        Returns
+        -------
+        dict
+            'seconds' (the wall time of the run), 'max_rss_bytes' and
+            'stages', with the measurements of each stage.
+        """
+        with self._lock:
+            stages = {name: stats.as_dict() for name, stats in self.stages.items()}
+        return {'seconds': self.seconds, 'max_rss_bytes': self.max_rss_bytes, 'stages': stages}
+
+    def to_json(self, path=None):
+        """
+        The profile as JSON.
+
+        Parameters
+        ----------
+        path : str or None
+            File to write the JSON to. Default = None, only return it.
+
+        Returns
+        -------
+        str
+            The JSON text.
+        """
+        text = json.dumps(self.as_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as fh:
+                fh.write(text + '\n')
+        return text
+
+    def text(self):
+        """
+        Returns
+        -------
+        str
+            A table with one row per stage, slowest first, giving its calls,
+            total time, share of the run time, residues per second and peak
+            allocation. Nested stages are included in the time of the stages
+            around them, so shares can add up to more than 100%.
+        """
+        run = self.as_dict()
+        total = run['seconds']
+
+        lines = ['%-12s %8s %10s %7s %12s %12s %10s' % ('stage', 'calls', 'seconds', '%run', 'residues', 'residues/s',
+                                                        'peak MB')]
+        for name, stats in sorted(run['stages'].items(), key=lambda item: -item[1]['seconds']):
+            peak = '-' if stats['peak_bytes'] is None else '%.1f' % (stats['peak_bytes'] / 1e6)
+            share = 100 * stats['seconds'] / total if total > 0 else 0.0
+            lines.append('%-12s %8i %10.4f %6.1f%% %12i %12.0f %10s' % (name, stats['calls'], stats['seconds'], share,
+                                                                       stats['residues'],
+                                                                       stats['residues_per_second'], peak))
+
+        rss = '-' if run['max_rss_bytes'] is None else '%.1f' % (run['max_rss_bytes'] / 1e6)
+        lines.append('run: %.4f s, peak RSS %s MB' % (total, rss))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.text()
+
+
+class profile():
+    """
+    Context manager that profiles the prediction pipeline while it is active.
+
+    Parameters
+    ----------
+    memory : bool
+        Also track the peak allocation of each stage with tracemalloc. This
+        slows Python code down noticeably, so it is off by default.
+
+    Returns
+    -------
+    Profile
+        The measurements, from ``with profile() as run``.
+    """
+
+    def __init__(self, memory=False):
+        self._profile = Profile(memory=memory)
+
+    def __enter__(self):
+        global _ACTIVE
+
+        with _ACTIVE_LOCK:
+            if _ACTIVE is not None:
+                raise RuntimeError('A profile is already active')
+            self._profile._begin()
+            _ACTIVE = self._profile
+        return self._profile
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _ACTIVE
+
+        with _ACTIVE_LOCK:
+            _ACTIVE = None
+        self._profile._finish()
+        return False
+
+
+def enabled():
+    """
+    Returns
+    -------
+    bool
+        Whether a profile is active.
+    """
+    return _ACTIVE is not None
+
+
+def stage(name, residues=0):
+    """
+    Function that marks a stage of the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    residues : int
+        Number of residues the stage handles. Can also be set on the
+        returned object inside the with block.
+
+    Returns
+    -------
+    context manager
+        Records the stage in the active profile, or does nothing if no
+        profile is active.
+    """
+    active = _ACTIVE
+    if active is None:
+        return _NULL_STAGE
+    return _Stage(active, name, residues)
+
+
+def timed_iter(iterable, name, residues=None):
+    """
+    Generator that records the time taken to produce each item of an
+    iterable (not the time the consumer spends on it) as a stage.
+
+    Parameters
+    ----------
+    iterable : iterable
+        The items.
+
+    name : str
+        Name of the stage.
+
+    residues : callable or None
+        Function giving the number of residues in an item.
+
+    Yields
+    ------
+    The items of iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as timed:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            if residues is not None:
+                timed.residues = residues(item)
+        yield item
@@ -0,0 +1,239 @@
+"""
+Deep mutational scanning of DSSP predictions.
+
+scan_mutations() predicts every single-residue substitution of a sequence
+without running each variant through the network from scratch. For a
+substitution at position p, the first-layer forward states before p and
+the first-layer backward states after p are those of the wild type, so
+they are computed once and shared; each variant only recomputes the first
+layer from p onwards (forward) and from p backwards (backward). Every
+layer above the first sees a changed input at every position and is
+recomputed in full, but for many variants at once, with the output layer
+accumulated as the last layer runs so its hidden states are never stored.
+
+Variants are processed in groups of neighbouring positions whose working
+memory is bounded by max_tokens. The result for each variant matches a
+full forward pass of the mutated sequence to within floating point
+rounding.
+"""
+
+import collections
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import encode_sequence
+from PredictDSSP import numpy_brnn
+from PredictDSSP.dssp_exceptions import DsspError
+
+# every substitution is scored against these residues by default
+DEFAULT_ALPHABET = encode_sequence.REV_ONE_HOT
+
+# bound on variants X sequence length processed together. Each unit costs
+# about 200 bytes, so the default uses roughly 200 MB
+DEFAULT_MAX_TOKENS = 1 << 20
+
+ScanResult = collections.namedtuple('ScanResult', ['positions', 'alphabet', 'probabilities', 'classes_changed',
+                                                   'first_changed', 'last_changed', 'mean_abs_change',
+                                                   'wild_type'])
+
+
+def _cell(gates, c, H):
+    # one LSTM step from precomputed gates. PyTorch gate order is input,
+    # forget, cell, output
+    i = numpy_brnn.sigmoid(gates[..., :H])
+    f = numpy_brnn.sigmoid(gates[..., H:2*H])
+    g = np.tanh(gates[..., 2*H:3*H])
+    o = numpy_brnn.sigmoid(gates[..., 3*H:])
+
+    c = f * c + i * g
+    return o * np.tanh(c), c
+
+
+def _first_layer_states(network, index):
+    # wild-type hidden and cell states of the first layer, both directions
+    # in sequence order: arrays of shape [2 X length X hidden]
+    w_ih, w_hh, bias = network.layers[0]
+    H = network.hidden_size
+    L = len(index)
+
+    gates_x = np.stack([w_ih[0][index], w_ih[1][index[::-1]]]) + bias[:, None]
+
+    h_out = np.empty((2, L, H), dtype=np.float32)
+    c_out = np.empty((2, L, H), dtype=np.float32)
+    h = np.zeros((2, 1, H), dtype=np.float32)
+    c = np.zeros((2, 1, H), dtype=np.float32)
+
+    for s in range(L):
+        h, c = _cell(gates_x[:, s:s + 1] + np.matmul(h, w_hh), c, H)
+        h_out[0, s], c_out[0, s] = h[0, 0], c[0, 0]
+        h_out[1, L - 1 - s], c_out[1, L - 1 - s] = h[1, 0], c[1, 0]
+
+    return h_out, c_out
+
+
+def _first_layer_variants(network, mutated, positions, wt_h, wt_c):
+    # first-layer output [length X variants X 2*hidden] of a group of
+    # variants, reusing the wild-type states that a substitution cannot change.
+    # Arrays are kept time-major so each timestep reads contiguous memory
+    w_ih, w_hh, bias = network.layers[0]
+    H = network.hidden_size
+    B, L = mutated.shape
+    start, stop = positions.min(), positions.max() + 1
+
+    out = np.empty((L, B, 2 * H), dtype=np.float32)
+
+    # forward direction: unchanged before the first substitution
+    out[:start, :, :H] = wt_h[0, :start, None]
+    h = np.tile(wt_h[0, start - 1] if start > 0 else np.zeros(H, dtype=np.float32), (B, 1))
+    c = np.tile(wt_c[0, start - 1] if start > 0 else np.zeros(H, dtype=np.float32), (B, 1))
+    for t in range(start, L):
+        h, c = _cell(w_ih[0][mutated[:, t]] + bias[0] + np.matmul(h, w_hh[0]), c, H)
+        out[t, :, :H] = h
+
+    # backward direction: unchanged after the last substitution
+    out[stop:, :, H:] = wt_h[1, stop:, None]
+    h = np.tile(wt_h[1, stop] if stop < L else np.zeros(H, dtype=np.float32), (B, 1))
+    c = np.tile(wt_c[1, stop] if stop < L else np.zeros(H, dtype=np.float32), (B, 1))
+    for t in range(stop - 1, -1, -1):
+        h, c = _cell(w_ih[1][mutated[:, t]] + bias[1] + np.matmul(h, w_hh[1]), c, H)
+        out[t, :, H:] = h
+
+    return out
+
+
+def _upper_layer(network, layer, x, last):
+    # run a full bidirectional layer over x [length X batch X 2*hidden]. For
+    # the last layer the output layer is applied as it goes and the logits
+    # [length X batch X classes] are returned instead of the hidden states
+    w_ih, w_hh, bias = network.layers[layer]
+    H = network.hidden_size
+    L, B, _ = x.shape
+
+    if last:
+        out = np.empty((L, B, network.num_classes), dtype=np.float32)
+        out[:] = network.fc_bias
+        fc = np.stack([network.fc_weight[:H], network.fc_weight[H:]])
+    else:
+        out = np.empty((L, B, 2 * H), dtype=np.float32)
+
+    h = np.zeros((2, B, H), dtype=np.float32)
+    c = np.zeros((2, B, H), dtype=np.float32)
+
+    for s in range(L):
+        tf, tb = s, L - 1 - s
+        h, c = _cell(np.matmul(x[[tf, tb]], w_ih) + bias[:, None] + np.matmul(h, w_hh), c, H)
+
+        if last:
+            contribution = np.matmul(h, fc)
+            out[tf] += contribution[0]
+            out[tb] += contribution[1]
+        else:
+            out[tf, :, :H] = h[0]
+            out[tb, :, H:] = h[1]
+
+    return out
+
+
+def _probabilities(network, first_layer):
+    x = first_layer
+    for layer in range(1, network.num_layers):
+        x = _upper_layer(network, layer, x, last=layer == network.num_layers - 1)
+
+    # single layer networks go straight to the output layer
+    if network.num_layers == 1:
+        x = np.matmul(x, network.fc_weight) + network.fc_bias
+    return numpy_brnn.softmax(x)
+
+
+def scan_mutations(sequence, positions=None, alphabet=DEFAULT_ALPHABET, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    Function that predicts the effect of every single-residue substitution
+    at the chosen positions of a sequence.
+
+    Parameters
+    ----------
+    sequence : str
+        Valid amino acid sequence (upper case).
+
+    positions : list of int or None
+        0-based positions to mutate. Default = None, every position.
+
+    alphabet : str
+        Residues to substitute in at each position. Default = the 20
+        standard amino acids, 'ACDEFGHIKLMNPQRSTVWY'.
+
+    max_tokens : int
+        Bound on (variants X sequence length) processed together, which
+        bounds memory use. Default = 1048576 (about 200 MB).
+
+    Returns
+    -------
+    ScanResult
+        Named tuple with
+        positions : np.ndarray, the positions scanned;
+        alphabet : str, the substituted residues;
+        probabilities : np.ndarray [positions X alphabet X 3], the class
+        probabilities of the mutated residue in each variant;
+        classes_changed : np.ndarray [positions X alphabet], the number of
+        residues anywhere in the sequence whose class changes;
+        first_changed, last_changed : np.ndarray [positions X alphabet],
+        the first and last residue whose class changes (-1 if none);
+        mean_abs_change : np.ndarray [positions X alphabet], the mean
+        absolute change in probability over all residues and classes;
+        wild_type : np.ndarray [length X 3], the wild-type probabilities.
+        Substituting a residue for itself gives the wild type.
+    """
+    network = dssp_predict.get_predictor(engine='numpy').network
+
+    index = encode_sequence.sequence_to_index(sequence)
+    substitutes = encode_sequence.sequence_to_index(alphabet)
+    L, A = len(index), len(substitutes)
+
+    if L == 0:
+        raise DsspError('Cannot scan an empty sequence')
+
+    if positions is None:
+        positions = np.arange(L)
+    positions = np.asarray(positions, dtype=np.int64)
+    if positions.ndim != 1 or (positions.size and (positions.min() < 0 or positions.max() >= L)):
+        raise DsspError('positions must be a list of 0-based positions in the sequence')
+
+    wt_h, wt_c = _first_layer_states(network, index)
+    wild_type = _probabilities(network, np.concatenate([wt_h[0], wt_h[1]], axis=-1)[:, None])[:, 0]
+    wt_classes = wild_type.argmax(axis=1)
+
+    P = len(positions)
+    probabilities = np.tile(wild_type[positions][:, None], (1, A, 1)).astype(np.float32)
+    classes_changed = np.zeros((P, A), dtype=np.int64)
+    first_changed = np.full((P, A), -1, dtype=np.int64)
+    last_changed = np.full((P, A), -1, dtype=np.int64)
+    mean_abs_change = np.zeros((P, A), dtype=np.float32)
+
+    # every real substitution, ordered by position so each group covers a
+    # short stretch of the sequence and shares as much wild-type state as possible
+    rows, cols = np.nonzero(substitutes[None, :] != index[positions][:, None])
+    order = np.argsort(positions[rows], kind='stable')
+    rows, cols = rows[order], cols[order]
+
+    group = max(1, max_tokens // L)
+    for start in range(0, len(rows), group):
+        r, a = rows[start:start + group], cols[start:start + group]
+        p = positions[r]
+
+        mutated = np.tile(index, (len(r), 1))
+        mutated[np.arange(len(r)), p] = substitutes[a]
+
+        values = _probabilities(network, _first_layer_variants(network, mutated, p, wt_h, wt_c)).transpose(1, 0, 2)
+
+        changed = values.argmax(axis=2) != wt_classes
+        any_changed = changed.any(axis=1)
+
+        probabilities[r, a] = values[np.arange(len(r)), p]
+        classes_changed[r, a] = changed.sum(axis=1)
+        first_changed[r, a] = np.where(any_changed, changed.argmax(axis=1), -1)
+        last_changed[r, a] = np.where(any_changed, L - 1 - changed[:, ::-1].argmax(axis=1), -1)
+        mean_abs_change[r, a] = np.abs(values - wild_type).mean(axis=(1, 2))
+
+    return ScanResult(positions, alphabet, probabilities, classes_changed, first_changed, last_changed,
+                      mean_abs_change, wild_type)
@@ -0,0 +1,754 @@
+"""
+Local HTTP prediction service with dynamic micro-batching.
+
+DsspServer is a small asyncio HTTP/1.1 server that keeps the network loaded
+for its whole lifetime. Requests that arrive close together are collected
+into micro-batches by MicroBatcher: a batch is run as soon as it holds
+max_batch_size sequences, or max_wait_ms after its first request arrived,
+whichever comes first. Batches are predicted in a worker thread so the
+event loop keeps accepting requests meanwhile.
+
+The request queue is bounded. When it is full, new requests are rejected
+straight away with 503 Service Unavailable and a Retry-After header rather
+than queueing without limit, so a client (or load tester) that sends faster
+than the network can predict sees backpressure instead of growing latency.
+
+Endpoints
+---------
+POST /predict
+    JSON body {"sequences": ["MKV...", ...]} or {"sequence": "MKV..."}, with
+    optional "raw_vals": true to also return the class probabilities. The
+    response is streamed back with chunked transfer encoding, as JSON,
+
+        {"predictions": [{"classes": [2, 2, 0, ...], "probabilities": [[...], ...]}, ...]}
+
+    or, with ?format=binary or an "Accept: application/octet-stream" header,
+    as binary: b'DSSP', the uint32 number of sequences, then for each
+    sequence its uint32 length, its int8 classes and, if raw_vals is set,
+    its float32 [length X 3] probabilities (all little-endian).
+
+GET /metrics
+    Throughput, queue depth, batch sizes and a latency histogram, in the
+    Prometheus text format, or as JSON with ?format=json.
+
+GET /health
+    {"status": "ok"} once the network is loaded.
+"""
+
+import json
+import time
+import struct
+import asyncio
+import collections
+import concurrent.futures
+import urllib.parse
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import encode_sequence
+from PredictDSSP import py_predictor_v2
+from PredictDSSP.dssp_exceptions import DsspError
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+
+# a batch is run once it holds this many sequences...
+DEFAULT_MAX_BATCH_SIZE = 64
+
+# ...or this long after its first request arrived
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# requests waiting for a batch before new ones are rejected
+DEFAULT_MAX_QUEUE = 1024
+
+# largest request body accepted
+DEFAULT_MAX_BODY_BYTES = 16 << 20
+
+# upper bounds of the histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+# throughput is reported over this many recent seconds, as well as overall
+THROUGHPUT_WINDOW = 60.0
+
+BINARY_MAGIC = b'DSSP'
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+            503: 'Service Unavailable'}
+
+
+class QueueFull(Exception):
+    """Raised by MicroBatcher.submit() when the request queue is full"""
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Histogram():
+    """
+    A cumulative histogram with fixed bucket upper bounds, as used by
+    Prometheus.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add one observation"""
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        """
+        Returns
+        -------
+        dict
+            'buckets' mapping each upper bound ('+Inf' last) to the number of
+            observations at or below it, plus the 'count' and 'sum'.
+        """
+        cumulative = np.cumsum(self.counts).tolist()
+        buckets = collections.OrderedDict((str(b), c) for b, c in zip(self.buckets, cumulative))
+        buckets['+Inf'] = cumulative[-1]
+        return {'buckets': buckets, 'count': self.count, 'sum': self.sum}
+
+    def prometheus(self, name, help_text):
+        """The histogram in the Prometheus text format"""
+        lines = ['# HELP %s %s' % (name, help_text), '# TYPE %s histogram' % (name)]
+        for bound, count in self.as_dict()['buckets'].items():
+            lines.append('%s_bucket{le="%s"} %i' % (name, bound, count))
+        lines.append('%s_sum %s' % (name, repr(float(self.sum))))
+        lines.append('%s_count %i' % (name, self.count))
+        return lines
+
+
+class ServiceMetrics():
+    """
+    Counters and histograms describing a running service.
+
+    Attributes
+    ----------
+    requests, sequences, residues : int
+        Prediction requests answered, and the sequences and residues in them.
+    rejected : int
+        Requests turned away because the queue was full.
+    errors : int
+        Requests that failed with a client or server error.
+    batches : int
+        Micro-batches run through the network.
+    latency_ms : Histogram
+        Time from receiving a prediction request to sending its last byte.
+    batch_sequences : Histogram
+        Number of sequences in each micro-batch.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.sequences = 0
+        self.residues = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batch_sequences = Histogram(BATCH_SIZE_BUCKETS)
+
+        # (time, sequences, residues) of each recent batch, for windowed throughput
+        self._recent = collections.deque()
+
+    def record_batch(self, sequences, residues):
+        """Record a micro-batch of predictions"""
+        now = time.time()
+        self.batches += 1
+        self.sequences += sequences
+        self.residues += residues
+        self.batch_sequences.observe(sequences)
+
+        self._recent.append((now, sequences, residues))
+        while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+    def snapshot(self, queue_depth=0):
+        """
+        Parameters
+        ----------
+        queue_depth : int
+            Number of requests currently waiting for a batch.
+
+        Returns
+        -------
+        dict
+            Every counter and histogram, with the throughput in sequences
+            and residues per second since the start and over the last minute.
+        """
+        now = time.time()
+        uptime = max(now - self.started, 1e-9)
+        window = min(THROUGHPUT_WINDOW, uptime)
+        recent = [entry for entry in self._recent if entry[0] >= now - THROUGHPUT_WINDOW]
+
+        return {'uptime_seconds': uptime,
+                'requests': self.requests,
+                'sequences': self.sequences,
+                'residues': self.residues,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'batches': self.batches,
+                'queue_depth': queue_depth,
+                'sequences_per_second': self.sequences / uptime,
+                'residues_per_second': self.residues / uptime,
+                'recent_sequences_per_second': sum(entry[1] for entry in recent) / window,
+                'recent_residues_per_second': sum(entry[2] for entry in recent) / window,
+                'latency_ms': self.latency_ms.as_dict(),
+                'batch_sequences': self.batch_sequences.as_dict()}
+
+    def prometheus(self, queue_depth=0):
+        """Every metric in the Prometheus text format"""
+        snapshot = self.snapshot(queue_depth)
+        lines = []
+        for name, kind, help_text in (('requests', 'counter', 'Prediction requests answered'),
+                                      ('sequences', 'counter', 'Sequences predicted'),
+                                      ('residues', 'counter', 'Residues predicted'),
+                                      ('rejected', 'counter', 'Requests rejected because the queue was full'),
+                                      ('errors', 'counter', 'Requests that failed'),
+                                      ('batches', 'counter', 'Micro-batches run'),
+                                      ('queue_depth', 'gauge', 'Requests waiting for a batch'),
+                                      ('recent_sequences_per_second', 'gauge', 'Sequences per second over the last minute'),
+                                      ('recent_residues_per_second', 'gauge', 'Residues per second over the last minute'),
+                                      ('uptime_seconds', 'gauge', 'Seconds since the service started')):
+            metric = 'dssp_%s%s' % (name, '_total' if kind == 'counter' else '')
+            lines += ['# HELP %s %s' % (metric, help_text), '# TYPE %s %s' % (metric, kind),
+                      '%s %s' % (metric, snapshot[name])]
+
+        lines += self.latency_ms.prometheus('dssp_request_latency_ms', 'Prediction request latency in milliseconds')
+        lines += self.batch_sequences.prometheus('dssp_batch_sequences', 'Sequences per micro-batch')
+        return '\n'.join(lines) + '\n'
+
+
+class _Pending():
+    # one request waiting for its predictions
+    __slots__ = ('sequences', 'future')
+
+    def __init__(self, sequences, future):
+        self.sequences = sequences
+        self.future = future
+
+
+class MicroBatcher():
+    """
+    Collects concurrent prediction requests into micro-batches.
+
+    Attributes
+    ----------
+    max_batch_size : int
+        Maximum number of sequences per batch. A single request with more
+        sequences than this is run as a batch of its own.
+    max_wait_ms : float
+        Longest time a batch waits for more requests after its first one.
+    max_queue : int
+        Maximum number of requests waiting for a batch.
+    metrics : ServiceMetrics
+        Metrics the batches are recorded in.
+    """
+
+    def __init__(self, predict, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS,
+                 max_queue=DEFAULT_MAX_QUEUE, metrics=None):
+        """
+        Parameters
+        ----------
+        predict : callable
+            Function that takes a list of sequences and returns a list with
+            the [length X 3] probabilities of each. It is called from a
+            worker thread, one batch at a time.
+
+        max_batch_size, max_wait_ms, max_queue
+            See the class attributes.
+
+        metrics : ServiceMetrics or None
+            Metrics to record batches in. Default = None, a new instance.
+        """
+        if max_batch_size < 1 or max_queue < 1 or max_wait_ms < 0:
+            raise DsspError('max_batch_size and max_queue must be at least 1 and max_wait_ms at least 0')
+
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = float(max_wait_ms)
+        self.max_queue = int(max_queue)
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
+
+        self._predict = predict
+        self._queue = None
+        self._held = None
+        self._task = None
+        self._executor = None
+
+    @property
+    def depth(self):
+        """Number of requests waiting for a batch"""
+        if self._queue is None:
+            return 0
+        return self._queue.qsize() + (self._held is not None)
+
+    async def start(self):
+        """Start collecting batches. Must be called from the event loop"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='dssp-batch')
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop collecting batches, failing any requests still waiting"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        waiting = [self._held] if self._held is not None else []
+        self._held = None
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        for pending in waiting:
+            if not pending.future.done():
+                pending.future.set_exception(DsspError('The service is shutting down'))
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, sequences):
+        """
+        Queue sequences for prediction and wait for the result.
+
+        Parameters
+        ----------
+        sequences : list of str
+            Valid upper case amino acid sequences.
+
+        Returns
+        -------
+        list of np.ndarray
+            The [length X 3] probabilities of each sequence.
+
+        Raises
+        ------
+        QueueFull
+            If max_queue requests are already waiting.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_Pending(sequences, future))
+        except asyncio.QueueFull:
+            raise QueueFull()
+        return await future
+
+    async def _next_batch(self):
+        # the first request waits as long as it takes; the rest of the batch
+        # is whatever arrives within max_wait_ms of it
+        loop = asyncio.get_running_loop()
+
+        if self._held is not None:
+            first, self._held = self._held, None
+        else:
+            first = await self._queue.get()
+
+        batch = [first]
+        size = len(first.sequences)
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while size < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                pending = self._queue.get_nowait()
+
+            if size + len(pending.sequences) > self.max_batch_size:
+                # does not fit, so it starts the next batch
+                self._held = pending
+                break
+
+            batch.append(pending)
+            size += len(pending.sequences)
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            sequences = [seq for pending in batch for seq in pending.sequences]
+
+            try:
+                values = await loop.run_in_executor(self._executor, self._predict, sequences)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0].future.done():
+                        batch[0].future.set_exception(e)
+                else:
+                    await self._run_alone(batch)
+                continue
+
+            self.metrics.record_batch(len(sequences), sum(len(seq) for seq in sequences))
+
+            start = 0
+            for pending in batch:
+                end = start + len(pending.sequences)
+                if not pending.future.done():
+                    pending.future.set_result(values[start:end])
+                start = end
+
+    async def _run_alone(self, batch):
+        # after a batch failed, runs each of its requests on its own so that
+        # only the request that caused the error fails
+        loop = asyncio.get_running_loop()
+        for pending in batch:
+            if pending.future.done():
+                continue
+            try:
+                values = await loop.run_in_executor(self._executor, self._predict, pending.sequences)
+            except Exception as e:
+                pending.future.set_exception(e)
+                continue
+
+            self.metrics.record_batch(len(pending.sequences), sum(len(seq) for seq in pending.sequences))
+            pending.future.set_result(values)
+
+
+def _json_chunks(values, raw_vals):
+    # the JSON response, one sequence at a time
+    yield b'{"predictions": ['
+    for i, value in enumerate(values):
+        entry = {'classes': dssp_predict.probabilities_to_classes(value).tolist()}
+        if raw_vals:
+            entry['probabilities'] = value.tolist()
+        yield (b', ' if i else b'') + json.dumps(entry).encode('utf-8')
+    yield b']}'
+
+
+def _binary_chunks(values, raw_vals):
+    # the binary response, one sequence at a time
+    yield BINARY_MAGIC + struct.pack('<I', len(values))
+    for value in values:
+        chunk = struct.pack('<I', len(value)) + dssp_predict.probabilities_to_classes(value).tobytes()
+        if raw_vals:
+            chunk += np.ascontiguousarray(value, dtype='<f4').tobytes()
+        yield chunk
+
+
+class DsspServer():
+    """
+    An HTTP prediction service that keeps the network loaded and predicts
+    concurrent requests together. See the module documentation for the
+    endpoints.
+
+    Usage:
+
+    >>> server = DsspServer(port=8000, max_batch_size=64, max_wait_ms=5)
+    >>> server.run()
+
+    or, from running asyncio code, ``await server.start()`` and
+    ``await server.close()``.
+
+    Attributes
+    ----------
+    host : str
+        Address the server listens on.
+    port : int
+        Port the server listens on. If 0 was requested, the port picked by
+        the operating system once started.
+    batcher : MicroBatcher
+        The request batcher.
+    metrics : ServiceMetrics
+        The service metrics.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue=DEFAULT_MAX_QUEUE, max_body_bytes=DEFAULT_MAX_BODY_BYTES,
+                 network=None, engine='torch', compiled=False, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS):
+        """
+        Parameters
+        ----------
+        host : str
+            Address to listen on. Default = '127.0.0.1', this machine only.
+
+        port : int
+            Port to listen on, or 0 for any free port. Default = 8000.
+
+        max_batch_size : int
+            Maximum number of sequences predicted together. Default = 64.
+
+        max_wait_ms : float
+            Longest time a request waits for others to join its batch.
+            Default = 5.
+
+        max_queue : int
+            Maximum number of requests waiting for a batch. Further requests
+            get a 503 response. Default = 1024.
+
+        max_body_bytes : int
+            Largest request body accepted. Default = 16 MiB.
+
+        network : str or None
+            Network to predict with. See dssp_predict.network_path().
+
+        engine : str
+            Inference engine, 'torch' (default) or 'numpy'.
+
+        compiled : bool
+            Run the torch network as a compiled TorchScript module.
+
+        max_tokens : int
+            Maximum number of padded residues per forward pass.
+        """
+        self.host = host
+        self.port = port
+        self.max_body_bytes = int(max_body_bytes)
+        self.metrics = ServiceMetrics()
+
+        self._network = network
+        self._engine = engine
+        self._compiled = compiled
+        self._max_tokens = max_tokens
+        self._predictor = None
+        self._server = None
+
+        self.batcher = MicroBatcher(self._predict, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                    max_queue=max_queue, metrics=self.metrics)
+
+    def _predict(self, sequences):
+        return dssp_predict._predict_values(self._predictor, sequences, max_tokens=self._max_tokens,
+                                            network=self._network)
+
+    async def start(self):
+        """Load the network and start listening"""
+        loop = asyncio.get_running_loop()
+
+        # loading and warming up the network can take a while, so keep it off the event loop
+        self._predictor = await loop.run_in_executor(
+            None, lambda: dssp_predict.warmup(self._network, engine=self._engine, compiled=self._compiled))
+
+        await self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stop listening and fail any requests still waiting"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.close()
+
+    async def serve_forever(self):
+        """Start the server and run until cancelled"""
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def run(self):
+        """Run the server until interrupted (Ctrl-C)"""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle(self, reader, writer):
+        # one connection, which may carry several requests (keep-alive)
+        try:
+            while True:
+                request = await self._read_request(reader, writer)
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._dispatch(writer, method, path, query, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader, writer):
+        # returns (method, path, query, headers, body), or None at the end of the connection
+        try:
+            line = await reader.readline()
+            if not line:
+                return None
+
+            parts = line.decode('latin-1').split()
+            if len(parts) != 3:
+                raise _HttpError(400, 'Malformed request line')
+            method, target, _ = parts
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if 'chunked' in headers.get('transfer-encoding', '').lower():
+                raise _HttpError(411, 'Chunked request bodies are not supported, send a Content-Length')
+
+            length = int(headers.get('content-length', 0))
+            if length > self.max_body_bytes:
+                raise _HttpError(413, 'Request body larger than %i bytes' % (self.max_body_bytes))
+            body = await reader.readexactly(length) if length else b''
+
+        except _HttpError as e:
+            await self._error(writer, e.status, str(e), keep_alive=False)
+            return None
+        except (ValueError, asyncio.LimitOverrunError):
+            await self._error(writer, 400, 'Malformed request', keep_alive=False)
+            return None
+
+        url = urllib.parse.urlsplit(target)
+        return method.upper(), url.path, urllib.parse.parse_qs(url.query), headers, body
+
+    async def _dispatch(self, writer, method, path, query, headers, body, keep_alive):
+        if path == '/predict':
+            if method != 'POST':
+                return await self._error(writer, 405, 'Use POST for /predict', keep_alive)
+            return await self._handle_predict(writer, query, headers, body, keep_alive)
+
+        if path == '/metrics' and method == 'GET':
+            if query.get('format', [''])[0] == 'json':
+                return await self._respond(writer, 200, 'application/json',
+                                           json.dumps(self.metrics.snapshot(self.batcher.depth)).encode('utf-8'),
+                                           keep_alive)
+            return await self._respond(writer, 200, 'text/plain; version=0.0.4',
+                                       self.metrics.prometheus(self.batcher.depth).encode('utf-8'), keep_alive)
+
+        if path == '/health' and method == 'GET':
+            return await self._respond(writer, 200, 'application/json', b'{"status": "ok"}', keep_alive)
+
+        return await self._error(writer, 404, 'No endpoint %s' % (path), keep_alive)
+
+    async def _handle_predict(self, writer, query, headers, body, keep_alive):
+        start = time.perf_counter()
+
+        try:
+            sequences, raw_vals = self._parse_predict(body)
+        except _HttpError as e:
+            self.metrics.errors += 1
+            return await self._error(writer, e.status, str(e), keep_alive)
+
+        try:
+            values = await self.batcher.submit(sequences)
+        except QueueFull:
+            self.metrics.rejected += 1
+            return await self._error(writer, 503, 'Too many requests queued, try again shortly', keep_alive,
+                                     extra_headers={'Retry-After': '1'})
+        except Exception as e:
+            self.metrics.errors += 1
+            return await self._error(writer, 500, 'Prediction failed: %s' % (str(e)), keep_alive)
+
+        binary = (query.get('format', [''])[0] == 'binary'
+                  or 'application/octet-stream' in headers.get('accept', ''))
+        if binary:
+            await self._stream(writer, 'application/octet-stream', _binary_chunks(values, raw_vals), keep_alive)
+        else:
+            await self._stream(writer, 'application/json', _json_chunks(values, raw_vals), keep_alive)
+
+        self.metrics.requests += 1
+        self.metrics.latency_ms.observe((time.perf_counter() - start) * 1000)
+
+    def _parse_predict(self, body):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise _HttpError(400, 'Request body must be JSON')
+
+        if not isinstance(request, dict):
+            raise _HttpError(400, 'Request body must be a JSON object')
+
+        if 'sequence' in request:
+            sequences = [request['sequence']]
+        else:
+            sequences = request.get('sequences')
+
+        if not isinstance(sequences, list) or not all(isinstance(seq, str) for seq in sequences):
+            raise _HttpError(400, 'Send "sequence" as a string or "sequences" as a list of strings')
+
+        sequences = [seq.upper() for seq in sequences]
+        for i, seq in enumerate(sequences):
+            if len(seq) == 0:
+                raise _HttpError(400, 'Sequence %i is empty' % (i))
+            try:
+                encode_sequence.sequence_to_index(seq)
+            except ValueError as e:
+                raise _HttpError(400, 'Sequence %i: %s' % (i, str(e)))
+
+        return sequences, bool(request.get('raw_vals', False))
+
+    async def _respond(self, writer, status, content_type, body, keep_alive, extra_headers=None):
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body)),
+                   'Connection': 'keep-alive' if keep_alive else 'close'}
+        headers.update(extra_headers or {})
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _stream(self, writer, content_type, chunks, keep_alive):
+        # chunked transfer encoding, waiting for slow clients between chunks
+        headers = {'Content-Type': content_type, 'Transfer-Encoding': 'chunked',
+                   'Connection': 'keep-alive' if keep_alive else 'close'}
+        writer.write(self._head(200, headers))
+        for chunk in chunks:
+            if chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _error(self, writer, status, message, keep_alive, extra_headers=None):
+        body = json.dumps({'error': message}).encode('utf-8')
+        await self._respond(writer, status, 'application/json', body, keep_alive, extra_headers)
+
+    @staticmethod
+    def _head(status, headers):
+        lines = ['HTTP/1.1 %i %s' % (status, _REASONS.get(status, ''))]
+        lines += ['%s: %s' % (name, value) for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, **kwargs):
+    """
+    Function that runs a DsspServer until interrupted.
+
+    Parameters
+    ----------
+    host : str
+        Address to listen on. Default = '127.0.0.1'.
+
+    port : int
+        Port to listen on. Default = 8000.
+
+    **kwargs
+        Other DsspServer options.
+    """
+    DsspServer(host=host, port=port, **kwargs).run()
@@ -0,0 +1,293 @@
+"""
+Prefix and suffix state sharing for families of related sequences.
+
+The forward direction of the first LSTM layer at position t depends only on
+residues 0..t, and the reverse direction only on residues t..end. Isoforms,
+tagged constructs and truncations that share an N-terminal prefix therefore
+share their first-layer forward states along it, and those that share a
+C-terminal suffix share their reverse states.
+
+Sorting the sequences and taking the longest common prefix (LCP) of each
+neighbouring pair gives a compressed prefix trie: the LCP with the previous
+sequence is the depth at which a sequence branches off the trie. The first
+layer is then run over all sequences in lockstep, one position at a time,
+and each sequence only computes the positions below its branch point,
+starting from the state of the sequence that computed the shared part. The
+reverse direction does the same over the reversed sequences (a suffix
+trie). Layers above the first see both directions and are run in full.
+
+Results match the unshared computation to within floating point rounding.
+"""
+
+import numpy as np
+
+from PredictDSSP import encode_sequence
+from PredictDSSP import numpy_brnn
+from PredictDSSP import py_predictor_v2
+
+
+def _lcp(a, b):
+    # length of the longest common prefix of two uint8 arrays
+    m = min(len(a), len(b))
+    differ = np.flatnonzero(a[:m] != b[:m])
+    return int(differ[0]) if differ.size else m
+
+
+def branch_points(indices):
+    """
+    Function that builds a compressed prefix trie over encoded sequences.
+
+    Parameters
+    ----------
+    indices : list of np.ndarray
+        Encoded sequences (uint8 residue indices).
+
+    Returns
+    -------
+    tuple
+        (order, starts, owners). order lists the sequences in sorted order.
+        starts[k] is the depth at which the k-th sequence in that order
+        branches off the trie: positions below it are shared with earlier
+        sequences. owners[k] is the position in order of the sequence that
+        computes position starts[k] - 1, whose state the k-th sequence
+        starts from (-1 if starts[k] is 0).
+    """
+    order = sorted(range(len(indices)), key=lambda i: indices[i].tobytes())
+
+    starts = np.zeros(len(order), dtype=np.int64)
+    for k in range(1, len(order)):
+        starts[k] = _lcp(indices[order[k - 1]], indices[order[k]])
+
+    # the owner of position p for sequence k is the nearest earlier sequence
+    # that branched off at or before p; a stack of branch points finds it
+    owners = np.full(len(order), -1, dtype=np.int64)
+    stack = []
+    for k in range(len(order)):
+        while stack and starts[stack[-1]] >= starts[k]:
+            stack.pop()
+        if starts[k] > 0:
+            owners[k] = stack[-1]
+        stack.append(k)
+
+    return order, starts, owners
+
+
+def _shared_direction(indices, w_ih, w_hh, bias):
+    # Hidden states of one direction of the first layer for every sequence,
+    # as a zero-padded [sequences X max length X hidden] array, computing
+    # each shared prefix once. Returns the states and the steps computed.
+    H = w_hh.shape[0]
+    n = len(indices)
+    order, starts, owners = branch_points(indices)
+
+    lengths = np.array([len(indices[i]) for i in order], dtype=np.int64)
+    max_len = int(lengths.max()) if n else 0
+
+    # time-major so each step reads and writes contiguous rows
+    residues = np.zeros((max_len, n), dtype=np.uint8)
+    for k, i in enumerate(order):
+        residues[:lengths[k], k] = indices[i]
+
+    out = np.zeros((max_len, n, H), dtype=np.float32)
+    state = np.zeros((n, 2, H), dtype=np.float32)
+
+    # the set of sequences being computed only changes where one branches off or ends
+    changes = set(starts.tolist()) | set(lengths.tolist())
+    active = None
+
+    for t in range(max_len):
+        if t in changes:
+            # sequences branching off here start from their owner's state after t - 1
+            joining = np.flatnonzero(starts == t) if t > 0 else ()
+            if len(joining):
+                state[joining] = state[owners[joining]]
+            active = np.flatnonzero((starts <= t) & (t < lengths))
+
+        hc = state[active]
+        gates = w_ih[residues[t, active]] + bias + np.matmul(hc[:, 0], w_hh)
+
+        # PyTorch gate order is input, forget, cell, output
+        i = numpy_brnn.sigmoid(gates[:, :H])
+        f = numpy_brnn.sigmoid(gates[:, H:2*H])
+        g = np.tanh(gates[:, 2*H:3*H])
+        o = numpy_brnn.sigmoid(gates[:, 3*H:])
+
+        hc[:, 1] = f * hc[:, 1] + i * g
+        hc[:, 0] = o * np.tanh(hc[:, 1])
+        state[active] = hc
+        out[t, active] = hc[:, 0]
+
+    # fill in the shared positions, in sorted order so each source is complete
+    for k in range(1, n):
+        out[:starts[k], k] = out[:starts[k], k - 1]
+
+    # back to input order, sequence-major
+    result = np.empty((n, max_len, H), dtype=np.float32)
+    result[order] = out.transpose(1, 0, 2)
+    return result, int(lengths.sum() - starts.sum())
+
+
+def first_layer_shared(network, sequences):
+    """
+    Function that computes the first-layer output of a network for a batch
+    of sequences, sharing the states of common prefixes and suffixes.
+
+    Parameters
+    ----------
+    network : numpy_brnn.NumpyBRNN_MtM
+        The network.
+
+    sequences : list of str
+        Valid amino acid sequences (upper case).
+
+    Returns
+    -------
+    tuple
+        (float32 [sequences X max length X 2*hidden] zero-padded first-layer
+        output, int64 lengths, number of residue-steps computed).
+    """
+    w_ih, w_hh, bias = network.layers[0]
+    H = network.hidden_size
+
+    indices = [encode_sequence.sequence_to_index(seq) for seq in sequences]
+    lengths = np.array([len(idx) for idx in indices], dtype=np.int64)
+
+    forward, forward_steps = _shared_direction(indices, w_ih[0], w_hh[0], bias[0])
+    backward, backward_steps = _shared_direction([idx[::-1].copy() for idx in indices], w_ih[1], w_hh[1], bias[1])
+
+    # put the reverse direction back in sequence order
+    rev = numpy_brnn.reverse_index(lengths, forward.shape[1])[:, :, None]
+    out = np.concatenate([forward, np.take_along_axis(backward, rev, axis=1)], axis=-1)
+
+    return out, lengths, forward_steps + backward_steps
+
+
+def sharing_report(sequences, num_layers=2):
+    """
+    Function that reports how much first-layer work prefix and suffix
+    sharing saves for a set of sequences, without running the network.
+
+    Parameters
+    ----------
+    sequences : list of str
+        Amino acid sequences.
+
+    num_layers : int
+        Number of LSTM layers in the network. Default = 2.
+
+    Returns
+    -------
+    dict
+        'sequences' and 'residues' (after removing duplicates, which are
+        only predicted once), 'first_layer_steps' and 'shared_steps' (residue
+        steps of the first layer, both directions, and how many of them are
+        shared), 'first_layer_saved' (the fraction of first-layer steps
+        saved), and 'total_saved', the fraction of all LSTM steps saved,
+        counting duplicates.
+    """
+    total = sum(len(seq) for seq in sequences)
+    unique = list(dict.fromkeys(sequences))
+    indices = [np.frombuffer(seq.encode('ascii', errors='replace'), dtype=np.uint8) for seq in unique]
+
+    residues = sum(len(idx) for idx in indices)
+    shared = 0
+    for direction in (indices, [idx[::-1] for idx in indices]):
+        _, starts, _ = branch_points(direction)
+        shared += int(starts.sum())
+
+    first_layer_steps = 2 * residues
+    all_steps = 2 * num_layers * total
+    computed = first_layer_steps - shared + 2 * (num_layers - 1) * residues
+
+    return {'sequences': len(unique),
+            'residues': residues,
+            'first_layer_steps': first_layer_steps,
+            'shared_steps': shared,
+            'first_layer_saved': shared / first_layer_steps if first_layer_steps else 0.0,
+            'total_saved': 1 - computed / all_steps if all_steps else 0.0}
+
+
+def add_steps(total, steps):
+    """
+    Function that adds the step counts of a predict_shared() call to a
+    running total, such as one kept over the batches of a FASTA file.
+
+    Parameters
+    ----------
+    total : dict
+        Running total, updated in place. An empty dict starts a new one.
+
+    steps : dict
+        Step counts from predict_shared().
+
+    Returns
+    -------
+    dict
+        total, with 'first_layer_steps', 'shared_steps' and
+        'first_layer_saved' as from predict_shared().
+    """
+    total['first_layer_steps'] = total.get('first_layer_steps', 0) + steps['first_layer_steps']
+    total['shared_steps'] = total.get('shared_steps', 0) + steps['shared_steps']
+    first_layer = total['first_layer_steps']
+    total['first_layer_saved'] = total['shared_steps'] / first_layer if first_layer else 0.0
+    return total
+
+
+def _groups(sequences, max_tokens):
+    # split sorted sequences into consecutive groups of at most max_tokens
+    # residues, keeping families together
+    group, residues = [], 0
+    for seq in sequences:
+        if group and residues + len(seq) > max_tokens:
+            yield group
+            group, residues = [], 0
+        group.append(seq)
+        residues += len(seq)
+    if group:
+        yield group
+
+
+def predict_shared(network, sequences, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS):
+    """
+    Function that predicts class probabilities for many sequences, sharing
+    first-layer states across common prefixes and suffixes.
+
+    Parameters
+    ----------
+    network : numpy_brnn.NumpyBRNN_MtM
+        The network.
+
+    sequences : list of str
+        Valid amino acid sequences (upper case).
+
+    max_tokens : int
+        Maximum number of residues whose states are shared in one go, and
+        of padded residues per forward pass through the upper layers.
+        Sequences are sorted first so related sequences are grouped
+        together.
+
+    Returns
+    -------
+    tuple
+        ([length X classes] probabilities for each sequence, in input order,
+        and a dict of the 'first_layer_steps' (residue steps of the first
+        layer, both directions, of the distinct sequences), how many of them
+        were 'shared_steps' and the fraction 'first_layer_saved').
+    """
+    unique = sorted(set(seq for seq in sequences if seq))
+
+    steps = add_steps({}, {'first_layer_steps': 0, 'shared_steps': 0})
+    predicted = {'': np.zeros((0, network.num_classes), dtype=np.float32)}
+    for group in _groups(unique, max_tokens):
+        first_layer, lengths, computed = first_layer_shared(network, group)
+        residues = 2 * int(lengths.sum())
+        add_steps(steps, {'first_layer_steps': residues, 'shared_steps': residues - computed})
+
+        # the upper layers are run in length-sorted batches to keep padding low
+        for batch in py_predictor_v2.token_batches(lengths, max_tokens):
+            batch_len = int(lengths[batch].max())
+            values = network.forward_from(first_layer[batch, :batch_len], lengths[batch], first_layer=1)
+            for k, value in zip(batch, numpy_brnn.softmax(values)):
+                predicted[group[k]] = value[:lengths[k]].copy()
+
+    return [predicted[seq] for seq in sequences], steps
@@ -0,0 +1,326 @@
+"""
+Binary, memory-mappable storage for DSSP predictions.
+
+A store is a directory holding the per-residue classes and class
+probabilities of many sequences, concatenated into flat binary files:
+
+    classes.i8           int8 class of every residue (0 = helix, 1 = strand, 2 = coil)
+    probabilities.f16    float16 [residues X 3] class probabilities
+    offsets.i64          int64 start of each sequence, plus the total residue count
+    headers.txt          one sequence header per line
+    metadata.json        format version, network name and checksum, counts
+
+Sequences are appended one at a time by DsspStoreWriter, and metadata.json
+is written last, when the writer is closed. DsspStore maps the files with
+numpy.memmap, so opening a store is instant and each sequence is a
+zero-copy slice of the mapped arrays.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import dssp_profile
+from PredictDSSP.dssp_exceptions import DsspError
+
+# identifies the directory layout, bumped on incompatible changes
+STORE_FORMAT = 'predictdssp-store'
+STORE_VERSION = 1
+
+CLASSES_FILE = 'classes.i8'
+PROBABILITIES_FILE = 'probabilities.f16'
+OFFSETS_FILE = 'offsets.i64'
+HEADERS_FILE = 'headers.txt'
+METADATA_FILE = 'metadata.json'
+
+# number of DSSP classes stored per residue
+NUM_CLASSES = 3
+
+
+class DsspStoreWriter():
+    """
+    Class that writes DSSP predictions to a store one sequence at a time.
+
+    Usage:
+
+    >>> with DsspStoreWriter('scores.dssp') as writer:
+    ...     for header, probabilities in results:
+    ...         writer.write(header, probabilities)
+
+    Attributes
+    ----------
+    path : str
+        Directory the store is written to.
+    count : int
+        Number of sequences written so far.
+    residues : int
+        Number of residues written so far.
+    """
+
+    def __init__(self, path, network=None):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory to write the store to. It is created if needed, and any
+            existing store in it is overwritten.
+
+        network : str or None
+            Network the predictions were made with, recorded in the store's
+            metadata. See dssp_predict.network_path(). Default = the default
+            network.
+        """
+
+        try:
+            os.makedirs(path, exist_ok=True)
+
+            # an old metadata file would make a half-written store look complete
+            if os.path.exists(os.path.join(path, METADATA_FILE)):
+                os.remove(os.path.join(path, METADATA_FILE))
+
+            self._classes = open(os.path.join(path, CLASSES_FILE), 'wb')
+            self._probabilities = open(os.path.join(path, PROBABILITIES_FILE), 'wb')
+            self._offsets = open(os.path.join(path, OFFSETS_FILE), 'wb')
+            self._headers = open(os.path.join(path, HEADERS_FILE), 'w', encoding='utf-8')
+        except OSError:
+            raise DsspError('Unable to write to store destination %s' % (path))
+
+        network_file = dssp_predict.network_path(network)
+
+        self.path = path
+        self.count = 0
+        self.residues = 0
+        self.network = os.path.basename(network_file)
+        self.network_checksum = dssp_predict.network_checksum(network_file)
+
+        self._offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a run that failed part way leaves an incomplete store without metadata
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_files()
+
+    def write(self, header, probabilities):
+        """
+        Append the prediction for one sequence.
+
+        Parameters
+        ----------
+        header : str
+            Header / identifier of the sequence. Newlines are replaced by spaces.
+
+        probabilities : np.ndarray
+            Per-residue class probabilities of shape [sequence length X 3], as
+            returned by predict_dssp(..., raw_vals=True).
+
+        """
+        probabilities = np.asarray(probabilities)
+        if probabilities.ndim != 2 or probabilities.shape[1] != NUM_CLASSES:
+            raise DsspError('Expected probabilities of shape [length X %i], got %s' % (NUM_CLASSES, str(probabilities.shape)))
+
+        with dssp_profile.stage('write_store', len(probabilities)):
+            # classes come from the full precision values so they match predict_dssp()
+            self._classes.write(dssp_predict.probabilities_to_classes(probabilities).tobytes())
+            self._probabilities.write(probabilities.astype('<f2').tobytes())
+
+        self.residues += len(probabilities)
+        self.count += 1
+
+        self._offsets.write(np.array([self.residues], dtype='<i8').tobytes())
+        self._headers.write(header.replace('\r', ' ').replace('\n', ' ') + '\n')
+
+    def close(self):
+        """Finish the store by flushing the data files and writing its metadata"""
+        if self._classes.closed:
+            return
+
+        self._close_files()
+
+        metadata = {'format': STORE_FORMAT,
+                    'version': STORE_VERSION,
+                    'sequences': self.count,
+                    'residues': self.residues,
+                    'network': self.network,
+                    'network_checksum': self.network_checksum}
+
+        with open(os.path.join(self.path, METADATA_FILE), 'w') as fh:
+            json.dump(metadata, fh, indent=2)
+
+
+    def _close_files(self):
+        for fh in (self._classes, self._probabilities, self._offsets, self._headers):
+            fh.close()
+
+
+def _map(filename, dtype, shape):
+    # numpy cannot memory map an empty file
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', shape=shape)
+
+
+class DsspStore():
+    """
+    A read-only store of DSSP predictions, backed by memory-mapped files.
+
+    Sequences can be looked up by header or by position. Returned arrays are
+    read-only views into the mapped files, so only the pages that are
+    actually used are read from disk.
+
+    Usage:
+
+    >>> store = DsspStore('scores.dssp')
+    >>> classes = store.classes('sp|P0CG48|UBC_HUMAN')
+    >>> probabilities = store.probabilities(0)
+
+    Attributes
+    ----------
+    path : str
+        Directory of the store.
+    metadata : dict
+        Contents of the store's metadata.json, including the name and
+        checksum of the network used for the predictions.
+    headers : list of str
+        Header of every sequence, in the order they were written.
+    offsets : np.ndarray
+        int64 start of each sequence in the residue arrays, followed by
+        the total number of residues.
+    all_classes : np.ndarray
+        int8 class of every residue in the store.
+    all_probabilities : np.ndarray
+        float16 [residues X 3] class probabilities of every residue in the
+        store.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            Directory of a store written by DsspStoreWriter.
+        """
+
+        metadata_file = os.path.join(path, METADATA_FILE)
+        if not os.path.isfile(metadata_file):
+            raise DsspError('%s is not a complete DSSP store (no %s)' % (path, METADATA_FILE))
+
+        with open(metadata_file) as fh:
+            metadata = json.load(fh)
+
+        if metadata.get('format') != STORE_FORMAT or metadata.get('version') != STORE_VERSION:
+            raise DsspError('%s is not a version %i DSSP store' % (path, STORE_VERSION))
+
+        count = metadata['sequences']
+        residues = metadata['residues']
+
+        self.path = path
+        self.metadata = metadata
+
+        with open(os.path.join(path, HEADERS_FILE), encoding='utf-8') as fh:
+            # split on newlines only: headers may hold other characters
+            # that splitlines() treats as line breaks
+            self.headers = fh.read().split('\n')[:-1]
+
+        self.offsets = np.fromfile(os.path.join(path, OFFSETS_FILE), dtype='<i8')
+        self.all_classes = _map(os.path.join(path, CLASSES_FILE), np.int8, (residues,))
+        self.all_probabilities = _map(os.path.join(path, PROBABILITIES_FILE), '<f2', (residues, NUM_CLASSES))
+
+        if len(self.headers) != count or len(self.offsets) != count + 1 or self.offsets[-1] != residues:
+            raise DsspError('DSSP store %s is inconsistent with its metadata' % (path))
+
+        # built on first lookup by header. Duplicate headers resolve to the first
+        self._index = None
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __contains__(self, header):
+        return header in self._header_index()
+
+    def __iter__(self):
+        return iter(self.headers)
+
+    def _header_index(self):
+        if self._index is None:
+            index = {}
+            for i, header in enumerate(self.headers):
+                index.setdefault(header, i)
+            self._index = index
+        return self._index
+
+    def _position(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self.headers)
+            if key < 0 or key >= len(self.headers):
+                raise IndexError('Store has %i sequences, no sequence %i' % (len(self.headers), key))
+            return int(key)
+
+        try:
+            return self._header_index()[key]
+        except KeyError:
+            raise KeyError('No sequence with header %s in store' % (key))
+
+    def classes(self, key):
+        """
+        Per-residue classes of one sequence.
+
+        Parameters
+        ----------
+        key : str or int
+            Header of the sequence, or its position in the store.
+
+        Returns
+        -------
+        np.ndarray
+            int8 view of the sequence's classes.
+        """
+        i = self._position(key)
+        return self.all_classes[self.offsets[i]:self.offsets[i + 1]]
+
+    def probabilities(self, key):
+        """
+        Per-residue class probabilities of one sequence.
+
+        Parameters
+        ----------
+        key : str or int
+            Header of the sequence, or its position in the store.
+
+        Returns
+        -------
+        np.ndarray
+            float16 [sequence length X 3] view of the sequence's probabilities.
+        """
+        i = self._position(key)
+        return self.all_probabilities[self.offsets[i]:self.offsets[i + 1]]
+
+    def lengths(self):
+        """
+        Returns
+        -------
+        np.ndarray
+            Length of every sequence in the store.
+        """
+        return np.diff(self.offsets)
+
+    def items(self):
+        """
+        Iterate over the store.
+
+        Yields
+        ------
+        tuple
+            (header, classes, probabilities) for each sequence, in the order
+            they were written.
+        """
+        for i, header in enumerate(self.headers):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            yield header, self.all_classes[start:end], self.all_probabilities[start:end]
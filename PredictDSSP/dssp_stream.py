@@ -0,0 +1,247 @@
+"""
+Streaming FASTA reading and prediction.
+
+Records are parsed one at a time (from plain, gzip, bz2 or xz compressed
+files, or from stdin), predicted in bounded micro-batches and handed back
+as they are ready, so memory use does not grow with the size of the input.
+"""
+
+import io
+import sys
+import bz2
+import gzip
+import lzma
+import collections
+
+from PredictDSSP import dssp_predict
+from PredictDSSP import dssp_profile
+from PredictDSSP import dssp_shared
+from PredictDSSP import py_predictor_v2
+from PredictDSSP.dssp_exceptions import DsspError
+
+# default number of sequences predicted together in one micro-batch
+DEFAULT_BATCH_SIZE = 256
+
+# invalid_sequence_action values understood by iter_fasta()
+INVALID_SEQUENCE_ACTIONS = ('convert', 'convert-ignore', 'remove', 'fail', 'ignore')
+
+
+def open_fasta(filepath):
+    """
+    Function that opens a FASTA file for reading as text. Compressed files
+    (gzip, bz2 or xz) are recognised from their contents, and '-' reads
+    from stdin.
+
+    Parameters
+    ------------
+    filepath : str
+        Path to the FASTA file, or '-' for stdin.
+
+    Returns
+    ---------
+    file object
+        Text file object to read the FASTA records from.
+
+    """
+    if filepath == '-':
+        raw = sys.stdin.buffer
+        if not hasattr(raw, 'peek'):
+            raw = io.BufferedReader(raw)
+    else:
+        raw = open(filepath, 'rb')
+
+    magic = raw.peek(6)[:6]
+
+    if magic[:2] == b'\x1f\x8b':
+        raw = gzip.GzipFile(fileobj=raw, mode='rb')
+    elif magic[:3] == b'BZh':
+        raw = bz2.BZ2File(raw, mode='rb')
+    elif magic == b'\xfd7zXZ\x00':
+        raw = lzma.LZMAFile(raw, mode='rb')
+
+    return io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+
+
+def _check_sequence(header, sequence, invalid_sequence_action):
+    # returns the (possibly converted) sequence, or None if it should be dropped
+    if invalid_sequence_action == 'ignore':
+        return sequence
+
+    from protfasta import utilities as _utilities
+
+    if invalid_sequence_action in ('convert', 'convert-ignore'):
+        sequence = _utilities.convert_to_valid(sequence)
+        if invalid_sequence_action == 'convert-ignore':
+            return sequence
+
+    valid, bad = _utilities.check_sequence_is_valid(sequence)
+    if valid:
+        return sequence
+
+    if invalid_sequence_action == 'remove':
+        return None
+
+    raise DsspError('Invalid amino acid %s in sequence %s' % (bad, header))
+
+
+def iter_fasta(filepath, invalid_sequence_action='convert'):
+    """
+    Generator that reads FASTA records one at a time.
+
+    Parameters
+    ------------
+    filepath : str
+        Path to the FASTA file (optionally gzip, bz2 or xz compressed), or
+        '-' for stdin.
+
+    invalid_sequence_action : str
+        How to deal with non-standard amino acids, following protfasta.
+        'convert' (default) converts them using the standard protfasta rules
+        and fails if any remain, 'convert-ignore' converts and keeps any that
+        remain, 'remove' skips the sequence, 'fail' raises a DsspError and
+        'ignore' leaves the sequence as it is.
+
+    Yields
+    --------
+    tuple
+        (header, sequence) for each record.
+
+    """
+    if invalid_sequence_action not in INVALID_SEQUENCE_ACTIONS:
+        raise DsspError('invalid_sequence_action must be one of %s' % (', '.join(INVALID_SEQUENCE_ACTIONS)))
+
+    fh = open_fasta(filepath)
+    try:
+        header = None
+        lines = []
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+
+            if line[0] == '>':
+                if header is not None:
+                    sequence = _check_sequence(header, ''.join(lines), invalid_sequence_action)
+                    if sequence is not None:
+                        yield header, sequence
+                header = line[1:].strip()
+                lines = []
+            elif header is None:
+                raise DsspError('File %s does not start with a FASTA header' % (filepath))
+            else:
+                lines.append(line)
+
+        if header is not None:
+            sequence = _check_sequence(header, ''.join(lines), invalid_sequence_action)
+            if sequence is not None:
+                yield header, sequence
+    finally:
+        # never close stdin, just let go of it
+        if filepath == '-':
+            fh.detach()
+        else:
+            fh.close()
+
+
+def iter_predict_fasta(filepath, raw_vals=False, as_array=False, invalid_sequence_action='convert',
+                       batch_size=DEFAULT_BATCH_SIZE, max_tokens=py_predictor_v2.DEFAULT_MAX_TOKENS,
+                       engine='torch', workers=None, share_states=False, steps=None):
+    """
+    Generator that predicts DSSP scores for every record in a FASTA file,
+    reading and predicting in bounded micro-batches so memory use stays
+    flat however large the file is.
+
+    Parameters
+    ------------
+    filepath : str
+        Path to the FASTA file (optionally gzip, bz2 or xz compressed), or
+        '-' for stdin.
+
+    raw_vals : bool
+        Yield per-residue probabilities instead of classes.
+
+    as_array : bool
+        Yield classes as NumPy int8 arrays instead of lists.
+
+    invalid_sequence_action : str
+        How to deal with non-standard amino acids. See iter_fasta().
+
+    batch_size : int
+        Maximum number of sequences predicted together. Default = 256.
+
+    max_tokens : int
+        Maximum number of residues predicted together. Default = 65536.
+
+    engine : str
+        Inference engine, either 'torch' (default) or 'numpy'.
+
+    workers : int
+        If more than 1, predictions are spread over a PredictorPool with
+        this many worker processes.
+
+    share_states : bool
+        Share first-layer states between sequences in the same batch that
+        have a common prefix or suffix. See dssp_shared. Not available
+        with workers.
+
+    steps : dict
+        If given with share_states, the first-layer step counts of every
+        batch are added to it as they are predicted. See
+        dssp_shared.add_steps().
+
+    Yields
+    --------
+    tuple
+        (header, prediction) for each record, in file order.
+
+    """
+    if share_states and workers is not None and workers > 1:
+        raise DsspError('share_states cannot be combined with workers')
+
+    records = iter_fasta(filepath, invalid_sequence_action=invalid_sequence_action)
+
+    # records are read lazily, so reading is timed one record at a time
+    if dssp_profile.enabled():
+        records = dssp_profile.timed_iter(records, 'read_fasta', lambda record: len(record[1]))
+
+    if workers is not None and workers > 1:
+        from PredictDSSP.dssp_pool import PredictorPool
+
+        # the pool pulls sequences lazily, so headers are queued as they are read
+        headers = collections.deque()
+
+        def sequences():
+            for header, sequence in records:
+                headers.append(header)
+                yield sequence
+
+        with PredictorPool(workers=workers, engine=engine, max_tokens=max_tokens,
+                           chunk_size=min(batch_size, 64)) as pool:
+            for prediction in pool.imap(sequences(), raw_vals=raw_vals, as_array=as_array):
+                yield headers.popleft(), prediction
+        return
+
+    batch = []
+    residues = 0
+    for header, sequence in records:
+        batch.append((header, sequence.upper()))
+        residues += len(sequence)
+
+        if len(batch) >= batch_size or residues >= max_tokens:
+            yield from _predict_batch(batch, raw_vals, as_array, max_tokens, engine, share_states, steps)
+            batch = []
+            residues = 0
+
+    if batch:
+        yield from _predict_batch(batch, raw_vals, as_array, max_tokens, engine, share_states, steps)
+
+
+def _predict_batch(batch, raw_vals, as_array, max_tokens, engine, share_states, steps):
+    predictions, batch_steps = dssp_predict.predict_dssp_batch([sequence for _, sequence in batch],
+                                                               raw_vals=raw_vals, as_array=as_array,
+                                                               max_tokens=max_tokens, engine=engine,
+                                                               share_states=share_states, report=True)
+    if steps is not None and share_states:
+        dssp_shared.add_steps(steps, batch_steps)
+    for (header, _), prediction in zip(batch, predictions):
+        yield header, prediction
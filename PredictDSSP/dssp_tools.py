@@ -1,5 +1,7 @@
 
 import re
+import hashlib
+from PredictDSSP import dssp_profile
 from PredictDSSP.dssp_exceptions import DsspError
 
 def valid_range(inval, minval, maxval):
@@ -7,6 +9,28 @@ def valid_range(inval, minval, maxval):
         raise DsspError('Value %1.3f is outside of range [%1.3f, %1.3f]' % (inval, minval, maxval))
 
 
+def file_checksum(filename):
+    """
+    Function that returns the sha256 checksum of a file.
+
+    Parameters
+    -----------
+    filename : str
+        Path to the file
+
+    Returns
+    --------
+    str
+        Hex digest of the file contents
+
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
 def write_csv(input_dict, output_file):
     """
     Function that writes the scores in an input dictionary out to a standardized CVS file format.
@@ -28,24 +52,70 @@ def write_csv(input_dict, output_file):
 
     """
 
-    # try and open the file and throw exception if anything goes wrong
-    try:
-        fh = open(output_file, 'w')
-    except Exception:
-        raise DsspError('Unable to write to file destination %s' % (output_file))
+    with CsvWriter(output_file) as writer:
+        for idx in input_dict:
+            writer.write(idx, input_dict[idx])
+
+
+class CsvWriter():
+    """
+    Class that writes per-residue scores to the standardized CSV file format one
+    sequence at a time, so results can be written as soon as they are predicted.
+    Rows are buffered and reach the disk as the buffer fills and when the
+    writer is closed.
+
+    Usage:
+
+    >>> with CsvWriter('scores.csv') as writer:
+    ...     for header, scores in results:
+    ...         writer.write(header, scores)
+
+    """
+
+    def __init__(self, output_file):
+        """
+        Parameters
+        -----------
+        output_file : str
+            Location and filename for the output file. Assumes .csv is provided.
+        """
+
+        # try and open the file and throw exception if anything goes wrong
+        try:
+            self.fh = open(output_file, 'w')
+        except Exception:
+            raise DsspError('Unable to write to file destination %s' % (output_file))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, header, scores):
+        """
+        Write the scores for one sequence.
+
+        Parameters
+        -----------
+        header : str
+            Header / identifier of the sequence
+
+        scores : list or np.ndarray
+            Per-residue scores
 
-    # for each entry
-    for idx in input_dict:
+        """
 
         # important otherwise commmas in FASTA headers render the CSV file unreadable!
-        no_comma = idx.replace(',', ' ')
-        fh.write('%s' % (no_comma))
+        no_comma = header.replace(',', ' ')
 
         # for each score write
-        for score in input_dict[idx]:
-            fh.write(', %1.3f' % (score))
-        fh.write('\n')
+        with dssp_profile.stage('write_csv', len(scores)):
+            self.fh.write(no_comma + ''.join([', %1.3f' % (score) for score in scores]) + '\n')
 
+    def close(self):
+        """Flush any buffered rows and close the output file"""
+        self.fh.close()
 
 
 def sanitize_filename(input_filename):
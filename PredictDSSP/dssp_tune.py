@@ -0,0 +1,386 @@
+"""
+Hardware-aware tuning of the prediction settings.
+
+How fast predictions run depends on the number of torch threads, the
+number of sequences predicted together, the number of worker processes and
+the inference engine, and the best choice differs from machine to machine.
+autotune() runs short trials of each setting on this machine with the
+bundled network, on synthetic sequences with realistic lengths, and keeps
+the setting with the most residues per second (objective 'throughput') or
+the lowest 99th percentile latency of single predictions (objective
+'latency'). Settings are tried one at a time, each starting from the best
+found so far.
+
+The result is saved as a tuning profile, a small JSON file (see
+profile_path), which the command-line tools and the batch and FASTA
+functions load automatically. A profile records the CPU count, the
+PredictDSSP release and the torch version it was tuned with; once any of
+them changes it is stale, and the defaults are used with a warning until
+dssp-autotune is run again.
+"""
+
+import os
+import re
+import json
+import time
+import warnings
+import importlib.metadata
+
+import numpy as np
+
+from PredictDSSP import dssp_bench
+from PredictDSSP import dssp_predict
+from PredictDSSP.dssp_pool import available_cpus
+from PredictDSSP.dssp_exceptions import DsspError
+
+# identifies the layout of the profile, bumped on incompatible changes
+TUNING_VERSION = 1
+
+# environment variable holding the location of the tuning profile
+TUNING_ENV_VAR = 'PREDICTDSSP_TUNING'
+
+OBJECTIVES = ('throughput', 'latency')
+
+# numbers of sequences predicted together tried for the throughput objective
+BATCH_SIZES = (16, 64, 256, 1024)
+
+# settings used when there is no profile. batch_size is the number of
+# sequences a FASTA file is read and predicted in
+DEFAULTS = {'engine': 'torch', 'threads': None, 'batch_size': 256, 'workers': 1, 'compiled': False}
+
+# fraction by which a setting must beat the best so far to be kept
+MIN_GAIN = 0.03
+
+# sizes of the trials of a full and a quick tuning run
+FULL = {'sequences': 384, 'latency_calls': 100}
+QUICK = {'sequences': 96, 'latency_calls': 40}
+
+
+def profile_path():
+    """
+    Function that returns the location of the tuning profile: the
+    PREDICTDSSP_TUNING environment variable if set, otherwise a file
+    inside $XDG_CACHE_HOME (or ~/.cache).
+
+    Returns
+    -------
+    str
+        Path to the profile.
+    """
+    path = os.environ.get(TUNING_ENV_VAR)
+    if path:
+        return path
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'PredictDSSP', 'tuning.json')
+
+
+def _release(version):
+    # the release a version string belongs to, without the .devN, .postN and
+    # +local parts that a development install adds on every commit
+    match = re.match(r'\d+(\.\d+)*', version)
+    return match.group(0) if match else version
+
+
+def _fingerprint():
+    # what a profile is only valid for. The torch version is read from the
+    # package metadata, so loading a profile does not import torch
+    from PredictDSSP import __version__
+
+    try:
+        torch_version = importlib.metadata.version('torch')
+    except importlib.metadata.PackageNotFoundError:
+        torch_version = None
+
+    return {'cpus': available_cpus(), 'PredictDSSP': _release(__version__), 'torch': torch_version}
+
+
+def _thread_counts(cpus):
+    # 1, 2, 4, ... up to and including the number of CPUs
+    counts = []
+    threads = 1
+    while threads < cpus:
+        counts.append(threads)
+        threads *= 2
+    counts.append(cpus)
+    return counts
+
+
+def _throughput(config, sequences):
+    # residues per second predicting sequences with a configuration
+    residues = sum(len(seq) for seq in sequences)
+
+    if config['workers'] > 1:
+        from PredictDSSP.dssp_pool import PredictorPool
+
+        with PredictorPool(workers=config['workers'], threads_per_worker=config['threads'], engine=config['engine'],
+                           chunk_size=min(config['batch_size'], 64)) as pool:
+            pool.predict(sequences[:config['workers']])
+            start = time.perf_counter()
+            pool.predict(sequences)
+            return residues / (time.perf_counter() - start)
+
+    predictor = dssp_predict.get_predictor(engine=config['engine'], compiled=config['compiled'])
+    predictor.predict_batch(sequences[:2])
+
+    start = time.perf_counter()
+    for i in range(0, len(sequences), config['batch_size']):
+        predictor.predict_batch(sequences[i:i + config['batch_size']])
+    return residues / (time.perf_counter() - start)
+
+
+def _latency(config, sequences):
+    # 99th percentile latency in milliseconds of single predictions
+    # one untimed pass, so no timed call pays for first-use allocations
+    predictor = dssp_predict.get_predictor(engine=config['engine'], compiled=config['compiled'])
+    for seq in sequences:
+        predictor.predict(seq)
+
+    times = []
+    for seq in sequences:
+        start = time.perf_counter()
+        predictor.predict(seq)
+        times.append(time.perf_counter() - start)
+    return float(1000 * np.percentile(times, 99))
+
+
+def autotune(objective='throughput', quick=False, seed=0, save=True, path=None, log=None):
+    """
+    Function that finds the fastest prediction settings for this machine.
+
+    Parameters
+    ----------
+    objective : str
+        'throughput' (default) to maximise residues per second over many
+        sequences, or 'latency' to minimise the 99th percentile latency of
+        single predictions.
+
+    quick : bool
+        Run smaller trials, which takes a few seconds instead of about a
+        minute but is noisier. Default = False.
+
+    seed : int
+        Random seed of the trial sequences. Default = 0.
+
+    save : bool
+        Save the result as the tuning profile. Default = True.
+
+    path : str or None
+        Where to save the profile. Default = None, which uses profile_path().
+
+    log : file or None
+        Where to report each trial. Default = None, no progress.
+
+    Returns
+    -------
+    dict
+        The profile: the best 'config' (engine, threads, batch_size, workers
+        and compiled), its 'score', the 'objective' and 'unit', every trial
+        run, and the CPU count and versions it is valid for.
+    """
+    import torch
+
+    if objective not in OBJECTIVES:
+        raise DsspError('objective must be one of %s' % (', '.join(OBJECTIVES)))
+
+    sizes = QUICK if quick else FULL
+    cpus = available_cpus()
+
+    if objective == 'throughput':
+        sequences = dssp_bench.synthetic_proteome(sizes['sequences'], seed=seed)
+        measure, higher = _throughput, True
+    else:
+        sequences = dssp_bench.synthetic_proteome(sizes['latency_calls'], seed=seed)
+        measure, higher = _latency, False
+
+    trials = []
+
+    def trial(config):
+        torch.set_num_threads(config['threads'])
+        score = measure(config, sequences)
+        trials.append({'config': dict(config), 'score': score})
+        if log is not None:
+            print('%-60s %12.4g' % (' '.join('%s=%s' % item for item in config.items()), score), file=log, flush=True)
+        return score
+
+    # a setting has to beat the best so far by MIN_GAIN to replace it, so
+    # that noise does not move away from the defaults
+    def better(score, best):
+        return score > best * (1 + MIN_GAIN) if higher else score < best * (1 - MIN_GAIN)
+
+    original_threads = torch.get_num_threads()
+    best = dict(DEFAULTS, threads=cpus)
+    with dssp_bench.uncached():
+        try:
+            # threads first, as everything else depends on them
+            best_score = None
+            for threads in _thread_counts(cpus):
+                config = dict(best, threads=threads)
+                score = trial(config)
+                if best_score is None or better(score, best_score):
+                    best, best_score = config, score
+
+            # FASTA files (throughput) are predicted with the eager network,
+            # and services (latency) one request batch at a time in one process
+            candidates = [{'engine': 'numpy'}]
+            if objective == 'throughput':
+                candidates += [{'batch_size': size} for size in BATCH_SIZES if size != best['batch_size']]
+                candidates += [{'workers': workers, 'threads': max(1, cpus // workers)}
+                               for workers in _thread_counts(cpus) if workers > 1]
+            else:
+                candidates += [{'compiled': True}]
+
+            for change in candidates:
+                config = dict(best, **change)
+
+                # the numpy engine is never compiled
+                if config['engine'] == 'numpy' and config['compiled']:
+                    continue
+
+                score = trial(config)
+                if better(score, best_score):
+                    best, best_score = config, score
+        finally:
+            torch.set_num_threads(original_threads)
+
+    profile = dict(_fingerprint(), version=TUNING_VERSION, objective=objective,
+                   unit='residues/s' if higher else 'ms', config=best, score=best_score, trials=trials,
+                   created=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    if save:
+        save_profile(profile, path)
+
+    return profile
+
+
+def save_profile(profile, path=None):
+    """
+    Function that writes a tuning profile.
+
+    Parameters
+    ----------
+    profile : dict
+        Profile from autotune().
+
+    path : str or None
+        Where to write it. Default = None, which uses profile_path().
+    """
+    path = profile_path() if path is None else path
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as fh:
+            json.dump(profile, fh, indent=2)
+            fh.write('\n')
+    except OSError as e:
+        raise DsspError('Unable to write tuning profile to %s: %s' % (path, e))
+
+
+def read_profile(path=None):
+    """
+    Function that reads a tuning profile, whether or not it is stale.
+
+    Parameters
+    ----------
+    path : str or None
+        Location of the profile. Default = None, which uses profile_path().
+
+    Returns
+    -------
+    dict or None
+        The profile, or None if there is no readable profile.
+    """
+    path = profile_path() if path is None else path
+    try:
+        with open(path) as fh:
+            profile = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(profile, dict) or profile.get('version') != TUNING_VERSION:
+        return None
+    return profile
+
+
+def stale_reasons(profile):
+    """
+    Function that checks whether a profile still applies to this machine.
+
+    Parameters
+    ----------
+    profile : dict
+        Profile from autotune() or read_profile().
+
+    Returns
+    -------
+    list of str
+        What changed since the profile was tuned. Empty if it is current.
+    """
+    return ['%s changed from %s to %s' % (key, profile.get(key), value)
+            for key, value in _fingerprint().items() if profile.get(key) != value]
+
+
+def load_profile(path=None, retune=False, log=None):
+    """
+    Function that returns the tuned settings for this machine.
+
+    Parameters
+    ----------
+    path : str or None
+        Location of the profile. Default = None, which uses profile_path().
+
+    retune : bool
+        If the profile is stale, tune again (quickly, with the same
+        objective) and save the new profile. Default = False, which ignores
+        a stale profile with a warning and returns DEFAULTS.
+
+    log : file or None
+        Where to report re-tuning. Default = None.
+
+    Returns
+    -------
+    dict
+        The tuned settings (engine, threads, batch_size, workers and
+        compiled), or DEFAULTS if there is no current profile.
+    """
+    profile = read_profile(path)
+    if profile is None:
+        return dict(DEFAULTS)
+
+    reasons = stale_reasons(profile)
+    if reasons:
+        if not retune:
+            warnings.warn('Ignoring stale tuning profile %s (%s); run dssp-autotune to tune again'
+                          % (path or profile_path(), '; '.join(reasons)))
+            return dict(DEFAULTS)
+
+        if log is not None:
+            print('Tuning profile is stale (%s), tuning again' % ('; '.join(reasons)), file=log, flush=True)
+        profile = autotune(profile.get('objective', 'throughput'), quick=True, path=path)
+
+    return dict(DEFAULTS, **profile['config'])
+
+
+def apply_profile(path=None, retune=False, log=None):
+    """
+    Function that loads the tuned settings for this machine and sets the
+    number of torch threads from them. The other settings are returned for
+    the caller to pass on.
+
+    Parameters
+    ----------
+    path, retune, log
+        As for load_profile().
+
+    Returns
+    -------
+    dict
+        The settings, as from load_profile().
+    """
+    config = load_profile(path, retune=retune, log=log)
+
+    # threads are only changed when tuned, and torch is only imported then
+    if config['threads'] is not None and config['workers'] == 1:
+        import torch
+        torch.set_num_threads(config['threads'])
+
+    return config
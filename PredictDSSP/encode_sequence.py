@@ -12,17 +12,91 @@ import sys
 import os
 
 import numpy as np
-import torch
+
+# torch is only imported by the functions that return tensors, so the
+# array-based encoders can be used without it
 
 ONE_HOT = { 'A': 0, 'C': 1, 'D': 2, 'E': 3, 'F': 4, 'G': 5, 'H': 6, 
             'I': 7, 'K': 8, 'L': 9, 'M': 10, 'N': 11, 'P': 12, 'Q': 13, 
             'R': 14, 'S': 15, 'T': 16, 'V': 17, 'W': 18, 'Y': 19 }
 
+REV_ONE_HOT = 'ACDEFGHIKLMNPQRSTVWY'
+
+# Index value used in lookup tables for bytes that do not encode a residue
+INVALID_INDEX = 255
+
+
+def build_index_table(alphabet):
+    """Build a 256-entry lookup table mapping sequence bytes to alphabet indices
+    Parameters
+    ----------
+    alphabet : dict
+            Maps single-character residue codes to integer indices (< 255)
+    Returns
+    -------
+    np.ndarray
+            uint8 array where entry ord(residue) holds the residue's index and
+            every other entry holds INVALID_INDEX
+    """
+
+    table = np.full(256, INVALID_INDEX, dtype=np.uint8)
+    for residue, idx in alphabet.items():
+        if len(residue) == 1 and ord(residue) < 256:
+            table[ord(residue)] = idx
+    return table
+
+
+ONE_HOT_INDEX = build_index_table(ONE_HOT)
+
+# Row i is the one-hot vector for residue index i
+ONE_HOT_MATRIX = np.eye(len(ONE_HOT), dtype=np.float32)
+
+
+def _lookup(seq, table):
+    """Look up every residue of seq in table
+    Returns the uint8 index array and the position of the first residue that
+    is not in the table (or None if every residue is valid).
+    """
+
+    try:
+        raw = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+    except UnicodeEncodeError as e:
+        return None, e.start
+
+    idx = table[raw]
+
+    bad = np.flatnonzero(idx == INVALID_INDEX)
+    if bad.size > 0:
+        return None, int(bad[0])
+    return idx, None
+
+
+def sequence_to_index(seq, table=ONE_HOT_INDEX):
+    """Convert an amino acid sequence to an array of alphabet indices
+    Parameters
+    ----------
+    seq : str
+            An uppercase sequence of amino acids (single letter code)
+    table : np.ndarray
+            Lookup table from build_index_table(). Default is the one-hot
+            (ONE_HOT) alphabet.
+    Returns
+    -------
+    np.ndarray
+            uint8 array of length len(seq) holding the index of each residue
+    """
+
+    idx, bad = _lookup(seq, table)
+    if bad is not None:
+        raise ValueError('Invalid amino acid detected: %s (position %i)' % (seq[bad], bad + 1))
+    return idx
+
+
 def one_hot(seq):
     """Convert an amino acid sequence to a PyTorch tensor of one-hot vectors
     Each amino acid is represented by a length 20 vector with a single 1 and
     19 0's Inputing a sequence with a nono-canonical amino acid letter will
-    cause the program to exit.
+    raise a ValueError reporting the residue and its position.
     E.g. Glutamic acid (E) is encoded: [0 0 0 1 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0]
     Parameters
     ----------
@@ -30,19 +104,61 @@ def one_hot(seq):
             An uppercase sequence of amino acids (single letter code)
     Returns
     -------
-    torch.IntTensor
+    torch.FloatTensor
             a PyTorch tensor representing the encoded sequence
     """
 
-    l = len(seq)
-    m = np.zeros((l, 20))
-    try:
-        for i in range(l):
-            m[i, ONE_HOT[seq[i]]] = 1
-    except:
-        error_str = 'Invalid amino acid detected: ' + seq[i]
-        raise ValueError(error_str)
-    return torch.from_numpy(m)
+    import torch
+    return torch.from_numpy(ONE_HOT_MATRIX[sequence_to_index(seq)])
+
+
+def one_hot_batch(seqs, buffer=None):
+    """Convert many amino acid sequences to one zero-padded array of one-hot vectors
+    Parameters
+    ----------
+    seqs : list of str
+            Uppercase sequences of amino acids (single letter code)
+    buffer : np.ndarray or None
+            Optional 1-dimensional float32 array used as storage for the
+            output. If it is large enough the output is a view into it, so
+            the same buffer can be reused across calls without reallocating.
+    Returns
+    -------
+    np.ndarray
+            float32 array of shape [len(seqs) X longest sequence X 20]
+    np.ndarray
+            int64 array holding the length of each sequence
+    """
+
+    lengths = np.fromiter((len(seq) for seq in seqs), dtype=np.int64, count=len(seqs))
+    max_len = int(lengths.max()) if len(seqs) > 0 else 0
+    size = len(seqs) * max_len * len(ONE_HOT)
+
+    if buffer is not None and buffer.size >= size:
+        encoded = buffer[:size].reshape(len(seqs), max_len, len(ONE_HOT))
+        encoded.fill(0)
+    else:
+        encoded = np.zeros((len(seqs), max_len, len(ONE_HOT)), dtype=np.float32)
+
+    if size == 0:
+        return encoded, lengths
+
+    # encode every residue of every sequence in a single lookup
+    joined = ''.join(seqs)
+    starts = np.cumsum(lengths) - lengths
+
+    idx, bad = _lookup(joined, ONE_HOT_INDEX)
+    if bad is not None:
+        row = int(np.searchsorted(starts, bad, side='right')) - 1
+        raise ValueError('Invalid amino acid detected: %s (sequence %i, position %i)'
+                         % (joined[bad], row + 1, bad - starts[row] + 1))
+
+    # row and column of each residue in the padded output
+    rows = np.repeat(np.arange(len(seqs)), lengths)
+    cols = np.arange(len(joined)) - np.repeat(starts, lengths)
+    encoded[rows, cols, idx] = 1
+
+    return encoded, lengths
 
 
 def rev_one_hot(seq_vectors):
@@ -57,14 +173,12 @@ def rev_one_hot(seq_vectors):
             Strings of amino acid sequences
     """
 
-    REV_ONE_HOT = 'ACDEFGHIKLMNPQRSTVWY'
-    sequences = []
+    residues = np.frombuffer(REV_ONE_HOT.encode('ascii'), dtype=np.uint8)
 
+    sequences = []
     for seq_vector in seq_vectors:
-        seq = []
-        for residue in seq_vector:
-            seq.append(REV_ONE_HOT[np.argmax(residue)])
-        sequences.append("".join(seq))
+        idx = np.argmax(np.asarray(seq_vector), axis=-1)
+        sequences.append(residues[idx].tobytes().decode('ascii'))
 
     return sequences
 
@@ -103,6 +217,10 @@ BIOPHYSICS = {  'A': [1.8,  0,  6.0,  89.1, 0, 0,  75.8,  76.1,    1.9],
                 'Y': [-1.3,  0,  5.7, 181.2, 1, 1, 222.5,  71.9,   -6.1]
                 }
 
+# Row i holds the biophysical properties of residue index i (ONE_HOT order)
+BIOPHYSICS_MATRIX = np.array([BIOPHYSICS[residue] for residue in REV_ONE_HOT], dtype=np.float32)
+
+
 def biophysics(seq):
     """Convert an amino acid sequence to a PyTorch tensor with biophysical encoding
     Each amino acid is represented by a length 9 vector with each value representing
@@ -110,7 +228,7 @@ def biophysics(seq):
     hydrophobicity, charge, isoelectric point, molecular weight, aromaticity, 
     h-bonding ability, side chain solvent accessible surface area, backbone SASA, and 
     free energy of solvation. Inputing a sequence with a nono-canonical amino acid 
-    letter will cause the program to exit.
+    letter will raise a ValueError reporting the residue and its position.
     E.g. Glutamic acid (E) is: [-3.5, -1,  3.2, 147.1, 0, 1, 161.8,  68.1, -107.3]
     Parameters
     ----------
@@ -121,19 +239,15 @@ def biophysics(seq):
     torch.FloatTensor
             a PyTorch tensor representing the encoded sequence
     """
-    l = len(seq)
-    m = np.zeros((l, len(BIOPHYSICS['A'])))
-    try:
-        for i in range(l):
-            m[i] = BIOPHYSICS[seq[i]]
-    except:
-        error_str = 'Invalid amino acid detected: ' + seq[i]
-        raise ValueError(error_str)
-    return torch.from_numpy(m)
+
+    import torch
+    return torch.from_numpy(BIOPHYSICS_MATRIX[sequence_to_index(seq)])
 
 
 def rev_biophysics(seq_vectors):
     """Decode a list of biophysically-encoded sequence vectors into amino acid sequences
+    Residues are identified by their side chain SASA (column 6), which is
+    unique to each amino acid.
     Parameters
     ----------
     seq_vectors : list of numpy arrays
@@ -144,16 +258,26 @@ def rev_biophysics(seq_vectors):
             Strings of amino acid sequences
     """
 
-    REV_BIOPHYSICS = {}
-    for key, value in BIOPHYSICS.items():
-        REV_BIOPHYSICS[str(value[6])] = key
+    residues = np.frombuffer(REV_ONE_HOT.encode('ascii'), dtype=np.uint8)
+
+    # side chain SASA of each residue, sorted so it can be binary searched
+    sasa = BIOPHYSICS_MATRIX[:, 6]
+    order = np.argsort(sasa)
+    sorted_sasa = sasa[order]
 
     sequences = []
     for seq_vector in seq_vectors:
-        seq = []
-        for residue in seq_vector:
-            seq.append(REV_BIOPHYSICS[str(residue[6])])
-        sequences.append("".join(seq))
+        values = np.asarray(seq_vector, dtype=np.float32)[:, 6]
+
+        # nearest tabulated value on either side of each residue
+        pos = np.clip(np.searchsorted(sorted_sasa, values), 1, len(sorted_sasa) - 1)
+        pos = pos - ((values - sorted_sasa[pos - 1]) < (sorted_sasa[pos] - values))
+
+        bad = np.flatnonzero(~np.isclose(sorted_sasa[pos], values))
+        if bad.size > 0:
+            raise ValueError('Invalid biophysics vector detected at position %i' % (bad[0] + 1))
+
+        sequences.append(residues[order[pos]].tobytes().decode('ascii'))
 
     return sequences
 
@@ -203,6 +327,11 @@ class UserEncoder():
 
         self.encode_dict, self.input_size = parse_encode_file(self.encode_file)
 
+        # lookup tables used to encode and decode sequences without looping
+        self.residues = np.array(list(self.encode_dict.keys()), dtype=object)
+        self.encode_matrix = np.array([self.encode_dict[r] for r in self.residues], dtype=np.float32)
+        self.encode_index = build_index_table({r: i for i, r in enumerate(self.residues)})
+
     def __len__(self):
         """Get length of encoding scheme"""
 
@@ -220,16 +349,8 @@ class UserEncoder():
                 a PyTorch tensor representing the encoded sequence
         """
 
-        l = len(seq)
-        m = np.zeros((l, self.input_size))
-
-        try:
-            for i in range(l):
-                m[i] = self.encode_dict[seq[i]]
-        except:
-            error_str = 'Invalid amino acid detected: ' + seq[i]
-            raise ValueError(error_str)
-        return torch.from_numpy(m)
+        import torch
+        return torch.from_numpy(self.encode_matrix[sequence_to_index(seq, self.encode_index)])
 
     def decode(self, seq_vectors):
         """Converts a list of sequence vectors back to a list of protein sequences
@@ -243,17 +364,18 @@ class UserEncoder():
                 Strings of amino acid sequences
         """
 
-        # Create a reverse of the encode_dict using hashing
-        rev_dict = {}
-        for key, value in self.encode_dict.items():
-            value = np.array(value, dtype=np.float32)
-            rev_dict[hash(tuple(value))] = key
-
         sequences = []
         for seq_vector in seq_vectors:
-            seq = []
-            for residue in seq_vector:
-                seq.append(rev_dict[hash(tuple(residue))])
-            sequences.append("".join(seq))
+            seq_vector = np.asarray(seq_vector, dtype=np.float32)
+
+            # compare each residue against every encoding vector at once
+            matches = np.all(seq_vector[:, None, :] == self.encode_matrix[None, :, :], axis=-1)
+            found = matches.any(axis=1)
+
+            bad = np.flatnonzero(~found)
+            if bad.size > 0:
+                raise ValueError('Invalid encoding vector detected at position %i' % (bad[0] + 1))
+
+            sequences.append("".join(self.residues[np.argmax(matches, axis=1)]))
 
-        return sequences
\ No newline at end of file
+        return sequences
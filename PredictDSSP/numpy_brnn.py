@@ -0,0 +1,267 @@
+"""
+NumPy implementation of the many-to-many bidirectional LSTM network used in
+PARROT, for running the trained networks without PyTorch.
+.............................................................................
+The weights of a trained BRNN_MtM network are exported once from the PyTorch
+.pt file to a plain NumPy .npz file (see export_weights). NumpyBRNN_MtM then
+reproduces BRNN_MtM.forward using only NumPy, running the timestep loop over
+a whole batch of sequences (and both directions) at once.
+
+Outputs match the PyTorch network to within floating point rounding. The
+largest difference in class probabilities is below NUMPY_TOLERANCE.
+"""
+
+import os
+
+import numpy as np
+
+from PredictDSSP import dssp_tools
+
+# largest absolute difference in class probabilities between the NumPy and
+# PyTorch implementations, as checked by the test suite
+NUMPY_TOLERANCE = 1e-5
+
+
+def load_state_dict(saved_weights):
+    """Load a saved PARROT network and strip the 'module.' prefix from its keys
+    Parameters
+    ----------
+    saved_weights : str
+            Location of the saved PyTorch network weights
+    Returns
+    -------
+    collections.OrderedDict
+            The network state dict
+    """
+
+    # imported here so NumPy-only inference never needs torch
+    import torch
+
+    loaded_model = torch.load(saved_weights, map_location=torch.device('cpu'), weights_only=True)
+    for i in range(len(loaded_model)):
+        key, value = loaded_model.popitem(last=False)
+        new_key = key[7:]
+        loaded_model[new_key] = value
+
+    return loaded_model
+
+
+def export_weights(saved_weights, output_file, checksum=''):
+    """Export the weights of a saved PyTorch network to a NumPy .npz file
+    Parameters
+    ----------
+    saved_weights : str
+            Location of the saved PyTorch network weights
+    output_file : str
+            Location of the .npz file to write
+    checksum : str
+            Checksum of saved_weights, stored alongside the weights so that a
+            stale export can be detected
+    Returns
+    -------
+    dict
+            The exported arrays, keyed by state dict name
+    """
+
+    weights = {key: value.numpy() for key, value in load_state_dict(saved_weights).items()}
+    np.savez(output_file, source_checksum=np.array(checksum), **weights)
+    return weights
+
+
+def load_network(saved_weights):
+    """Build a NumpyBRNN_MtM for a saved network
+    If saved_weights is a .pt file, the weights are read from the .npz file
+    with the same name. If that file does not exist, or was exported from a
+    different version of the .pt file, it is (re-)exported first, which
+    requires torch. If the directory is not writable the exported weights
+    are only kept in memory.
+    Parameters
+    ----------
+    saved_weights : str
+            Location of the saved network, either a PyTorch .pt file or an
+            .npz file written by export_weights
+    Returns
+    -------
+    NumpyBRNN_MtM
+            The network
+    """
+
+    saved_weights = str(saved_weights)
+    if saved_weights.endswith('.npz'):
+        return NumpyBRNN_MtM.load(saved_weights)
+
+    weights_file = os.path.splitext(saved_weights)[0] + '.npz'
+    checksum = dssp_tools.file_checksum(saved_weights)
+
+    if os.path.isfile(weights_file):
+        with np.load(weights_file) as data:
+            if 'source_checksum' in data.files and str(data['source_checksum']) == checksum:
+                return NumpyBRNN_MtM({key: data[key] for key in data.files if key != 'source_checksum'})
+
+    try:
+        weights = export_weights(saved_weights, weights_file, checksum)
+    except OSError:
+        weights = {key: value.numpy() for key, value in load_state_dict(saved_weights).items()}
+
+    return NumpyBRNN_MtM(weights)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def softmax(x):
+    """Softmax over the last axis"""
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+def reverse_index(lengths, max_len):
+    """Index array that reverses each padded sequence within its true length
+    Positions beyond a sequence's length map to themselves, so padding stays
+    at the end of the reversed sequence.
+    """
+
+    t = np.arange(max_len)[None, :]
+    lengths = np.asarray(lengths)[:, None]
+    return np.where(t < lengths, lengths - 1 - t, t)
+
+
+class NumpyBRNN_MtM():
+    """A NumPy many-to-many bidirectional recurrent neural network
+    Performs the same computation as brnn_architecture.BRNN_MtM.forward for a
+    set of exported weights.
+    Attributes
+    ----------
+    hidden_size : int
+        Size of hidden vectors in the network
+    num_layers : int
+        Number of hidden layers (for each direction) in the network
+    num_classes : int
+        Number of classes the network predicts
+    layers : list of tuples
+        For each layer, the transposed input weights [2 X input X 4*hidden],
+        transposed recurrent weights [2 X hidden X 4*hidden] and combined
+        biases [2 X 4*hidden], with the forward direction first and the
+        reverse direction second.
+    fc_weight : np.ndarray
+        Weights of the fully connected output layer
+    fc_bias : np.ndarray
+        Bias of the fully connected output layer
+    """
+
+    def __init__(self, weights):
+        """
+        Parameters
+        ----------
+        weights : dict
+            Network weights keyed by PyTorch state dict name (as written by
+            export_weights)
+        """
+
+        self.num_layers = 0
+        while f'lstm.weight_ih_l{self.num_layers}' in weights:
+            self.num_layers += 1
+
+        self.hidden_size = int(weights['lstm.weight_hh_l0'].shape[1])
+        self.num_classes = int(weights['fc.bias'].shape[0])
+
+        self.layers = []
+        for layer in range(self.num_layers):
+            directions = [f'l{layer}', f'l{layer}_reverse']
+            w_ih = np.stack([weights[f'lstm.weight_ih_{d}'] for d in directions]).astype(np.float32)
+            w_hh = np.stack([weights[f'lstm.weight_hh_{d}'] for d in directions]).astype(np.float32)
+            bias = np.stack([weights[f'lstm.bias_ih_{d}'] + weights[f'lstm.bias_hh_{d}']
+                             for d in directions]).astype(np.float32)
+
+            # stored transposed so the timestep loop is a plain matmul
+            self.layers.append((w_ih.transpose(0, 2, 1).copy(), w_hh.transpose(0, 2, 1).copy(), bias))
+
+        self.fc_weight = np.ascontiguousarray(weights['fc.weight'].T, dtype=np.float32)
+        self.fc_bias = np.asarray(weights['fc.bias'], dtype=np.float32)
+
+    @classmethod
+    def load(cls, weights_file):
+        """Build a network from an .npz file written by export_weights"""
+
+        with np.load(weights_file) as data:
+            weights = {key: data[key] for key in data.files if key != 'source_checksum'}
+        return cls(weights)
+
+    def forward(self, x, lengths=None):
+        """Propogate input sequences through the network to produce outputs
+        Parameters
+        ----------
+        x : np.ndarray
+            float32 input sequences in the format
+            [batch_dim X sequence_length X input_size], zero-padded at the end
+        lengths : np.ndarray or None
+            True length of each sequence. If None, every sequence is assumed
+            to fill the full sequence_length.
+        Returns
+        -------
+        np.ndarray
+            Output in the format [batch_dim X sequence_length X num_classes].
+            Outputs at padded positions should be discarded.
+        """
+
+        return self.forward_from(x, lengths, first_layer=0)
+
+    def forward_from(self, x, lengths=None, first_layer=0):
+        """Propogate inputs through the network starting part way up
+        Parameters
+        ----------
+        x : np.ndarray
+            float32 input to layer first_layer, in the format
+            [batch_dim X sequence_length X layer input size], zero-padded at
+            the end. For first_layer > 0 this is the output of the layer
+            below, with the forward direction first and the reverse second.
+        lengths : np.ndarray or None
+            True length of each sequence. If None, every sequence is assumed
+            to fill the full sequence_length.
+        first_layer : int
+            Index of the first LSTM layer to run. Default = 0.
+        Returns
+        -------
+        np.ndarray
+            Output in the format [batch_dim X sequence_length X num_classes].
+        """
+
+        batch_size, max_len = x.shape[0], x.shape[1]
+        H = self.hidden_size
+
+        if lengths is None:
+            lengths = np.full(batch_size, max_len)
+        rev = reverse_index(lengths, max_len)[:, :, None]
+
+        out = np.asarray(x, dtype=np.float32)
+        for w_ih, w_hh, bias in self.layers[first_layer:]:
+
+            # both directions are run together as a stack of two batches, the
+            # reverse direction reading each sequence back to front
+            inputs = np.stack([out, np.take_along_axis(out, rev, axis=1)])
+
+            # input contribution to the gates for every timestep at once
+            gates_x = np.matmul(inputs, w_ih[:, None]) + bias[:, None, None, :]
+
+            h = np.zeros((2, batch_size, H), dtype=np.float32)
+            c = np.zeros((2, batch_size, H), dtype=np.float32)
+            hidden = np.empty((2, batch_size, max_len, H), dtype=np.float32)
+
+            for t in range(max_len):
+                gates = gates_x[:, :, t] + np.matmul(h, w_hh)
+
+                # PyTorch gate order is input, forget, cell, output
+                i = sigmoid(gates[..., :H])
+                f = sigmoid(gates[..., H:2*H])
+                g = np.tanh(gates[..., 2*H:3*H])
+                o = sigmoid(gates[..., 3*H:])
+
+                c = f * c + i * g
+                h = o * np.tanh(c)
+                hidden[:, :, t] = h
+
+            # put the reverse direction back in sequence order
+            out = np.concatenate([hidden[0], np.take_along_axis(hidden[1], rev, axis=1)], axis=-1)
+
+        return np.matmul(out, self.fc_weight) + self.fc_bias
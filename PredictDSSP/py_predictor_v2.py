@@ -8,15 +8,60 @@ https://github.com/idptools/parrot
 Licensed under the MIT license. 
 '''
 
-from PredictDSSP import brnn_architecture
+from PredictDSSP import dssp_profile
 from PredictDSSP import encode_sequence
+from PredictDSSP import numpy_brnn
 
-import torch
 import numpy as np
-import os
+import threading
 
-def softmax(v):
-    return (np.e ** v) / np.sum(np.e ** v)
+# inference engines a Predictor can run on. 'torch' runs the PyTorch network
+# while 'numpy' runs numpy_brnn.NumpyBRNN_MtM, which does not need torch
+ENGINES = ('torch', 'numpy')
+
+# numerical precisions a torch Predictor can run in. 'bf16' runs the network
+# under bfloat16 autocast and 'int8' uses dynamically quantized LSTM and
+# linear layers. The numpy engine only runs in 'fp32'
+PRECISIONS = ('fp32', 'bf16', 'int8')
+
+# default upper bound on the number of (padded) residues run through the
+# network in one forward pass by Predictor.predict_batch()
+DEFAULT_MAX_TOKENS = 65536
+
+
+def token_batches(lengths, max_tokens=DEFAULT_MAX_TOKENS):
+    """Split sequences into batches that respect a padded-token budget
+    Sequences are sorted longest first so that each batch pads as little as
+    possible. A batch is closed once adding another sequence would push
+    (number of sequences X longest sequence) above max_tokens. A sequence
+    longer than max_tokens is placed in a batch on its own.
+    Parameters
+    ----------
+    lengths : list of int
+            Length of each sequence
+    max_tokens : int
+            Maximum number of padded residues per batch
+    Returns
+    -------
+    list of lists
+            Each sub-list holds the indices (into lengths) of one batch
+    """
+
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+
+    batches = []
+    current = []
+    for idx in order:
+        # first sequence in a batch is the longest, so it sets the padding
+        if current and (len(current) + 1) * max(lengths[current[0]], 1) > max_tokens:
+            batches.append(current)
+            current = []
+        current.append(idx)
+
+    if current:
+        batches.append(current)
+
+    return batches
 
 class Predictor():
     """Class that for integrating a trained PARROT network into a Python workflow
@@ -34,6 +79,14 @@ class Predictor():
     dtype : str
             Data format that the network was trained for. Either "sequence" or 
             "residues".
+    engine : str
+            Inference engine the network runs on. Either "torch" or "numpy".
+    precision : str
+            Numerical precision the network runs in. One of "fp32", "bf16"
+            or "int8".
+    compiled : bool
+            Whether the network runs as a compiled TorchScript module. False
+            if compilation was not requested or was not possible.
     num_layers : int
             Number of hidden layers in the trained network.
     hidden_vector_size : int
@@ -44,11 +97,13 @@ class Predictor():
             task with n_classes.
     task : str
             Designates if network is designed for "classification" or "regression".
-    network : PyTorch object
+    network : PyTorch object or numpy_brnn.NumpyBRNN_MtM
             Initialized PARROT network with loaded weights.
+    forward_passes : int
+            Number of forward passes run through the network so far.
     """
 
-    def __init__(self, saved_weights, dtype):
+    def __init__(self, saved_weights, dtype, engine='torch', precision='fp32', compiled=False):
         """
         Parameters
         ----------
@@ -59,15 +114,68 @@ class Predictor():
         dtype : str
                 Data format that the network was trained for. Either "sequence" or 
                 "residues".
+        engine : str
+                Inference engine to use. Either "torch" (default) or "numpy". The
+                numpy engine only supports "residues" networks and reads the
+                weights from the .npz file next to saved_weights (exporting it
+                from the .pt file if it does not exist yet), so torch is not
+                imported unless that export is needed.
+        precision : str
+                Numerical precision, one of "fp32" (default), "bf16" or "int8".
+                The int8 network is quantized once, here. Reduced precisions
+                need the torch engine.
+        compiled : bool
+                Run the torch network as a TorchScript module, compiled once
+                and cached next to saved_weights (see compiled_brnn). Falls
+                back to the eager network if it cannot be compiled, and is
+                ignored for reduced precisions and "sequence" networks.
         """
 
         self.dtype = dtype
-  
-        loaded_model = torch.load(saved_weights, map_location=torch.device('cpu'), weights_only=True)
-        for i in range(len(loaded_model)):
-            key, value = loaded_model.popitem(last=False)
-            new_key = key[7:]
-            loaded_model[new_key] = value
+        self.engine = engine
+        self.precision = precision
+
+        if self.engine not in ENGINES:
+            raise ValueError("engine must equal 'torch' or 'numpy'")
+
+        if self.precision not in PRECISIONS:
+            raise ValueError("precision must equal 'fp32', 'bf16' or 'int8'")
+
+        if self.engine == "numpy" and self.precision != "fp32":
+            raise ValueError("the numpy engine only supports precision='fp32'")
+
+        if self.dtype not in ("sequence", "residues"):
+            raise ValueError("dtype must equal 'residues' or 'sequence'")
+
+        # per-thread scratch space for batch encoding
+        self._local = threading.local()
+
+        self.forward_passes = 0
+        self.compiled = False
+
+        if self.engine == "numpy":
+            if self.dtype != "residues":
+                raise ValueError("the numpy engine only supports dtype='residues'")
+
+            self.network = numpy_brnn.load_network(saved_weights)
+            self.num_layers = self.network.num_layers
+            self.hidden_vector_size = self.network.hidden_size
+            self.n_classes = self.network.num_classes
+        else:
+            self._init_torch(saved_weights, compiled)
+
+        if self.n_classes > 1:
+            self.task = "classification"
+        else:
+            self.task = "regression"
+
+    def _init_torch(self, saved_weights, compiled=False):
+        """Load saved weights into a PyTorch network"""
+
+        # imported here so the numpy engine never needs torch
+        from PredictDSSP import brnn_architecture
+
+        loaded_model = numpy_brnn.load_state_dict(saved_weights)
       
         # Dynamically read in correct network size:
         self.num_layers = 0
@@ -83,23 +191,88 @@ class Predictor():
         self.hidden_vector_size = int(np.shape(loaded_model['lstm.weight_ih_l0'])[0] / 4)
         self.n_classes = np.shape(loaded_model['fc.bias'])[0]
 
-        if self.n_classes > 1:
-            self.task = "classification"
-        else:
-            self.task = "regression"
-
         # Instantiate network weights into Predictor() object
         if self.dtype == "sequence":
             self.network = brnn_architecture.BRNN_MtO(20, self.hidden_vector_size, 
                                             self.num_layers, self.n_classes, 'cpu')
-        elif self.dtype == "residues":
+        else:
             self.network = brnn_architecture.BRNN_MtM(20, self.hidden_vector_size, 
                                             self.num_layers, self.n_classes, 'cpu')
-        else:
-            raise ValueError("dtype must equal 'residues' or 'sequence'")
                                         
         self.network.load_state_dict(loaded_model)
 
+        # the network is only ever used for inference, so switch off dropout
+        # and autograd bookkeeping once rather than on every prediction
+        self.network.eval()
+        for param in self.network.parameters():
+            param.requires_grad_(False)
+
+        if self.precision == "int8":
+            import torch
+            import warnings
+
+            # int8 weights with activations quantized on the fly. torch warns
+            # that eager mode quantization is deprecated, which is not news here
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                self.network = torch.ao.quantization.quantize_dynamic(
+                    self.network, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+
+        if compiled and self.precision == "fp32" and self.dtype == "residues":
+            from PredictDSSP import compiled_brnn
+
+            module = compiled_brnn.load_compiled(saved_weights, self.network)
+            if module is not None:
+                self.network = module
+                self.compiled = True
+
+    def _forward(self, seq_vectors, lengths=None):
+        """Run a batch of one-hot encoded sequences through the network
+        Parameters
+        ----------
+        seq_vectors : np.ndarray
+            float32 array in the format [batch_dim X sequence_length X 20]
+        lengths : np.ndarray or None
+            True length of each sequence if the batch is zero-padded
+        Returns
+        -------
+        np.ndarray
+            Network output, converted to class probabilities with a softmax
+            over the last axis for classification networks
+        """
+
+        self.forward_passes += 1
+
+        # residues are only counted while a profile is recording them
+        residues = 0
+        if dssp_profile.enabled():
+            residues = seq_vectors.shape[0] * seq_vectors.shape[1] if lengths is None else int(np.sum(lengths))
+
+        if self.engine == "numpy":
+            with dssp_profile.stage("forward", residues):
+                prediction = self.network.forward(seq_vectors, lengths)
+            if self.task == "classification":
+                with dssp_profile.stage("softmax", residues):
+                    prediction = numpy_brnn.softmax(prediction)
+            return prediction
+
+        import torch
+
+        if lengths is not None:
+            lengths = torch.from_numpy(np.asarray(lengths, dtype=np.int64))
+
+        # Forward pass
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16,
+                                                    enabled=self.precision == "bf16"):
+            with dssp_profile.stage("forward", residues):
+                prediction = self.network(torch.from_numpy(seq_vectors), lengths).float()
+
+            # softmax over the class axis to get class probabilities
+            if self.task == "classification":
+                with dssp_profile.stage("softmax", residues):
+                    prediction = torch.softmax(prediction, dim=-1)
+
+        return prediction.numpy()
 
     def predict(self, seq):
         """Use the network to predict values for a single sequence of valid amino acids
@@ -119,19 +292,78 @@ class Predictor():
         seq = seq.upper()
 
         # Convert to one-hot sequence vector
-        seq_vector = encode_sequence.one_hot(seq)
-        seq_vector = seq_vector.view(1, len(seq_vector), -1)  # formatting
+        with dssp_profile.stage("encode", len(seq)):
+            seq_vector = encode_sequence.ONE_HOT_MATRIX[encode_sequence.sequence_to_index(seq)]
+            seq_vector = seq_vector.reshape(1, len(seq_vector), -1)  # formatting
 
-        # Forward pass
-        prediction = self.network(seq_vector.float()).detach().numpy().flatten()
+        prediction = self._forward(seq_vector)
 
-        # softmax to get class probabilities
-        if self.task == "classification":
-            if self.dtype == "residues":
-                prediction = prediction.reshape(-1, self.n_classes)
-                prediction = np.array(list(map(softmax, prediction)))
+        if self.task == "classification" and self.dtype == "residues":
+            return prediction.reshape(-1, self.n_classes)
 
+        return prediction.flatten()
+
+    def predict_batch(self, seqs, max_tokens=DEFAULT_MAX_TOKENS):
+        """Use the network to predict values for many sequences at once
+        Sequences are one-hot encoded into a single zero-padded tensor and
+        packed so that padding never contributes to the LSTM states. Batches
+        are split so that no forward pass exceeds max_tokens padded residues.
+        Parameters
+        ----------
+        seqs : list of str
+            Valid amino acid sequences
+        max_tokens : int
+            Maximum number of padded residues passed through the network in a
+            single forward pass. Default = 65536.
+            
+        Returns
+        -------
+        list of np.ndarray
+            One entry per input sequence (in input order), each identical in
+            form to the output of predict() for that sequence.
+        """
+
+        seqs = [seq.upper() for seq in seqs]
+        lengths = [len(seq) for seq in seqs]
+        results = [None] * len(seqs)
+
+        # empty sequences have no per-residue values and never reach the network
+        nonempty = []
+        for i in range(len(seqs)):
+            if lengths[i] == 0 and self.dtype == "residues":
+                shape = (0, self.n_classes) if self.task == "classification" else (0,)
+                results[i] = np.zeros(shape, dtype=np.float32)
+            else:
+                nonempty.append(i)
+
+        for batch in token_batches([lengths[i] for i in nonempty], max_tokens):
+            batch = [nonempty[b] for b in batch]
+
+            # Convert to a zero-padded batch of one-hot sequence vectors, reusing
+            # this thread's encoding buffer between batches
+            with dssp_profile.stage("encode") as timed:
+                seq_vectors, batch_lengths = encode_sequence.one_hot_batch([seqs[i] for i in batch],
+                                                                           buffer=getattr(self._local, 'buffer', None))
+                if dssp_profile.enabled():
+                    timed.residues = int(np.sum(batch_lengths))
+            if seq_vectors.base is None:
+                # a new, larger array was allocated so keep it for next time
+                self._local.buffer = seq_vectors.reshape(-1)
+
+            # a batch of equal lengths has no padding, so it skips packing,
+            # which is much slower than running the plain batch
+            if min(batch_lengths) == max(batch_lengths):
+                prediction = self._forward(seq_vectors)
             else:
-                prediction = softmax(prediction)
+                prediction = self._forward(seq_vectors, batch_lengths)
+
+            # trim each sequence back to its true length
+            for row, i in enumerate(batch):
+                if self.dtype == "residues":
+                    results[i] = prediction[row, :lengths[i]].copy()
+                    if self.task == "regression":
+                        results[i] = results[i].flatten()
+                else:
+                    results[i] = prediction[row].copy()
 
-        return prediction
\ No newline at end of file
+        return results
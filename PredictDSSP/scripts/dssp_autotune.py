@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# executing script for tuning the dssp predictor to this machine.
+
+# import stuff for making CLI
+import sys
+import json
+import argparse
+
+from PredictDSSP import dssp_tune
+from PredictDSSP.dssp_exceptions import DsspError
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(description='Find the fastest prediction settings (threads, batch size, workers, engine) for this machine and save them for the other dssp commands.')
+
+    parser.add_argument('--objective', default='throughput', choices=dssp_tune.OBJECTIVES, help='Maximise residues per second over many sequences (throughput) or minimise the 99th percentile latency of single predictions (latency). Default = throughput')
+
+    parser.add_argument('--quick', action='store_true', help='Run smaller, noisier trials that take a few seconds.')
+
+    parser.add_argument('--force', action='store_true', help='Tune even if the saved profile is current.')
+
+    parser.add_argument('--check', action='store_true', help='Do not tune; exit with status 1 if there is no current profile.')
+
+    parser.add_argument('-p', '--profile', default=None, help='Location of the tuning profile. Default = %s' % (dssp_tune.profile_path()))
+
+    parser.add_argument('--json', action='store_true', help='Print the profile as JSON.')
+
+    args = parser.parse_args()
+
+    path = args.profile if args.profile is not None else dssp_tune.profile_path()
+
+    profile = dssp_tune.read_profile(path)
+    reasons = ['there is no profile'] if profile is None else dssp_tune.stale_reasons(profile)
+    if profile is not None and profile.get('objective') != args.objective and not args.check:
+        reasons.append('objective changed from %s to %s' % (profile.get('objective'), args.objective))
+
+    if args.check:
+        if reasons:
+            print('Tuning needed: %s' % ('; '.join(reasons)))
+            sys.exit(1)
+        print('Tuning profile %s is current' % (path))
+        return
+
+    if reasons or args.force:
+        try:
+            profile = dssp_tune.autotune(args.objective, quick=args.quick, path=path, log=sys.stderr)
+        except DsspError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+        print('Saved tuning profile to %s' % (path), file=sys.stderr)
+    else:
+        print('Tuning profile %s is current (use --force to tune again)' % (path), file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(profile, indent=2))
+    else:
+        print('best %s: %.4g %s with %s' % (profile['objective'], profile['score'], profile['unit'],
+                                           ' '.join('%s=%s' % item for item in profile['config'].items())))
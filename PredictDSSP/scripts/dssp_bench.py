@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# executing script for benchmarking the dssp predictor.
+
+# import stuff for making CLI
+import sys
+import argparse
+
+from PredictDSSP import dssp_bench
+from PredictDSSP.dssp_exceptions import DsspError
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(description='Benchmark dssp prediction on synthetic proteomes, optionally against a saved baseline.')
+
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file.')
+
+    parser.add_argument('-b', '--baseline', help='Compare the results with the results saved in this JSON file, and exit with status 1 if any metric regressed.')
+
+    parser.add_argument('-t', '--threshold', type=float, default=dssp_bench.DEFAULT_THRESHOLD, help='Fraction by which a metric may be worse than the baseline before it counts as a regression. Default = %g' % (dssp_bench.DEFAULT_THRESHOLD))
+
+    parser.add_argument('--only', nargs='+', choices=dssp_bench.BENCHMARKS, default=list(dssp_bench.BENCHMARKS), help='Benchmarks to run. Default = all of them.')
+
+    parser.add_argument('--quick', action='store_true', help='Run smaller benchmarks, for a quick check.')
+
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic proteomes. Default = 0')
+
+    args = parser.parse_args()
+
+    # read the baseline first so a bad path fails before the benchmarks run
+    baseline = None
+    if args.baseline is not None:
+        try:
+            baseline = dssp_bench.load_results(args.baseline)
+        except DsspError as e:
+            print(e, file=sys.stderr)
+            sys.exit(2)
+
+    results = dssp_bench.run_benchmarks(args.only, quick=args.quick, seed=args.seed, log=sys.stderr)
+
+    if args.output is not None:
+        dssp_bench.save_results(results, args.output)
+
+    if baseline is None:
+        print(dssp_bench.format_results(results))
+        return
+
+    comparison = dssp_bench.compare(results, baseline, threshold=args.threshold)
+    print(dssp_bench.format_results(results, comparison))
+
+    differences = dssp_bench.environment_differences(results, baseline)
+    if differences:
+        print('\nWarning: the baseline was measured in a different environment:\n  ' + '\n  '.join(differences))
+
+    regressions = [row['metric'] for row in comparison if row['regression']]
+    if regressions:
+        print('\n%i metric(s) regressed by more than %g%%: %s' % (len(regressions), 100 * args.threshold,
+                                                                  ', '.join(regressions)))
+        sys.exit(1)
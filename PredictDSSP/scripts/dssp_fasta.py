@@ -4,9 +4,11 @@
 
 # import stuff for making CLI
 import os
+import sys
 import argparse
 
 import PredictDSSP as dssp
+from PredictDSSP import dssp_tune
 
 
 def main():
@@ -14,20 +16,55 @@ def main():
     # Parse command line arguments.
     parser = argparse.ArgumentParser(description='Generate dssp scores for all sequences in a FASTA file.')
 
-    parser.add_argument('data_file', help='Path to fasta file containing sequences to be predicted.')
+    parser.add_argument('data_file', help="Path to fasta file containing sequences to be predicted. May be gzip, bz2 or xz compressed. Use '-' to read from stdin.")
 
-    parser.add_argument('-o', '--output-file', help='Filename for where to save the csv dssp scores. Default = dssp_scores.csv ', default='dssp_scores.csv')
+    parser.add_argument('-o', '--output-file', help='Filename for where to save the dssp scores. Default = dssp_scores.csv (or dssp_scores.dssp with --format store)', default=None)
+
+    parser.add_argument('-f', '--format', default='csv', choices=['csv', 'store'], help='Output format. csv writes the predicted classes as text, store writes a binary directory with classes and probabilities that can be loaded with PredictDSSP.DsspStore. Default = csv')
 
     parser.add_argument('--invalid-sequence-action', help="For parsing FASTA file, defines how to deal with non-standard amino acids. See https://protfasta.readthedocs.io/en/latest/read_fasta.html for details. Default='convert' ", default='convert')
 
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of worker processes to predict with. Default = 1 (no extra processes), or the number found by dssp-autotune.')
+
+    parser.add_argument('--share-states', action='store_true', help='Compute the shared part of sequences with a common prefix or suffix (isoforms, tagged constructs, truncations) only once. Cannot be combined with --workers.')
+
+    parser.add_argument('--retune', action='store_true', help='If the dssp-autotune profile is out of date, quickly tune again before starting. Default = use the default settings until dssp-autotune is run.')
+
     args = parser.parse_args()
 
+    # shared states are computed in this process
+    if args.share_states and args.workers is not None and args.workers > 1:
+        parser.error('--share-states cannot be combined with --workers')
     
-    if not os.path.isfile(args.data_file):
+    if args.data_file != '-' and not os.path.isfile(args.data_file):
         print('Error: Could not find passed fasta file [%s]'%(args.data_file))
+        return
 
 
+    # settings found by dssp-autotune, if it has been run on this machine
+    tuned = dssp_tune.apply_profile(retune=args.retune, log=sys.stderr)
+    workers = args.workers if args.workers is not None else tuned['workers']
+
+    # shared states are computed in this process
+    if args.share_states:
+        workers = args.workers
+
+    output_file = args.output_file
+    if output_file is None:
+        output_file = 'dssp_scores.dssp' if args.format == 'store' else 'dssp_scores.csv'
+
     # run predict disorder fasta
-    dssp.predict_dssp_fasta(filepath=args.data_file, 
-                                output_file = args.output_file,
-                                invalid_sequence_action=args.invalid_sequence_action)
+    _, steps = dssp.predict_dssp_fasta(filepath=args.data_file, 
+                                output_file = output_file,
+                                output_format = args.format,
+                                invalid_sequence_action=args.invalid_sequence_action,
+                                engine=tuned['engine'],
+                                workers=workers,
+                                share_states=args.share_states,
+                                batch_size=tuned['batch_size'],
+                                report=True)
+
+    if args.share_states:
+        print('Shared states saved %.1f%% of first-layer steps (%d of %d)'
+              % (100 * steps['first_layer_saved'], steps['shared_steps'], steps['first_layer_steps']),
+              file=sys.stderr)
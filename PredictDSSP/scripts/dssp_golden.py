@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# executing script for checking the fast inference paths against the golden reference.
+
+# import stuff for making CLI
+import sys
+import json
+import argparse
+
+from PredictDSSP import dssp_golden
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(
+        description='Check every fast inference path of PredictDSSP against the shipped golden reference.')
+
+    parser.add_argument('-p', '--paths', nargs='+', choices=dssp_golden.PATHS, default=list(dssp_golden.PATHS),
+                        help='Inference paths to check. Default = all of them.')
+
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    parser.add_argument('--write-reference', action='store_true',
+                        help='Predict the reference again with Predictor.predict() and overwrite the shipped file. '
+                             'Only needed when the network changes.')
+
+    args = parser.parse_args()
+
+    if args.write_reference:
+        dssp_golden.write_reference()
+        print('Wrote %s' % (dssp_golden.REFERENCE_FILE))
+        return
+
+    results = dssp_golden.check_all(args.paths)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(dssp_golden.format_results(results))
+
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+# executing script for reporting the memory footprint of the dssp predictor.
+
+# import stuff for making CLI
+import sys
+import json
+import argparse
+
+from PredictDSSP import dssp_memory
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(
+        description='Report the memory footprint of PredictDSSP and check it against budgets.')
+
+    lengths = ' '.join(str(length) for length in dssp_memory.DEFAULT_LENGTHS)
+    parser.add_argument('-l', '--lengths', nargs='+', type=int, default=list(dssp_memory.DEFAULT_LENGTHS),
+                        help='Sequence lengths of the memory-vs-length curve. Default = %s.' % (lengths))
+
+    parser.add_argument('-f', '--fasta-sequences', type=int, default=dssp_memory.DEFAULT_FASTA_SEQUENCES,
+                        help='Number of sequences in the synthetic FASTA file, 0 to skip it. Default = %i.'
+                             % (dssp_memory.DEFAULT_FASTA_SEQUENCES))
+
+    parser.add_argument('--max-bytes-per-residue', type=float,
+                        help='Fail if peak RSS grows by more than this many bytes per predicted residue.')
+
+    parser.add_argument('--max-worker-mb', type=float,
+                        help='Fail if the peak RSS of any scenario exceeds this many MB.')
+
+    parser.add_argument('--plot', help='Save the memory-vs-length curve to this image file.')
+
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    args = parser.parse_args()
+
+    max_worker_bytes = args.max_worker_mb * 1e6 if args.max_worker_mb is not None else None
+    report = dssp_memory.memory_report(args.lengths, fasta_sequences=args.fasta_sequences,
+                                       max_bytes_per_residue=args.max_bytes_per_residue,
+                                       max_worker_bytes=max_worker_bytes)
+
+    if args.plot is not None:
+        dssp_memory.plot_curve(report, args.plot)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(dssp_memory.format_report(report))
+
+    if report['exceeded']:
+        sys.exit(1)
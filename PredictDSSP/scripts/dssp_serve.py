@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# executing script for running the dssp predictor as a local HTTP service.
+
+# import stuff for making CLI
+import sys
+import argparse
+
+from PredictDSSP import dssp_serve
+from PredictDSSP import dssp_tune
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(description='Serve dssp predictions over HTTP, batching concurrent requests together.')
+
+    parser.add_argument('--host', default=dssp_serve.DEFAULT_HOST, help='Address to listen on. Default = %s (this machine only).' % (dssp_serve.DEFAULT_HOST))
+
+    parser.add_argument('-p', '--port', type=int, default=dssp_serve.DEFAULT_PORT, help='Port to listen on. Default = %i' % (dssp_serve.DEFAULT_PORT))
+
+    parser.add_argument('-b', '--max-batch-size', type=int, default=dssp_serve.DEFAULT_MAX_BATCH_SIZE, help='Maximum number of sequences predicted together. Default = %i' % (dssp_serve.DEFAULT_MAX_BATCH_SIZE))
+
+    parser.add_argument('-m', '--max-wait-ms', type=float, default=dssp_serve.DEFAULT_MAX_WAIT_MS, help='Longest time in milliseconds a request waits for others to join its batch. Default = %g' % (dssp_serve.DEFAULT_MAX_WAIT_MS))
+
+    parser.add_argument('-q', '--max-queue', type=int, default=dssp_serve.DEFAULT_MAX_QUEUE, help='Maximum number of requests waiting to be predicted. Further requests are rejected with 503 until the queue drains. Default = %i' % (dssp_serve.DEFAULT_MAX_QUEUE))
+
+    parser.add_argument('--engine', default=None, choices=['torch', 'numpy'], help='Inference engine. Default = torch, or the engine found by dssp-autotune.')
+
+    parser.add_argument('--compiled', action='store_true', help='Run the torch network as a compiled TorchScript module. Default = off, unless dssp-autotune found it faster.')
+
+    parser.add_argument('--retune', action='store_true', help='If the dssp-autotune profile is out of date, quickly tune again before starting. Default = use the default settings until dssp-autotune is run.')
+
+    args = parser.parse_args()
+
+    # settings found by dssp-autotune, if it has been run on this machine
+    tuned = dssp_tune.apply_profile(retune=args.retune, log=sys.stderr)
+    engine = args.engine if args.engine is not None else tuned['engine']
+    compiled = args.compiled or (tuned['compiled'] and engine == 'torch')
+
+    server = dssp_serve.DsspServer(host=args.host, port=args.port, max_batch_size=args.max_batch_size,
+                                   max_wait_ms=args.max_wait_ms, max_queue=args.max_queue,
+                                   engine=engine, compiled=compiled)
+
+    print('Serving dssp predictions on http://%s:%i (Ctrl-C to stop)' % (args.host, args.port))
+    server.run()
@@ -0,0 +1,174 @@
+"""
+Import-time report for PredictDSSP.
+
+Runs a statement (by default ``import PredictDSSP``) in a fresh Python
+process with ``-X importtime`` and breaks the time spent importing down by
+top-level package, so regressions in start-up cost are easy to spot.
+
+Usage:
+
+    $ python -m PredictDSSP.startup
+    $ python -m PredictDSSP.startup --predict
+    $ python -m PredictDSSP.startup --statement "import PredictDSSP; PredictDSSP.graph_dssp" --json
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+# statement timed by --predict: the import plus a first prediction, which
+# pulls in the inference engine
+PREDICT_STATEMENT = "import PredictDSSP; PredictDSSP.predict_dssp('MKVLAAGIVG', engine='%s')"
+
+
+def parse_importtime(stderr):
+    """
+    Function that parses the output of ``python -X importtime``.
+
+    Parameters
+    -----------
+    stderr : str
+        The standard error of the process that was run with -X importtime.
+
+    Returns
+    --------
+    list of tuples
+        One (module name, self time in microseconds, cumulative time in
+        microseconds) tuple per imported module, in import order.
+
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+
+        # skip the header line
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            continue
+
+        modules.append((fields[2].strip(), self_us, cumulative_us))
+
+    return modules
+
+
+def import_report(statement='import PredictDSSP', python=None):
+    """
+    Function that times a statement in a fresh interpreter and reports the
+    import cost of each top-level package.
+
+    Parameters
+    -----------
+    statement : str
+        Python statement to run. Default = 'import PredictDSSP'.
+
+    python : str
+        Python executable to use. Default = the current interpreter.
+
+    Returns
+    --------
+    dict
+        Dictionary with the statement, the wall time of the whole process
+        in seconds ('wall_s'), the total import time in seconds ('import_s'),
+        and 'packages', a list of {'package', 'seconds', 'modules'} entries
+        sorted from most to least expensive.
+
+    """
+    if python is None:
+        python = sys.executable
+
+    start = time.perf_counter()
+    result = subprocess.run([python, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    if result.returncode != 0:
+        raise RuntimeError('Statement failed:\n%s' % (result.stderr[-2000:]))
+
+    # self time summed per top-level package gives an exclusive cost per package
+    packages = {}
+    for name, self_us, _ in parse_importtime(result.stderr):
+        package = name.split('.')[0]
+        seconds, count = packages.get(package, (0.0, 0))
+        packages[package] = (seconds + self_us / 1e6, count + 1)
+
+    breakdown = [{'package': package, 'seconds': seconds, 'modules': count}
+                 for package, (seconds, count) in packages.items()]
+    breakdown.sort(key=lambda entry: entry['seconds'], reverse=True)
+
+    return {'statement': statement,
+            'wall_s': wall,
+            'import_s': sum(entry['seconds'] for entry in breakdown),
+            'packages': breakdown}
+
+
+def format_report(report, top=15):
+    """
+    Function that formats the output of import_report() as a text table.
+
+    Parameters
+    -----------
+    report : dict
+        Output of import_report().
+
+    top : int
+        Number of packages to list. Default = 15.
+
+    Returns
+    --------
+    str
+        The formatted report.
+
+    """
+    lines = ['Statement: %s' % (report['statement']),
+             'Process wall time: %.3f s   total import time: %.3f s' % (report['wall_s'], report['import_s']),
+             '',
+             '%-28s %10s %8s %8s' % ('package', 'seconds', 'share', 'modules')]
+
+    for entry in report['packages'][:top]:
+        share = entry['seconds'] / report['import_s'] if report['import_s'] > 0 else 0
+        lines.append('%-28s %10.3f %7.1f%% %8i' % (entry['package'], entry['seconds'], 100 * share, entry['modules']))
+
+    return '\n'.join(lines)
+
+
+def main():
+
+    # Parse command line arguments.
+    parser = argparse.ArgumentParser(description='Report where the start-up (import) time of PredictDSSP goes.')
+
+    parser.add_argument('-s', '--statement', default='import PredictDSSP',
+                        help='Statement to time in a fresh interpreter. Default = "import PredictDSSP".')
+
+    parser.add_argument('-p', '--predict', action='store_true',
+                        help='Time the import plus a first prediction instead of the import alone.')
+
+    parser.add_argument('-e', '--engine', default='torch', choices=['torch', 'numpy'],
+                        help='Inference engine used with --predict. Default = torch.')
+
+    parser.add_argument('-n', '--top', default=15, type=int, help='Number of packages to show. Default = 15.')
+
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    args = parser.parse_args()
+
+    statement = PREDICT_STATEMENT % (args.engine) if args.predict else args.statement
+    report = import_report(statement)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report, top=args.top))
+
+
+if __name__ == '__main__':
+    main()
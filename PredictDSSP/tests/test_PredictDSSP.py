@@ -13,3 +13,729 @@ import PredictDSSP
 def test_PredictDSSP_imported():
     """Sample test, will always pass so long as import statement worked."""
     assert "PredictDSSP" in sys.modules
+
+
+def test_predictor_is_loaded_once():
+    """The network should be loaded once and shared until released."""
+    from PredictDSSP import dssp_predict
+
+    first = dssp_predict.get_predictor()
+    assert dssp_predict.get_predictor() is first
+
+    assert PredictDSSP.release() >= 1
+    assert dssp_predict.get_predictor() is not first
+
+
+def test_predict_dssp_batch_matches_single():
+    """Batched predictions should give the same calls as one-at-a-time predictions."""
+    import numpy as np
+
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPL', 'A', '', 'GSGSGSWWWYYYLLLKKEEEDD' * 7]
+
+    batch_classes = PredictDSSP.predict_dssp_batch(sequences, max_tokens=64)
+    batch_probs = PredictDSSP.predict_dssp_batch(sequences, raw_vals=True)
+
+    for seq, classes, probs in zip(sequences, batch_classes, batch_probs):
+        assert len(classes) == len(seq)
+        if seq:
+            assert classes == PredictDSSP.predict_dssp(seq)
+            assert np.allclose(probs, PredictDSSP.predict_dssp(seq, raw_vals=True), atol=1e-5)
+
+
+def test_encoding_round_trip_and_errors():
+    """Vectorized encoders should round trip and report bad residues by position."""
+    from PredictDSSP import encode_sequence
+
+    seq = 'ACDEFGHIKLMNPQRSTVWY'
+    assert encode_sequence.rev_one_hot([encode_sequence.one_hot(seq)]) == [seq]
+    assert encode_sequence.rev_biophysics([encode_sequence.biophysics(seq)]) == [seq]
+
+    encoded, lengths = encode_sequence.one_hot_batch([seq, 'W'])
+    assert encoded.shape == (2, 20, 20)
+    assert list(lengths) == [20, 1]
+    assert encoded[1, 1:].sum() == 0
+
+    with pytest.raises(ValueError, match='position 3'):
+        encode_sequence.one_hot('ACXD')
+
+
+def test_numpy_engine_matches_torch():
+    """The NumPy engine should reproduce the PyTorch network within its documented tolerance."""
+    import numpy as np
+    from PredictDSSP import numpy_brnn
+
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPL', 'A', 'ACDEFGHIKLMNPQRSTVWY' * 20]
+
+    torch_vals = PredictDSSP.predict_dssp_batch(sequences, raw_vals=True)
+    numpy_vals = PredictDSSP.predict_dssp_batch(sequences, raw_vals=True, engine='numpy')
+
+    for t, n in zip(torch_vals, numpy_vals):
+        assert np.abs(t - n).max() < numpy_brnn.NUMPY_TOLERANCE
+        assert (t.argmax(axis=1) == n.argmax(axis=1)).all()
+
+
+def test_import_is_lazy():
+    """Importing PredictDSSP should not pull in torch or the plotting / disorder stack."""
+    import subprocess
+
+    heavy = ['torch', 'matplotlib', 'metapredict', 'alphaPredict', 'protfasta', 'getSequence']
+    code = 'import sys, PredictDSSP; print(",".join(m for m in %r if m in sys.modules))' % (heavy,)
+    loaded = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == ''
+
+
+def test_predictor_pool_keeps_input_order():
+    """Results from a PredictorPool should come back in input order."""
+    sequences = ['MKVLAAGIVG' * (i % 7 + 1) for i in range(25)]
+
+    with PredictDSSP.PredictorPool(workers=2, chunk_size=3) as pool:
+        assert pool.predict(sequences) == PredictDSSP.predict_dssp_batch(sequences)
+
+
+def test_streaming_fasta(tmp_path):
+    """Compressed FASTA files should stream through in file order, matching batch predictions."""
+    import gzip
+
+    records = [('seq%i, a protein' % i, 'MKVLAAGIVG' * (i % 5 + 1)) for i in range(12)]
+    fasta = tmp_path / 'seqs.fasta.gz'
+    with gzip.open(fasta, 'wt') as fh:
+        for header, seq in records:
+            fh.write('>%s\n%s\n%s\n' % (header, seq[:15], seq[15:]))
+
+    streamed = list(PredictDSSP.iter_predict_fasta(str(fasta), batch_size=5))
+    assert [header for header, _ in streamed] == [header for header, _ in records]
+    assert [dssp for _, dssp in streamed] == PredictDSSP.predict_dssp_batch([seq for _, seq in records])
+
+    output = tmp_path / 'scores.csv'
+    PredictDSSP.predict_dssp_fasta(str(fasta), output_file=str(output))
+    rows = output.read_text().splitlines()
+    assert len(rows) == len(records)
+    assert rows[0].startswith('seq0  a protein, ')
+
+
+def test_dssp_store_round_trip(tmp_path):
+    """A binary store should read back the same classes and probabilities that were written."""
+    import numpy as np
+
+    records = [('seq%i' % i, 'MKVLAAGIVG' * (i % 4 + 1)) for i in range(9)]
+    # characters that str.splitlines() would break a header on
+    records[3] = ('seq3 a\x0cb\x1ec\x85d\u2028e', records[3][1])
+    fasta = tmp_path / 'seqs.fasta'
+    fasta.write_text(''.join('>%s\n%s\n' % record for record in records))
+
+    store_dir = tmp_path / 'scores.dssp'
+    PredictDSSP.predict_dssp_fasta(str(fasta), output_file=str(store_dir), output_format='store')
+
+    store = PredictDSSP.DsspStore(str(store_dir))
+    assert store.headers == [header for header, _ in records]
+    assert list(store.lengths()) == [len(seq) for _, seq in records]
+
+    probabilities = PredictDSSP.predict_dssp_batch([seq for _, seq in records], raw_vals=True)
+    for i, (header, seq) in enumerate(records):
+        assert store.classes(header).tolist() == PredictDSSP.predict_dssp(seq)
+        assert np.allclose(store.probabilities(i), probabilities[i], atol=1e-3)
+
+    # a run that fails part way leaves a store that cannot be opened
+    from PredictDSSP.dssp_store import DsspStoreWriter
+    from PredictDSSP.dssp_exceptions import DsspError
+
+    with pytest.raises(KeyboardInterrupt):
+        with DsspStoreWriter(str(store_dir)) as writer:
+            writer.write('seq0', probabilities[0])
+            raise KeyboardInterrupt()
+    with pytest.raises(DsspError):
+        PredictDSSP.DsspStore(str(store_dir))
+
+
+def test_prediction_cache(tmp_path):
+    """Cached predictions should match fresh ones, and the size limit should be enforced."""
+    import numpy as np
+    from PredictDSSP import dssp_cache, dssp_predict
+
+    sequences = ['MKVLAAGIVG' * (i + 1) for i in range(6)]
+    expected = PredictDSSP.predict_dssp_batch(sequences, raw_vals=True)
+
+    # switch off the in-memory memo so every lookup reaches the disk cache
+    dssp_predict.set_cache_size(0)
+    cache = dssp_cache.enable_prediction_cache(str(tmp_path / 'cache.sqlite'))
+    try:
+        PredictDSSP.predict_dssp_batch(sequences, raw_vals=True)
+        cached = PredictDSSP.predict_dssp_batch(sequences, raw_vals=True)
+        assert PredictDSSP.predict_dssp(sequences[0]) == expected[0].argmax(axis=1).tolist()
+
+        stats = dssp_cache.prediction_cache_stats()
+        assert (stats['entries'], stats['hits'], stats['misses']) == (6, 7, 6)
+        for a, b in zip(cached, expected):
+            assert np.allclose(a, b, atol=1e-5)
+
+        # shrinking the limit evicts the least recently used entries on the next write
+        cache.max_bytes = stats['bytes'] // 2
+        PredictDSSP.predict_dssp('ACDEFGHIKLMNPQRSTVWY')
+        assert cache.stats()['bytes'] <= cache.max_bytes
+        assert cache.get_many([sequences[0]], PredictDSSP.dssp_predict.network_checksum(
+            PredictDSSP.dssp_predict.network_path()))[0] is not None
+
+        # the running byte total follows inserts, replacements and evictions
+        def summed():
+            return cache._connect().execute('SELECT COALESCE(SUM(size), 0) FROM predictions').fetchone()[0]
+        checksum = dssp_predict.network_checksum(dssp_predict.network_path())
+        cache.put_many(sequences[:2], expected[:2], checksum)
+        cache.put_many(sequences[:2], [np.zeros((len(seq), 3)) for seq in sequences[:2]], checksum)
+        assert cache.stats()['bytes'] == summed()
+        cache.clear()
+        assert cache.stats()['bytes'] == summed() == 0
+    finally:
+        dssp_cache.disable_prediction_cache()
+        dssp_predict.set_cache_size(dssp_predict.DEFAULT_MEMO_RESIDUES)
+
+
+def test_graph_after_predict_reuses_prediction(tmp_path):
+    """Graphing a sequence that was just predicted should not run the network again."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from PredictDSSP import dssp_predict
+
+    sequence = 'MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPL'
+    dssp_predict.cache_clear()
+    predictor = dssp_predict.get_predictor()
+
+    PredictDSSP.predict_dssp(sequence)
+    passes = predictor.forward_passes
+
+    PredictDSSP.predict_dssp(sequence, raw_vals=True)
+    PredictDSSP.graph_dssp(sequence, output_file=str(tmp_path / 'classes.png'))
+    PredictDSSP.graph_dssp(sequence, raw_vals=True, output_file=str(tmp_path / 'values.png'))
+
+    assert predictor.forward_passes == passes
+    info = dssp_predict.cache_info()
+    assert (info.misses, info.entries, info.residues) == (1, 1, len(sequence))
+
+
+def test_graph_segments_from_precomputed_predictions(tmp_path, monkeypatch):
+    """Class tracks should be drawn as one rectangle per stretch, from precomputed predictions without the network."""
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PredictDSSP import dssp_graph
+
+    assert dssp_graph.class_segments([1, 1, 0, 1]).tolist() == [[0, 2], [3, 1]]
+    assert dssp_graph.class_segments([0, 0]).shape == (0, 2)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError('the network should not run')
+    monkeypatch.setattr(dssp_graph, 'predict_dssp', no_network)
+
+    sequence = 'A' * 12
+    classes = np.array([0, 0, 0, 1, 1, 2, 2, 2, 0, 0, 1, 2])
+    disordered = np.zeros(len(sequence), dtype=bool)
+    disordered[:2] = True
+
+    # keep the figure open to count what was drawn
+    close = plt.close
+    monkeypatch.setattr(plt, 'close', lambda *args: None)
+    dssp_graph.graph(sequence, dssp_scores=classes, disordered=disordered, exclude_disorder=True,
+                     rasterize=True, output_file=str(tmp_path / 'classes.pdf'))
+    collections = plt.gcf().axes[0].collections
+    close('all')
+
+    # helix 2:3 and 8:10, strand 3:5 and 10:11, coil 5:8 and 11:12, disordered 0:2
+    assert [len(c.get_paths()) for c in collections] == [2, 2, 2, 1]
+    assert (tmp_path / 'classes.pdf').stat().st_size > 0
+
+    with pytest.raises(ValueError):
+        dssp_graph.graph(sequence, dssp_scores=classes[:5], output_file=str(tmp_path / 'bad.png'))
+
+
+def test_graph_values_decimation(tmp_path, monkeypatch):
+    """Long probability tracks should be cut down to per-pixel-column minima and maxima, keeping every peak."""
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PredictDSSP import dssp_graph
+
+    values = np.full(100000, 0.5)
+    values[[7, 4242, 99998]] = 1.0
+    values[50001] = 0.0
+
+    keep = dssp_graph.minmax_indices(values, 500)
+    assert len(keep) <= 2 * 500 + 2 and np.all(np.diff(keep) > 0)
+    assert keep[0] == 0 and keep[-1] == len(values) - 1
+    assert {7, 4242, 99998, 50001} <= set(keep.tolist())
+    assert dssp_graph.minmax_indices(values[:100], 500).tolist() == list(range(100))
+
+    probabilities = np.column_stack([values, 1 - values, np.zeros(len(values))])
+    close = plt.close
+    monkeypatch.setattr(plt, 'close', lambda *args: None)
+    for decimate in (True, False):
+        dssp_graph.graph_values('A' * len(values), probabilities=probabilities, decimate=decimate,
+                                output_file=str(tmp_path / 'values.png'))
+        lines = plt.gcf().axes[0].get_lines()[:3]
+        close('all')
+
+        points = [len(line.get_xdata()) for line in lines]
+        if decimate:
+            assert max(points) < 2500
+            assert lines[0].get_ydata().max() == 1.0 and lines[1].get_ydata().min() == 0.0
+        else:
+            assert points == [len(values)] * 3
+
+
+def test_predict_dssp_long():
+    """Exact chunked inference should match a full-sequence prediction, and windowed inference should report its deviation."""
+    import numpy as np
+
+    sequence = 'MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPLACDEFGHIKLMNPQRSTVWY' * 12
+    full = PredictDSSP.predict_dssp(sequence, raw_vals=True)
+
+    exact = PredictDSSP.predict_dssp_long(sequence, raw_vals=True, chunk_size=50)
+    assert np.abs(exact - full).max() < 1e-5
+
+    labels, report = PredictDSSP.predict_dssp_long(sequence, mode='window', window=100, margin=40, report=True)
+    assert len(labels) == len(sequence)
+    assert report['windows'] == 7
+    assert report['label_mismatches'] == sum(a != b for a, b in zip(labels, full.argmax(axis=1)))
+
+
+def test_scan_mutations_matches_full_predictions():
+    """Each variant in a mutational scan should match predicting the mutated sequence directly."""
+    import numpy as np
+
+    sequence = 'MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPL'
+    alphabet = 'APWG'
+    scan = PredictDSSP.scan_mutations(sequence, positions=[0, 17, 36], alphabet=alphabet, max_tokens=200)
+    assert scan.probabilities.shape == (3, 4, 3)
+
+    wild_type = PredictDSSP.predict_dssp(sequence)
+    for i, position in enumerate(scan.positions):
+        for j, residue in enumerate(alphabet):
+            mutant = sequence[:position] + residue + sequence[position + 1:]
+            full = PredictDSSP.predict_dssp(mutant, raw_vals=True)
+            assert np.abs(full[position] - scan.probabilities[i, j]).max() < 1e-5
+            assert scan.classes_changed[i, j] == sum(a != b for a, b in zip(full.argmax(axis=1), wild_type))
+
+
+def test_share_states_matches_batch(tmp_path):
+    """Sharing states between isoforms should give the same predictions and report the shared work."""
+    import numpy as np
+    from PredictDSSP import dssp_predict
+
+    core = 'MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPLACDEFGHIKLMNPQRSTVWY'
+    family = [core, 'MHHHHHH' + core, core[:40], core[10:], core + 'GSLEHHHHHH', core, 'ACDK']
+
+    report = PredictDSSP.sharing_report(family)
+    assert report['sequences'] == 6
+    # the N-terminal prefixes of the truncation and the tagged construct, and the
+    # C-terminal suffixes of the His-tagged and truncated isoforms
+    assert report['shared_steps'] >= 40 + len(core) + len(core) + (len(core) - 10)
+    assert 0 < report['total_saved'] < report['first_layer_saved'] < 1
+
+    plain = PredictDSSP.predict_dssp_batch(family, raw_vals=True, engine='numpy')
+    # the memo would otherwise answer the shared calls from the plain one
+    dssp_predict.cache_clear()
+    shared = PredictDSSP.predict_dssp_batch(family, raw_vals=True, share_states=True, max_tokens=100)
+    for a, b in zip(plain, shared):
+        assert a.shape == b.shape
+        assert np.abs(a - b).max() < 1e-5
+
+    # the step counts come back from the run itself, and match the report when
+    # every sequence is predicted in one group
+    dssp_predict.cache_clear()
+    _, steps = PredictDSSP.predict_dssp_batch(family, share_states=True, report=True)
+    assert steps['first_layer_steps'] == report['first_layer_steps']
+    assert steps['first_layer_saved'] == pytest.approx(report['first_layer_saved'])
+
+    fasta = tmp_path / 'family.fasta'
+    fasta.write_text(''.join('>seq%d\n%s\n' % (i, seq) for i, seq in enumerate(family)))
+    dssp_predict.cache_clear()
+    _, steps = PredictDSSP.predict_dssp_fasta(str(fasta), share_states=True, batch_size=4, report=True)
+    assert 0 < steps['first_layer_saved'] < report['first_layer_saved']
+
+
+def test_fasta_cli_rejects_shared_states_with_workers(tmp_path, monkeypatch, capsys):
+    """dssp-fasta should give a usage error, not a traceback, for --share-states with several workers."""
+    from PredictDSSP.scripts import dssp_fasta
+
+    fasta = tmp_path / 'seqs.fasta'
+    fasta.write_text('>seq0\nMKVLAAGIVG\n')
+    monkeypatch.setattr(sys, 'argv', ['dssp-fasta', str(fasta), '--share-states', '--workers', '2'])
+
+    with pytest.raises(SystemExit) as exit:
+        dssp_fasta.main()
+    assert exit.value.code == 2
+    assert '--share-states cannot be combined with --workers' in capsys.readouterr().err
+
+
+def test_reduced_precision():
+    """Reduced precision predictions should be close to fp32 and never mixed up with them in the memo."""
+    import numpy as np
+
+    sequence = 'MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPLACDEFGHIKLMNPQRSTVWY'
+    full = PredictDSSP.predict_dssp(sequence, raw_vals=True)
+
+    for precision in ('bf16', 'int8'):
+        values = PredictDSSP.predict_dssp(sequence, raw_vals=True, precision=precision)
+        assert values.shape == full.shape
+        assert 0 < np.abs(values - full).max() < 0.5
+
+        report = PredictDSSP.precision_report(precision, sequences=[sequence])['sequences']
+        assert report['residues'] == len(sequence)
+        assert abs(report['max_abs_error'] - np.abs(values - full).max()) < 1e-6
+
+
+def test_compiled_network(tmp_path, monkeypatch):
+    """The compiled network should be cached on disk, match the eager network, and fall back to it if compiling fails."""
+    import os
+    import shutil
+    import numpy as np
+    from PredictDSSP import compiled_brnn, dssp_predict
+
+    network = str(tmp_path / 'network.pt')
+    shutil.copy(dssp_predict.network_path(), network)
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEKTSSSPEVLKGLREPL', 'ACDEFGHIKLMNPQRSTVWY' * 7, 'MK']
+
+    eager = dssp_predict.get_predictor(network)
+    compiled = dssp_predict.get_predictor(network, compiled=True)
+    assert compiled.compiled and os.path.isfile(compiled_brnn.compiled_file(network))
+
+    assert np.abs(compiled.predict(sequences[0]) - eager.predict(sequences[0])).max() < 1e-6
+    for a, b in zip(compiled.predict_batch(sequences), eager.predict_batch(sequences)):
+        assert np.abs(a - b).max() < 1e-6
+
+    # a later process loads the saved module rather than compiling again
+    def fail(network):
+        raise RuntimeError('no TorchScript here')
+
+    monkeypatch.setattr(compiled_brnn, 'compile_network', fail)
+    dssp_predict.release(network)
+    assert dssp_predict.get_predictor(network, compiled=True).compiled
+
+    os.remove(compiled_brnn.compiled_file(network))
+    dssp_predict.release(network)
+    fallback = dssp_predict.get_predictor(network, compiled=True)
+    assert not fallback.compiled
+    assert np.abs(fallback.predict(sequences[0]) - eager.predict(sequences[0])).max() < 1e-6
+
+
+def test_prediction_service():
+    """The HTTP service should batch concurrent requests, answer as predict_dssp does, and reject requests when its queue is full."""
+    import json
+    import time
+    import asyncio
+    import struct
+    import threading
+    import urllib.error
+    import urllib.request
+    import concurrent.futures
+    import numpy as np
+    from PredictDSSP import dssp_serve
+
+    server = dssp_serve.DsspServer(port=0, max_batch_size=8, max_wait_ms=20)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+
+    url = 'http://127.0.0.1:%i' % (server.port)
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEK'[i:] + 'ACDEFGHIKLMNPQRSTVWY'[:i] for i in range(16)]
+
+    def post(body, path='/predict', headers={}):
+        request = urllib.request.Request(url + path, data=json.dumps(body).encode(), headers=headers)
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(16) as pool:
+            replies = list(pool.map(lambda seq: json.loads(post({'sequence': seq})), sequences))
+        for seq, reply in zip(sequences, replies):
+            assert reply['predictions'][0]['classes'] == PredictDSSP.predict_dssp(seq)
+
+        metrics = json.loads(urllib.request.urlopen(url + '/metrics?format=json').read())
+        assert metrics['requests'] == metrics['sequences'] == 16
+        assert metrics['batches'] < 16
+        assert metrics['latency_ms']['count'] == 16
+        assert 'dssp_request_latency_ms_bucket{le="+Inf"} 16' in urllib.request.urlopen(url + '/metrics').read().decode()
+
+        data = post({'sequences': sequences[:2], 'raw_vals': True}, path='/predict?format=binary')
+        assert data[:4] == b'DSSP' and struct.unpack('<I', data[4:8])[0] == 2
+        length = struct.unpack('<I', data[8:12])[0]
+        probabilities = np.frombuffer(data[12 + length:12 + length * 13], dtype='<f4').reshape(length, 3)
+        assert np.abs(probabilities - PredictDSSP.predict_dssp(sequences[0], raw_vals=True)).max() < 1e-5
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post({'sequence': 'MKV1'})
+        assert error.value.code == 400
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post({'sequences': ['MKV', '']})
+        assert error.value.code == 400
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    # backpressure: with a slow network and room for two waiting requests, the rest are turned away
+    async def flood():
+        batcher = dssp_serve.MicroBatcher(lambda seqs: time.sleep(0.2) or [np.zeros((len(s), 3)) for s in seqs],
+                                          max_batch_size=1, max_wait_ms=0, max_queue=2)
+        await batcher.start()
+        results = await asyncio.gather(*[batcher.submit(['MKV']) for _ in range(6)], return_exceptions=True)
+        await batcher.close()
+        return results
+
+    results = asyncio.run(flood())
+    rejected = sum(isinstance(result, dssp_serve.QueueFull) for result in results)
+    assert 0 < rejected < 6
+
+    # a request that fails its batch fails on its own; the others in the batch still succeed
+    def predict(seqs):
+        if 'BAD' in seqs:
+            raise ValueError('bad sequence')
+        return [np.zeros((len(s), 3)) for s in seqs]
+
+    async def mixed():
+        batcher = dssp_serve.MicroBatcher(predict, max_batch_size=8, max_wait_ms=50)
+        await batcher.start()
+        results = await asyncio.gather(*[batcher.submit([seq]) for seq in ('MKV', 'BAD', 'MKVLA')],
+                                       return_exceptions=True)
+        await batcher.close()
+        return results, batcher.metrics.batches
+
+    results, batches = asyncio.run(mixed())
+    assert isinstance(results[1], ValueError)
+    assert [len(results[0][0]), len(results[2][0])] == [3, 5]
+    assert batches == 2
+
+
+def test_batching_predictor_from_many_threads(monkeypatch):
+    """Sequences submitted from many threads should be batched together and match predict_dssp."""
+    import concurrent.futures
+    from PredictDSSP.dssp_exceptions import DsspError
+
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEK'[:10 + i % 12] + 'ACDEFGHIKLMNPQRSTVWY'[:i % 7] for i in range(48)]
+
+    with PredictDSSP.BatchingPredictor(max_wait_ms=20) as predictor:
+        with concurrent.futures.ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(lambda seq: predictor.submit(seq).result(), sequences))
+        assert predictor.batches < len(sequences)
+        assert predictor.sequences == len(sequences)
+
+        assert predictor.predict(sequences[:3], as_array=True)[2].tolist() == results[2]
+
+        with pytest.raises(DsspError):
+            predictor.submit('MKV1')
+
+        # an empty sequence is refused and does not fail the batch around it
+        first = predictor.submit('MKVLAAG')
+        with pytest.raises(DsspError):
+            predictor.submit('')
+        last = predictor.submit('MKVLAAGIVG')
+        assert first.result() == PredictDSSP.predict_dssp('MKVLAAG')
+        assert last.result() == PredictDSSP.predict_dssp('MKVLAAGIVG')
+
+    assert results == [PredictDSSP.predict_dssp(seq) for seq in sequences]
+
+    with pytest.raises(DsspError):
+        predictor.submit('MKV')
+
+    # similar lengths share a bucket, within the padding and token limits
+    from PredictDSSP import dssp_batching
+    assert dssp_batching.length_buckets([100, 30, 110, 32, 500, 124, 126]) == [[1, 3], [0, 2, 5], [6], [4]]
+    assert dssp_batching.length_buckets([100] * 5, max_tokens=250) == [[0, 1], [2, 3], [4]]
+
+    # on the numpy engine buckets of different lengths run as one pass
+    calls = []
+    original = dssp_batching.dssp_predict._predict_values
+
+    def counting(predictor, seqs, **kwargs):
+        calls.append(len(seqs))
+        return original(predictor, seqs, **kwargs)
+    monkeypatch.setattr(dssp_batching.dssp_predict, '_predict_values', counting)
+
+    with PredictDSSP.BatchingPredictor(engine='numpy') as predictor:
+        values = predictor._predict(sequences[:6])
+    assert calls == [6]
+    assert [value.argmax(axis=1).tolist() for value in values] == results[:6]
+
+
+def test_profile_records_pipeline_stages(tmp_path, monkeypatch):
+    """A profile should record each stage of a FASTA run, and nothing once it has ended."""
+    import sys
+    import json
+    from PredictDSSP import dssp_profile
+
+    sequences = ['MKVLAAGIVGLLLAQPAMAEEK', 'ACDEFGHIKLMNPQRSTVWY', 'MQWESSASSSWQQQQGGGGSAFACACAAFAAAAAA']
+    fasta = tmp_path / 'input.fasta'
+    fasta.write_text(''.join('>seq%i\n%s\n' % (i, seq) for i, seq in enumerate(sequences)))
+
+    PredictDSSP.cache_clear()
+    with PredictDSSP.profile(memory=True) as run:
+        PredictDSSP.predict_dssp_fasta(str(fasta), output_file=str(tmp_path / 'scores.csv'))
+
+    residues = sum(len(seq) for seq in sequences)
+    for name in ('read_fasta', 'encode', 'forward', 'softmax', 'classes', 'write_csv'):
+        assert run.stages[name].residues == residues
+        assert run.stages[name].peak_bytes is not None
+    assert run.stages['write_csv'].calls == len(sequences)
+
+    exported = json.loads(run.to_json(str(tmp_path / 'profile.json')))
+    assert exported == json.loads((tmp_path / 'profile.json').read_text())
+    assert set(exported['stages']) == set(run.stages)
+    assert 'forward' in run.text()
+
+    # disabled: stages are a shared no-op and the finished profile is left alone
+    assert not dssp_profile.enabled()
+    assert dssp_profile.stage('forward') is dssp_profile.stage('encode')
+    PredictDSSP.predict_dssp('MKVLAAGIVG')
+    assert run.stages['encode'].calls == exported['stages']['encode']['calls']
+
+    with PredictDSSP.profile():
+        with pytest.raises(RuntimeError):
+            with PredictDSSP.profile():
+                pass
+
+    # without the resource module (Windows) there is no peak RSS
+    assert 100e6 < run.max_rss_bytes < 100e9
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    with PredictDSSP.profile() as run:
+        PredictDSSP.predict_dssp('MKVLAAGIVG')
+    assert run.max_rss_bytes is None and 'peak RSS - MB' in run.text()
+
+
+def test_benchmarks_against_baseline(tmp_path):
+    """Benchmarks should be reproducible, leave the caches as they were and flag regressions."""
+    from PredictDSSP import dssp_bench, dssp_predict
+
+    proteome = dssp_bench.synthetic_proteome(50, seed=3)
+    assert proteome == dssp_bench.synthetic_proteome(50, seed=3)
+    assert proteome != dssp_bench.synthetic_proteome(50, seed=4)
+    assert all(dssp_bench.MIN_LENGTH <= len(seq) <= dssp_bench.MAX_LENGTH for seq in proteome)
+    assert {len(seq) for seq in dssp_bench.synthetic_proteome(5, length=40)} == {40}
+
+    memo_size = dssp_predict.cache_info().max_residues
+    results = dssp_bench.run_benchmarks(['one_hot', 'latency'], quick=True)
+    assert dssp_predict.cache_info().max_residues == memo_size
+    assert 'latency.300.p99_ms' in results['metrics']
+
+    dssp_bench.save_results(results, str(tmp_path / 'baseline.json'))
+    baseline = dssp_bench.load_results(str(tmp_path / 'baseline.json'))
+    assert not any(row['regression'] for row in dssp_bench.compare(results, baseline))
+
+    # twice as slow and half the throughput of the baseline
+    for metric in baseline['metrics'].values():
+        metric['value'] *= 0.5 if metric['better'] == 'lower' else 2
+    rows = dssp_bench.compare(results, baseline, threshold=0.25)
+    assert len(rows) == len(results['metrics']) and all(row['regression'] for row in rows)
+    assert 'REGRESSION' in dssp_bench.format_results(results, rows)
+
+
+def test_memory_report_budgets(monkeypatch):
+    """Memory is measured in a fresh process, and budgets fail on the fitted per-residue cost and the worker peak."""
+    from PredictDSSP import dssp_memory
+
+    measured = dssp_memory.measure('predict', 300)
+    assert measured['peak_rss_bytes'] > measured['rss_growth_bytes'] >= 0
+    assert measured['tracemalloc_peak_bytes'] > 0
+
+    # a worker of 500 MB whose peak grows by 1000 bytes per residue
+    def fake_measure(scenario, argument=None, python=None):
+        if scenario == 'predict':
+            return {'peak_rss_bytes': 500e6 + 1000 * argument, 'rss_growth_bytes': 1000 * argument,
+                    'tracemalloc_peak_bytes': 10 * argument}
+        return {'peak_rss_bytes': 500e6}
+    monkeypatch.setattr(dssp_memory, 'measure', fake_measure)
+
+    report = dssp_memory.memory_report(lengths=(100, 1000, 10000), fasta_sequences=0,
+                                       max_bytes_per_residue=2000, max_worker_bytes=600e6)
+    assert report['bytes_per_residue']['rss'] == pytest.approx(1000)
+    assert report['worker_peak_bytes'] == 510e6
+    assert report['exceeded'] == []
+
+    report = dssp_memory.memory_report(lengths=(100, 1000, 10000), fasta_sequences=0,
+                                       max_bytes_per_residue=500, max_worker_bytes=505e6)
+    assert report['exceeded'] == ['bytes_per_residue', 'worker_peak_bytes']
+    assert 'BUDGET EXCEEDED' in dssp_memory.format_report(report)
+
+
+def test_autotune_profile(tmp_path, monkeypatch):
+    """autotune should keep the best setting, and a profile should only apply until the machine or version changes."""
+    import warnings
+    from PredictDSSP import dssp_tune
+
+    path = str(tmp_path / 'tuning.json')
+    monkeypatch.setenv(dssp_tune.TUNING_ENV_VAR, path)
+    assert dssp_tune.load_profile() == dssp_tune.DEFAULTS
+
+    # pretend that batches of 64 on the numpy engine are fastest
+    def fake_throughput(config, sequences):
+        return 100 + 50 * (config['engine'] == 'numpy') + 20 * (config['batch_size'] == 64)
+    monkeypatch.setattr(dssp_tune, '_throughput', fake_throughput)
+
+    profile = dssp_tune.autotune(quick=True)
+    assert profile['config']['engine'] == 'numpy' and profile['config']['batch_size'] == 64
+    assert profile['score'] == 170
+    assert len(profile['trials']) >= 1 + len(dssp_tune.BATCH_SIZES)
+
+    assert dssp_tune.read_profile() == profile
+    assert dssp_tune.stale_reasons(profile) == []
+    assert dssp_tune.load_profile() == profile['config']
+
+    # development builds of the same release share the profile
+    monkeypatch.setattr(PredictDSSP, '__version__', profile['PredictDSSP'] + '.post3+g1a2b3c4.d20260101')
+    assert dssp_tune.stale_reasons(profile) == []
+
+    # the real latency trial, without saving
+    latency = dssp_tune.autotune('latency', quick=True, save=False)
+    assert latency['unit'] == 'ms' and latency['score'] > 0
+    assert dssp_tune.read_profile() == profile
+
+    # a profile from a machine with another CPU count is stale: ignored with a
+    # warning, or re-tuned when asked to
+    stale = dict(profile, cpus=profile['cpus'] + 7)
+    dssp_tune.save_profile(stale)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        assert dssp_tune.load_profile() == dssp_tune.DEFAULTS
+    assert 'stale' in str(caught[0].message)
+
+    assert dssp_tune.load_profile(retune=True) == profile['config']
+    assert dssp_tune.read_profile()['cpus'] == profile['cpus']
+
+    # loading a current profile does not import torch
+    import subprocess
+    code = ('import sys; from PredictDSSP import dssp_tune; '
+            'print(dssp_tune.load_profile() == %r, "torch" in sys.modules)' % (profile['config'],))
+    loaded = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert loaded.stdout.strip() == 'True False'
+
+
+def test_tuned_defaults(tmp_path, monkeypatch):
+    """The batch and FASTA functions should take the settings they are not given from the tuning profile."""
+    from PredictDSSP import dssp, dssp_stream, dssp_tune
+
+    monkeypatch.setenv(dssp_tune.TUNING_ENV_VAR, str(tmp_path / 'tuning.json'))
+    config = dict(dssp_tune.DEFAULTS, engine='numpy', batch_size=64, workers=2)
+    dssp_tune.save_profile(dict(dssp_tune._fingerprint(), version=dssp_tune.TUNING_VERSION, config=config))
+
+    calls = []
+    monkeypatch.setattr(dssp, '_predict_dssp_batch', lambda sequences, **kwargs: calls.append(kwargs) or [])
+    monkeypatch.setattr(dssp_stream, 'iter_predict_fasta', lambda filepath, **kwargs: calls.append(kwargs) or [])
+    fasta = tmp_path / 'seqs.fasta'
+    fasta.write_text('>seq0\nMKVLAAGIVG\n')
+
+    PredictDSSP.predict_dssp_batch(['MKVLAAGIVG'])
+    PredictDSSP.predict_dssp_fasta(str(fasta))
+    PredictDSSP.predict_dssp_fasta(str(fasta), engine='torch', batch_size=8, share_states=True)
+    assert calls[0]['engine'] == 'numpy'
+    assert (calls[1]['engine'], calls[1]['batch_size'], calls[1]['workers']) == ('numpy', 64, 2)
+    # shared states are computed in this process
+    assert (calls[2]['engine'], calls[2]['batch_size'], calls[2]['workers']) == ('torch', 8, None)
+
+
+@pytest.mark.parametrize('path', ['predict', 'batch', 'numpy', 'compiled', 'share_states', 'long_exact', 'bf16', 'int8'])
+def test_golden_reference(path):
+    """Every inference path should match the shipped golden reference within its tolerances."""
+    from PredictDSSP import dssp_golden
+
+    result = dssp_golden.check_path(path)
+    assert result['residues'] > 15000
+    assert result['passed'], dssp_golden.format_results([result])